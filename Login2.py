@@ -1,38 +1,10 @@
-import asyncio
 import jwt
 import streamlit as st
-from httpx_oauth.clients.google import GoogleOAuth2
-from httpx_oauth.oauth2 import OAuth2Token
 
-# 1. Leer secretos
-testing_mode = st.secrets.get("testing_mode", False)
-CLIENT_ID = st.secrets["client_id"]
-CLIENT_SECRET = st.secrets["client_secret"]
-REDIRECT_URL = (
-    st.secrets["redirect_url_test"] if testing_mode else st.secrets["redirect_url"]
-)
-
-# 2. Cliente OAuth
-client = GoogleOAuth2(client_id=CLIENT_ID, client_secret=CLIENT_SECRET)
-
-# 3. Scopes
-SCOPES = [
-    "openid",
-    "email",
-    "https://www.googleapis.com/auth/calendar.events"
-]
+from auth_session import get_auth_manager
 
-def make_auth_url() -> str:
-    return asyncio.run(
-        client.get_authorization_url(
-            redirect_uri=REDIRECT_URL,
-            scope=SCOPES,
-            extras_params={"access_type": "offline"},
-        )
-    )
-
-def fetch_token(code: str) -> OAuth2Token:
-    return asyncio.run(client.get_access_token(code=code, redirect_uri=REDIRECT_URL))
+# Cliente OAuth del proceso (secretos, scopes y URL de autorización en auth_session)
+auth = get_auth_manager()
 
 def decode_user(id_token: str) -> dict:
     return jwt.decode(jwt=id_token, options={"verify_signature": False})
@@ -54,16 +26,35 @@ params = st.experimental_get_query_params()
 if "code" in params:
     code = params["code"][0]
     try:
-        token = fetch_token(code)
+        token = auth.fetch_token(code)
         info = decode_user(token["id_token"])
         email = info.get("email", "")
         if not email.endswith("@neo.com.pe"):
             st.error("❌ Solo cuentas @neo.com.pe.")
             st.stop()
 
+        # Sin refresh_token (ni uno guardado de otro login) la sesión caducaría
+        # en una hora: se pide el consentimiento, solo esta vez
+        if not auth.attach_refresh_token(email, token):
+            st.experimental_set_query_params()
+            st.markdown(
+                f"""
+                <a href="{auth.consent_url(email)}" target="_self">
+                    <button style="padding:8px 16px; font-size:16px;">
+                      🔒 Autorizar acceso a Calendar
+                    </button>
+                </a>
+                """,
+                unsafe_allow_html=True,
+            )
+            st.info("Falta autorizar el acceso a Calendar mientras no estás conectado (solo la primera vez).")
+            st.stop()
+
         # Guardar en sesión
         st.session_state.oauth_token = token
         st.session_state.user_email = email
+        # Renovar el access token en segundo plano durante la jornada
+        auth.start_refresh(token)
 
         # Limpiar params
         st.experimental_set_query_params()
@@ -80,7 +71,7 @@ if "code" in params:
         st.stop()
 
 # 2) Si no hay code: mostramos botón de login
-auth_url = make_auth_url()
+auth_url = auth.authorization_url
 st.markdown(
     f"""
     <a href="{auth_url}" target="_self">
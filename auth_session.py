@@ -0,0 +1,151 @@
+# auth_session.py
+
+import asyncio
+import contextlib
+import functools
+import os
+import threading
+import time
+
+import streamlit as st
+from httpx_oauth.clients.google import GoogleOAuth2
+from httpx_oauth.oauth2 import OAuth2Token
+
+from gcal_async import background_loop, run_sync, shared_client
+
+SCOPES = [
+    "openid",
+    "email",
+    "https://www.googleapis.com/auth/calendar.events"
+]
+
+# Se renueva el access token cuando le quedan menos de estos segundos
+REFRESH_MARGIN = 300
+# Tiempo máximo que se mantiene viva la renovación en segundo plano (una jornada)
+REFRESH_WINDOW = 12 * 3600
+# Endpoint de tokens alternativo (p. ej. el OAuth falso de benchmarks/fake_calendar)
+TOKEN_URL = os.environ.get("NEO_BRAIN_OAUTH_TOKEN_URL")
+
+class _PooledGoogleOAuth2(GoogleOAuth2):
+    """GoogleOAuth2 que reutiliza el AsyncClient compartido en vez de abrir uno por llamada."""
+
+    def get_httpx_client(self):
+        return contextlib.nullcontext(shared_client())
+
+class OAuthSessionManager:
+    """
+    Login con Google sobre un cliente OAuth de larga vida.
+
+    Todas las llamadas corren en el event loop compartido de gcal_async (sin
+    asyncio.run por llamada), la URL de autorización se calcula una vez y los
+    tokens se renuevan en segundo plano antes de caducar. La pantalla de
+    consentimiento (la única forma de que Google dé un refresh_token) solo
+    se pide a quien aún no tiene refresh_token guardado.
+    """
+
+    def __init__(self, client_id: str, client_secret: str, redirect_uri: str,
+                 scopes: list[str] = SCOPES, token_url: str | None = TOKEN_URL):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.scopes = scopes
+        self.client = _PooledGoogleOAuth2(client_id=client_id, client_secret=client_secret)
+        if token_url:
+            self.client.access_token_endpoint = self.client.refresh_token_endpoint = token_url
+        self._refreshers: dict[str, tuple[OAuth2Token, asyncio.Future]] = {}
+        self._refresh_tokens: dict[str, str] = {}  # email -> último refresh_token
+        self._lock = threading.Lock()
+
+    @functools.cached_property
+    def authorization_url(self) -> str:
+        return run_sync(self.client.get_authorization_url(
+            redirect_uri=self.redirect_uri,
+            scope=self.scopes,
+            extras_params={"access_type": "offline"},
+        ))
+
+    def consent_url(self, email: str) -> str:
+        """URL de autorización que vuelve a pedir consentimiento (y da refresh_token)."""
+        return run_sync(self.client.get_authorization_url(
+            redirect_uri=self.redirect_uri,
+            scope=self.scopes,
+            extras_params={"access_type": "offline", "prompt": "consent", "login_hint": email},
+        ))
+
+    def attach_refresh_token(self, email: str, token: OAuth2Token) -> bool:
+        """
+        Guarda el refresh_token del login o, si Google no lo devolvió (solo lo
+        da al consentir), pone en token el que ya se tenía del usuario. False
+        si no hay ninguno: hay que pasar por consent_url.
+        """
+        with self._lock:
+            if token.get("refresh_token"):
+                self._refresh_tokens[email] = token["refresh_token"]
+                return True
+            guardado = self._refresh_tokens.get(email)
+        if guardado is None:
+            return False
+        token["refresh_token"] = guardado
+        return True
+
+    def fetch_token(self, code: str) -> OAuth2Token:
+        return run_sync(self.client.get_access_token(code=code, redirect_uri=self.redirect_uri))
+
+    async def _refresh(self, token: OAuth2Token) -> None:
+        """Pide un access token nuevo y actualiza token en el sitio."""
+        nuevo = await self.client.refresh_token(token["refresh_token"])
+        # Google no devuelve de nuevo el refresh_token
+        nuevo.setdefault("refresh_token", token["refresh_token"])
+        token.update(nuevo)
+
+    def ensure_fresh(self, token: OAuth2Token) -> OAuth2Token:
+        """Renueva ya el token si caduca en menos de REFRESH_MARGIN segundos."""
+        if token.get("refresh_token") and time.time() > token.get("expires_at", float("inf")) - REFRESH_MARGIN:
+            run_sync(self._refresh(token))
+        return token
+
+    async def _keep_fresh(self, token: OAuth2Token) -> None:
+        hasta = time.time() + REFRESH_WINDOW
+        while time.time() < hasta:
+            espera = token.get("expires_at", hasta) - REFRESH_MARGIN - time.time()
+            await asyncio.sleep(max(0, espera))
+            try:
+                await self._refresh(token)
+            except Exception:
+                return  # token revocado o sin red: el siguiente rerun lo detecta
+
+    def start_refresh(self, token: OAuth2Token) -> None:
+        """
+        Mantiene fresco el token (el mismo dict guardado en la sesión) en el
+        loop compartido. Solo hay una tarea por refresh_token.
+        """
+        refresh_token = token.get("refresh_token")
+        if not refresh_token:
+            return
+        with self._lock:
+            anterior = self._refreshers.get(refresh_token)
+            if anterior and anterior[0] is token and not anterior[1].done():
+                return
+            if anterior:
+                anterior[1].cancel()  # nuevo login con el mismo refresh_token
+            futuro = asyncio.run_coroutine_threadsafe(self._keep_fresh(token), background_loop())
+            self._refreshers[refresh_token] = (token, futuro)
+        futuro.add_done_callback(functools.partial(self._forget, refresh_token))
+
+    def _forget(self, refresh_token: str, futuro) -> None:
+        """Al acabar la renovación se suelta el token (si no lo sustituyó otro login)."""
+        with self._lock:
+            if self._refreshers.get(refresh_token, (None, None))[1] is futuro:
+                del self._refreshers[refresh_token]
+
+@functools.lru_cache(maxsize=1)
+def get_auth_manager() -> OAuthSessionManager:
+    """Gestor OAuth del proceso, configurado con los secretos de Streamlit."""
+    testing_mode = st.secrets.get("testing_mode", False)
+    return OAuthSessionManager(
+        client_id=st.secrets["client_id"],
+        client_secret=st.secrets["client_secret"],
+        redirect_uri=(
+            st.secrets["redirect_url_test"] if testing_mode else st.secrets["redirect_url"]
+        ),
+    )
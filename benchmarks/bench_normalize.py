@@ -0,0 +1,54 @@
+# benchmarks/bench_normalize.py
+#
+# Mide normalize_events con eventos sintéticos.
+# Uso: python benchmarks/bench_normalize.py [n_eventos]
+
+import datetime
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from event_normalizer import normalize_events
+
+def synthetic_events(n: int, seed: int = 0) -> list[dict]:
+    rnd = random.Random(seed)
+    base = datetime.datetime(2025, 1, 1, 8, 0)
+    offsets = ["-05:00", "+00:00", "+01:00", "Z"]
+    events = []
+    for i in range(n):
+        start = base + datetime.timedelta(minutes=30 * rnd.randrange(17520))
+        end = start + datetime.timedelta(minutes=30 * rnd.randint(1, 4))
+        if i % 20 == 0:
+            start_f = {"date": start.date().isoformat()}
+            end_f = {"date": (start.date() + datetime.timedelta(days=1)).isoformat()}
+        else:
+            tz = rnd.choice(offsets)
+            start_f = {"dateTime": start.isoformat() + tz}
+            end_f = {"dateTime": end.isoformat() + tz}
+        title = f"Reunión {i % 97}"
+        if i % 3 == 0:
+            title = f"#{17410000 + i % 500} – {title}"
+        events.append({
+            "id": f"ev{i:08d}",
+            "etag": f'"{i}"',
+            "summary": title,
+            "start": start_f,
+            "end": end_f,
+        })
+    return events
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    events = synthetic_events(n)
+    normalize_events(events[:100])  # calentamiento
+
+    t0 = time.perf_counter()
+    df = normalize_events(events)
+    elapsed = time.perf_counter() - t0
+    print(f"normalize_events: {len(df)} eventos en {elapsed * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,508 @@
+# benchmarks/fake_calendar.py
+#
+# Calendario sintético y un servidor HTTP local que imita la parte de la
+# API de Google Calendar que usa la app (events list/get/insert/patch/update,
+# lotes multipart, canales de watch con sus avisos y series recurrentes con
+# singleEvents=true/false) y un endpoint de tokens OAuth, con latencia y
+# errores de cuota configurables, para medir sin cuenta de Google.
+
+import collections
+import copy
+import datetime
+import itertools
+import json
+import random
+import socket
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httplib2
+import jwt
+from googleapiclient.discovery import build_from_document
+
+from gcal_async import CalendarService
+from gcal_client import _discovery_document, event_time
+from rate_limiter import RequestScheduler
+from recurrence import expand_events, instance_id, iter_occurrences
+
+TEMAS = [
+    "Revisión de presupuesto", "Comité de riesgos", "Daily de proyecto",
+    "Reunión con cliente", "Planificación trimestral", "Sesión de diseño",
+    "Seguimiento de auditoría", "Onboarding", "Retrospectiva", "Demo de producto",
+    "Kick-off", "Capacitación interna", "Revisión de código", "Cierre contable",
+]
+CLIENTES = ["Alicorp", "Backus", "Interbank", "Ripley", "Yanbal", "Gloria", "Pacasmayo"]
+ZONAS = ["-05:00", "-03:00", "+00:00", "+01:00", "+02:00", "Z"]
+
+def synthetic_calendar(n: int, seed: int = 0, year: int = 2025) -> list[dict]:
+    """
+    n eventos de un año con la mezcla de una cuenta real: series recurrentes
+    (comparten recurringEventId, título y asistentes), eventos de día
+    completo, títulos con y sin '#código – ', varias zonas horarias,
+    descripciones y asistentes.
+    """
+    rnd = random.Random(seed)
+    base = datetime.datetime(year, 1, 1, 7, 0)
+    personas = [f"persona{i}@neo.com.pe" for i in range(200)]
+    series = []
+    for s in range(max(1, n // 40)):
+        series.append({
+            "id": f"serie{s:05d}",
+            "titulo": f"{rnd.choice(TEMAS)} {rnd.choice(CLIENTES)}",
+            "codigo": f"#{17410000 + rnd.randrange(800)}" if rnd.random() < 0.6 else "",
+            "asistentes": rnd.sample(personas, rnd.randint(1, 6)),
+            "zona": rnd.choice(ZONAS),
+        })
+
+    events = []
+    for i in range(n):
+        inicio = base + datetime.timedelta(minutes=30 * rnd.randrange(365 * 24 * 2))
+        fin = inicio + datetime.timedelta(minutes=30 * rnd.randint(1, 6))
+        ev = {"id": f"ev{i:08d}", "etag": f'"{i}"', "status": "confirmed"}
+        if i % 3 == 0:
+            serie = rnd.choice(series)
+            ev["recurringEventId"] = serie["id"]
+            titulo, codigo = serie["titulo"], serie["codigo"]
+            asistentes, zona = serie["asistentes"], serie["zona"]
+        else:
+            titulo = f"{rnd.choice(TEMAS)} {rnd.choice(CLIENTES)} {i % 97}"
+            codigo = f"#{17410000 + rnd.randrange(800)}" if rnd.random() < 0.4 else ""
+            asistentes = rnd.sample(personas, rnd.randint(0, 4))
+            zona = rnd.choice(ZONAS)
+        ev["summary"] = f"{codigo} – {titulo}" if codigo else titulo
+        if i % 25 == 0:
+            ev["start"] = {"date": inicio.date().isoformat()}
+            ev["end"] = {"date": (inicio.date() + datetime.timedelta(days=1)).isoformat()}
+        else:
+            ev["start"] = {"dateTime": inicio.isoformat() + zona}
+            ev["end"] = {"dateTime": fin.isoformat() + zona}
+        if rnd.random() < 0.3:
+            ev["description"] = f"Agenda: {rnd.choice(TEMAS).lower()}"
+        if asistentes:
+            ev["attendees"] = [{"email": "yo@neo.com.pe", "self": True}] + [
+                {"email": email} for email in asistentes
+            ]
+        events.append(ev)
+    return events
+
+def recurring_calendar(series: int, singles: int, seed: int = 0, year: int = 2025) -> list[dict]:
+    """
+    Maestros de series semanales (con RRULE, algunas con EXDATE o UNTIL),
+    unas pocas excepciones movidas o canceladas y eventos sueltos: lo que
+    devuelve Calendar con singleEvents=false para un año de reuniones.
+    """
+    rnd = random.Random(seed)
+    dias = ["MO", "TU", "WE", "TH", "FR"]
+    events = []
+    for s in range(series):
+        inicio = datetime.datetime(year, 1, 6 + rnd.randrange(5), 8 + rnd.randrange(9), 30 * rnd.randrange(2))
+        fin = inicio + datetime.timedelta(minutes=30 * rnd.randint(1, 4))
+        regla = f"RRULE:FREQ=WEEKLY;BYDAY={dias[inicio.weekday()]}"
+        if s % 4 == 0:
+            regla += f";UNTIL={year}0630T235959Z"
+        master = {
+            "id": f"serie{s:05d}", "etag": f'"m{s}"', "status": "confirmed",
+            "summary": f"{rnd.choice(TEMAS)} {rnd.choice(CLIENTES)}",
+            "start": {"dateTime": inicio.isoformat() + "-05:00", "timeZone": "America/Lima"},
+            "end": {"dateTime": fin.isoformat() + "-05:00", "timeZone": "America/Lima"},
+            "recurrence": [regla],
+            "attendees": [{"email": "yo@neo.com.pe", "self": True}] + [
+                {"email": f"persona{rnd.randrange(200)}@neo.com.pe"} for _ in range(rnd.randint(1, 5))
+            ],
+        }
+        if s % 5 == 0:
+            master["recurrence"].append(f"EXDATE;TZID=America/Lima:{inicio + datetime.timedelta(weeks=2):%Y%m%dT%H%M%S}")
+        events.append(master)
+        if s % 3 == 0:
+            # Una repetición movida una hora y otra cancelada
+            movida = inicio + datetime.timedelta(weeks=3)
+            original = {"dateTime": movida.isoformat() + "-05:00", "timeZone": "America/Lima"}
+            events.append({
+                **{k: v for k, v in master.items() if k not in ("recurrence", "etag")},
+                "id": instance_id(master["id"], datetime.datetime.fromisoformat(original["dateTime"])),
+                "etag": f'"x{s}"', "recurringEventId": master["id"], "originalStartTime": original,
+                "start": {"dateTime": (movida + datetime.timedelta(hours=1)).isoformat() + "-05:00"},
+                "end": {"dateTime": (fin + datetime.timedelta(weeks=3, hours=1)).isoformat() + "-05:00"},
+            })
+            cancelada = inicio + datetime.timedelta(weeks=5)
+            original = {"dateTime": cancelada.isoformat() + "-05:00", "timeZone": "America/Lima"}
+            events.append({
+                "id": instance_id(master["id"], datetime.datetime.fromisoformat(original["dateTime"])),
+                "status": "cancelled", "recurringEventId": master["id"], "originalStartTime": original,
+            })
+    for ev in synthetic_calendar(singles, seed=seed + 1, year=year):
+        ev.pop("recurringEventId", None)
+        events.append(ev)
+    return events
+
+class FakeCalendarBackend:
+    """Estado del calendario falso: eventos por id, versiones para sync tokens y contadores."""
+
+    def __init__(self, events: list[dict], latency: float = 0.0, error_rate: float = 0.0,
+                 seed: int = 0):
+        self._lock = threading.Lock()
+        self._events = {ev["id"]: copy.deepcopy(ev) for ev in events}
+        self._version = itertools.count(1)
+        self._changed: dict[str, int] = {}   # id -> versión del último cambio
+        self._listados: dict[tuple, list] = {}
+        self._rango = (None, None)   # último rango listado (para expandir series)
+        self.sync_version = 0
+        self.channels: dict[str, dict] = {}  # id -> canal de watch abierto
+        self.sender = NotificationSender()
+        self.requests = 0
+        self.batch_items = 0
+        self.bytes_out = 0
+        # Latencia por llamada (segundos) y fracción de llamadas con 403 de cuota
+        self.latency = latency
+        self.error_rate = error_rate
+        self._rnd = random.Random(seed)
+        self.tokens: dict[str, str] = {}   # access/refresh token -> email
+        self.calls_by_user: collections.Counter = collections.Counter()
+        self.quota_errors = 0
+
+    def token(self, form: dict) -> tuple[int, dict]:
+        """Endpoint de tokens OAuth: el code es el usuario ('ana' o 'ana@neo.com.pe')."""
+        if form.get("grant_type") == "refresh_token":
+            email = self.tokens.get(form.get("refresh_token"))
+            if email is None:
+                return 400, {"error": "invalid_grant"}
+        else:
+            code = form.get("code", "")
+            email = code if "@" in code else f"{code}@neo.com.pe"
+        access = f"at-{uuid.uuid4().hex}"
+        refresh = form.get("refresh_token") or f"rt-{uuid.uuid4().hex}"
+        with self._lock:
+            self.tokens[access] = self.tokens[refresh] = email
+        return 200, {
+            "access_token": access,
+            "refresh_token": refresh,
+            "expires_in": 3600,
+            "token_type": "Bearer",
+            "scope": "openid email https://www.googleapis.com/auth/calendar.events",
+            "id_token": jwt.encode({"email": email, "sub": email}, "fake", algorithm="HS256"),
+        }
+
+    def admit(self, authorization: str | None) -> tuple[int, dict] | None:
+        """Cuenta la llamada de su usuario, espera la latencia y a veces responde 403 de cuota."""
+        with self._lock:
+            email = self.tokens.get((authorization or "").removeprefix("Bearer "), "?")
+            self.calls_by_user[email] += 1
+            limitar = self.error_rate and self._rnd.random() < self.error_rate
+            if limitar:
+                self.quota_errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return _error(403, "rateLimitExceeded") if limitar else None
+
+    def _expandidos(self, events) -> list[dict]:
+        """Repeticiones (como con singleEvents=true) de los eventos, en el último rango listado."""
+        lo, hi = self._rango
+        lo = lo or datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+        hi = hi or datetime.datetime(2100, 1, 1, tzinfo=datetime.timezone.utc)
+        return list(expand_events(events, lo, hi))
+
+    def _ordenados(self, time_min: str | None, time_max: str | None, single: bool = True) -> list[dict]:
+        """Eventos del rango ordenados por inicio (se cachea por rango y modo)."""
+        key = (time_min, time_max, single)
+        eventos = self._listados.get(key)
+        if eventos is None:
+            lo = datetime.datetime.fromisoformat(time_min.replace("Z", "+00:00")) if time_min else None
+            hi = datetime.datetime.fromisoformat(time_max.replace("Z", "+00:00")) if time_max else None
+            self._rango = (lo, hi)
+            if single:
+                todos = self._expandidos(self._events.values())
+            else:
+                todos = [ev for ev in self._events.values()
+                         if ev.get("recurrence") or ev.get("recurringEventId")
+                         or ev.get("status") != "cancelled"]
+            dentro = [
+                ev for ev in todos
+                if ev.get("recurrence") or ev.get("status") == "cancelled"
+                or ((lo is None or event_time(ev, "end") >= lo)
+                    and (hi is None or event_time(ev, "start") <= hi))
+            ]
+            dentro.sort(key=lambda ev: event_time(ev) if "start" in ev else event_time(ev, "originalStartTime"))
+            eventos = self._listados[key] = dentro
+        return eventos
+
+    def list(self, query: dict) -> tuple[int, dict]:
+        # 'fields' se ignora: siempre se devuelve el evento completo
+        size = min(int(query.get("maxResults", 250)), 2500)
+        offset = int(query.get("pageToken") or 0)
+        single = str(query.get("singleEvents", "false")).lower() == "true"
+        with self._lock:
+            if query.get("syncToken"):
+                desde = int(query["syncToken"])
+                eventos = [self._events[i] for i, v in self._changed.items() if v > desde]
+                if single:
+                    # Un maestro cambiado llega como todas sus repeticiones
+                    eventos = self._expandidos(eventos)
+            else:
+                eventos = self._ordenados(query.get("timeMin"), query.get("timeMax"), single)
+            pagina = eventos[offset:offset + size]
+            resp = {"accessRole": "owner", "items": pagina}
+            if offset + size < len(eventos):
+                resp["nextPageToken"] = str(offset + size)
+            else:
+                resp["nextSyncToken"] = str(self.sync_version)
+        return 200, resp
+
+    def get(self, event_id: str) -> tuple[int, dict]:
+        ev = self._events.get(event_id)
+        return (200, ev) if ev else _error(404, "notFound")
+
+    def write(self, method: str, event_id: str | None, body: dict,
+              headers: dict) -> tuple[int, dict]:
+        with self._lock:
+            if method == "POST":
+                event_id = f"new{uuid.uuid4().hex[:12]}"
+                ev = self._events[event_id] = {"id": event_id, "status": "confirmed"}
+            else:
+                ev = self._events.get(event_id) or self._excepcion(event_id)
+                if ev is None:
+                    return _error(404, "notFound")
+                if_match = headers.get("if-match")
+                if if_match and if_match != ev["etag"]:
+                    return _error(412, "conditionNotMet")
+                if method == "PUT":
+                    ev.clear()
+                    ev.update(id=event_id, status="confirmed")
+            ev.update(body)
+            version = next(self._version)
+            ev["etag"] = f'"v{version}"'
+            self._changed[event_id] = version
+            self.sync_version = version
+            self._listados.clear()
+            canales = list(self.channels.values())
+        for canal in canales:
+            self.sender.send_async(canal, "exists")
+        return 200, ev
+
+    def _excepcion(self, event_id: str) -> dict | None:
+        """Escribir en una repetición la convierte en excepción de su serie, como en Google."""
+        master = self._events.get(event_id.rsplit("_", 1)[0])
+        if not master or not master.get("recurrence"):
+            return None
+        lo, hi = self._rango
+        for ev in iter_occurrences(master, lo or datetime.datetime(2000, 1, 1), hi or datetime.datetime(2100, 1, 1)):
+            if ev["id"] == event_id:
+                self._events[event_id] = ev
+                return ev
+        return None
+
+    def watch(self, body: dict) -> tuple[int, dict]:
+        """Abre un canal y, como Google, manda enseguida el aviso 'sync'."""
+        ttl = int(body.get("params", {}).get("ttl", 604800))
+        canal = {
+            "kind": "api#channel",
+            "id": body["id"],
+            "resourceId": f"res-{uuid.uuid4().hex[:12]}",
+            "resourceUri": "/calendar/v3/calendars/primary/events",
+            "token": body.get("token"),
+            "address": body["address"],
+            "expiration": str(int((time.time() + ttl) * 1000)),
+        }
+        with self._lock:
+            self.channels[canal["id"]] = canal
+        self.sender.send_async(canal, "sync")
+        return 200, {k: v for k, v in canal.items() if k != "address"}
+
+    def stop(self, body: dict) -> tuple[int, dict]:
+        with self._lock:
+            canal = self.channels.get(body.get("id"))
+            if canal is None or canal["resourceId"] != body.get("resourceId"):
+                return _error(404, "notFound")
+            del self.channels[body["id"]]
+        return 204, {}
+
+    def dispatch(self, method: str, path: str, query: dict, body: bytes,
+                 headers: dict) -> tuple[int, dict]:
+        """Atiende una petición a /calendar/v3/calendars/{cal}/events[/{id}]."""
+        partes = [urllib.parse.unquote(p) for p in path.split("/") if p]
+        datos = json.loads(body) if body else {}
+        if partes == ["calendar", "v3", "channels", "stop"] and method == "POST":
+            return self.stop(datos)
+        if partes[:3] != ["calendar", "v3", "calendars"] or len(partes) < 5 or partes[4] != "events":
+            return _error(404, "notFound")
+        event_id = partes[5] if len(partes) > 5 else None
+        if event_id == "watch" and method == "POST":
+            return self.watch(datos)
+        if method == "GET":
+            return self.get(event_id) if event_id else self.list(query)
+        return self.write(method, event_id, datos, headers)
+
+class NotificationSender:
+    """
+    Manda avisos de canal como los de Google Calendar: un POST vacío con
+    las cabeceras X-Goog-*. Se puede usar sin el servidor falso para
+    probar un receptor a mano:
+
+        NotificationSender().send(canal, "exists")
+    """
+
+    def __init__(self):
+        self._numeros = itertools.count(1)
+        self.sent: list[tuple[str, str, int]] = []  # (canal, estado, código de respuesta)
+
+    def send(self, channel: dict, state: str = "exists") -> int:
+        cabeceras = {
+            "X-Goog-Channel-ID": channel["id"],
+            "X-Goog-Resource-ID": channel["resourceId"],
+            "X-Goog-Resource-URI": channel.get("resourceUri", ""),
+            "X-Goog-Resource-State": state,
+            "X-Goog-Message-Number": str(next(self._numeros)),
+            "X-Goog-Channel-Expiration": time.strftime(
+                "%a, %d %b %Y %H:%M:%S GMT", time.gmtime(int(channel["expiration"]) / 1000)
+            ),
+        }
+        if channel.get("token"):
+            cabeceras["X-Goog-Channel-Token"] = channel["token"]
+        peticion = urllib.request.Request(channel["address"], data=b"", headers=cabeceras, method="POST")
+        try:
+            with urllib.request.urlopen(peticion, timeout=5) as resp:
+                status = resp.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = 0
+        self.sent.append((channel["id"], state, status))
+        return status
+
+    def send_async(self, channel: dict, state: str = "exists") -> None:
+        threading.Thread(target=self.send, args=(channel, state), daemon=True).start()
+
+def _error(status: int, reason: str) -> tuple[int, dict]:
+    return status, {"error": {"code": status, "errors": [{"reason": reason}], "message": reason}}
+
+def _parse_http(texto: str) -> tuple[str, str, dict, dict, bytes]:
+    """Separa una sub-petición de un lote en (method, path, query, cabeceras, cuerpo)."""
+    cabecera, _, cuerpo = texto.partition("\n\n")
+    lineas = cabecera.split("\n")
+    method, url = lineas[0].split()[:2]
+    url = urllib.parse.urlsplit(url)
+    headers = {}
+    for linea in lineas[1:]:
+        k, _, v = linea.partition(":")
+        headers[k.strip().lower()] = v.strip()
+    query = dict(urllib.parse.parse_qsl(url.query))
+    return method, url.path, query, headers, cuerpo.strip().encode()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    backend: FakeCalendarBackend
+
+    def setup(self):
+        super().setup()
+        # Sin Nagle: cabeceras y cuerpo salen en dos envíos y el ACK retrasado
+        # del cliente añadiría ~40 ms a cada respuesta
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, payload: bytes, content_type: str = "application/json"):
+        self.backend.bytes_out += len(payload)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self):
+        self.backend.requests += 1
+        url = urllib.parse.urlsplit(self.path)
+        largo = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(largo) if largo else b""
+        if url.path == "/token":
+            status, data = self.backend.token(dict(urllib.parse.parse_qsl(body.decode())))
+            return self._send(status, json.dumps(data).encode())
+        rechazo = self.backend.admit(self.headers.get("Authorization"))
+        if rechazo is not None:
+            return self._send(rechazo[0], json.dumps(rechazo[1]).encode())
+        if url.path.startswith("/batch/"):
+            return self._batch(body)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        headers = {k.lower(): v for k, v in self.headers.items()}
+        status, data = self.backend.dispatch(self.command, url.path, query, body, headers)
+        self._send(status, json.dumps(data).encode() if status != 204 else b"")
+
+    def _batch(self, body: bytes):
+        boundary = self.headers["Content-Type"].split("boundary=", 1)[1].strip('"')
+        texto = body.decode("utf-8").replace("\r\n", "\n")
+        salida_boundary = f"batch_{uuid.uuid4().hex}"
+        respuestas = []
+        for parte in texto.split(f"--{boundary}"):
+            parte = parte.strip("\n")
+            if not parte or parte == "--":
+                continue
+            cabeceras, _, peticion = parte.partition("\n\n")
+            content_id = next(
+                (l.split(":", 1)[1].strip() for l in cabeceras.split("\n")
+                 if l.lower().startswith("content-id:")),
+                ""
+            )
+            method, path, query, headers, cuerpo = _parse_http(peticion)
+            status, data = self.backend.dispatch(method, path, query, cuerpo, headers)
+            self.backend.batch_items += 1
+            respuestas.append("\r\n".join([
+                f"--{salida_boundary}",
+                "Content-Type: application/http",
+                f"Content-ID: <response-{content_id.strip('<>')}>",
+                "",
+                f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}",
+                "Content-Type: application/json; charset=UTF-8",
+                "",
+                json.dumps(data),
+            ]))
+        payload = ("\r\n".join(respuestas) + f"\r\n--{salida_boundary}--\r\n").encode()
+        self._send(200, payload, f"multipart/mixed; boundary={salida_boundary}")
+
+    do_GET = do_POST = do_PATCH = do_PUT = _handle
+
+class FakeCalendarServer:
+    """
+    Servidor HTTP local con el calendario falso.
+
+        with FakeCalendarServer(synthetic_calendar(10_000)) as server:
+            service = server.googleapiclient_service()
+    """
+
+    def __init__(self, events: list[dict], latency: float = 0.0, error_rate: float = 0.0,
+                 port: int = 0):
+        self.backend = FakeCalendarBackend(events, latency, error_rate)
+        handler = type("Handler", (_Handler,), {"backend": self.backend})
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "FakeCalendarServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _unthrottled(self, service):
+        # Sin límite de ritmo: se mide el cliente, no la cuota de Google
+        service.scheduler = RequestScheduler(rate=1e9, max_in_flight=64)
+        return service
+
+    def googleapiclient_service(self):
+        doc = dict(_discovery_document("calendar", "v3"))
+        doc["rootUrl"] = self.url + "/"
+        doc["baseUrl"] = self.url + "/calendar/v3/"
+        return self._unthrottled(build_from_document(doc, http=httplib2.Http()))
+
+    def httpx_service(self):
+        return self._unthrottled(CalendarService("fake-token", root_url=self.url))
@@ -0,0 +1,270 @@
+# benchmarks/load_test.py
+#
+# Prueba de carga: muchas sesiones a la vez, cada una con su usuario, que
+# entran por Login2.py (OAuth falso) y usan autocalendar2 y Autocalendar
+# con Streamlit AppTest, todo en este proceso como en un servidor de
+# Streamlit. Google se sustituye por el servidor falso de fake_calendar
+# (latencia y errores de cuota configurables). Por nivel de concurrencia
+# da p50/p95/p99 de los reruns, memoria y llamadas a la API por sesión.
+# Uso: python benchmarks/load_test.py [--sessions 1 5 10 20] [--events 2000]
+#        [--reruns 6] [--latency 0.05] [--error-rate 0.02] [--out fichero.json]
+
+import argparse
+import datetime
+import json
+import os
+import resource
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# La app lee estas variables al importarse: antes de importar nada de ella
+PUERTO = _puerto_libre()
+os.environ["NEO_BRAIN_GOOGLE_API_URL"] = f"http://127.0.0.1:{PUERTO}"
+os.environ["NEO_BRAIN_OAUTH_TOKEN_URL"] = f"http://127.0.0.1:{PUERTO}/token"
+os.environ.setdefault("NEO_BRAIN_STORE", tempfile.mkdtemp(prefix="neo-brain-carga-"))
+os.environ.pop("NEO_BRAIN_WEBHOOK_URL", None)
+
+from unittest.mock import MagicMock
+from urllib import parse
+
+import streamlit as st
+from streamlit import config
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.pages_manager import PagesManager
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.runtime.secrets import Secrets
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+from fake_calendar import FakeCalendarServer, synthetic_calendar
+from run_benchmarks import metadata
+
+SECRETS = {
+    "client_id": "carga",
+    "client_secret": "carga",
+    "redirect_url": "http://localhost:8501/",
+    "redirect_url_test": "http://localhost:8501/",
+}
+PAGINAS = ("Login2.py", "pages/autocalendar2.py", "pages/Autocalendar.py")
+CONSULTAS = ["revision", "comite", "alicorp", "daily", ""]
+# Los fragmentos de las páginas recargan cada segundo mientras llegan datos
+INTERVALO_FRAGMENTO = 1.0
+TIMEOUT = 300
+
+def _rss_mb() -> float:
+    """Memoria residente del proceso (MB); sin /proc, el pico."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _percentil(valores: list[float], p: float) -> float:
+    if not valores:
+        return float("nan")
+    if len(valores) == 1:
+        return valores[0]
+    return statistics.quantiles(valores, n=100, method="inclusive")[int(p) - 1]
+
+# Scripts compilados, comunes a todas las sesiones
+_SCRIPTS = ScriptCache()
+
+def _servidor() -> None:
+    """
+    Un solo "servidor" para todas las sesiones: AppTest crea y borra en cada
+    run el Runtime, los secrets y la config globales, lo que no aguanta
+    varios hilos. Aquí se fijan una vez y la caché de st.cache_* es común,
+    como en un servidor real.
+    """
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    secrets = Secrets()
+    secrets._secrets = dict(SECRETS)
+    st.secrets = secrets
+    config.set_option("global.appTest", True)
+    # Compilar antes de abrir los hilos: ast.parse a la vez en varios hilos
+    # falla a veces en CPython 3.11 (SystemError: AST constructor recursion ...)
+    for pagina in PAGINAS:
+        _SCRIPTS.get_bytecode(str(RAIZ / pagina))
+
+class AppTestConcurrente(AppTest):
+    """AppTest._run sin tocar el estado global (ver _servidor)."""
+
+    def _run(self, widget_state=None, timeout=None):
+        runner = LocalScriptRunner(
+            self._script_path, self.session_state,
+            PagesManager(self._script_path, _SCRIPTS, setup_watcher=False),
+            args=self.args, kwargs=self.kwargs,
+        )
+        runner._script_cache = _SCRIPTS
+        self._tree = runner.run(widget_state, self.query_params,
+                                timeout or self.default_timeout, self._page_hash)
+        self._tree._runner = self
+        self.query_params = parse.parse_qs(runner.event_data[-1]["client_state"].query_string)
+        return self
+
+def _app(pagina: str, estado: dict | None = None) -> AppTest:
+    at = AppTestConcurrente(str(RAIZ / pagina), default_timeout=TIMEOUT)
+    for k, v in (estado or {}).items():
+        at.session_state[k] = v
+    return at
+
+def _interactuar(at: AppTest, tipo: str, etiqueta: str, valor) -> AppTest:
+    """Cambia un widget por su etiqueta; si la página no lo pintó (p. ej. sin eventos), solo recarga."""
+    for e in getattr(at, tipo):
+        if e.label == etiqueta:
+            return e.set_value(valor)
+    return at
+
+def _descargando(at: AppTest) -> bool:
+    """True mientras la página avisa de que está descargando o buscando cambios."""
+    return (any(c.value.startswith("🔄") for c in at.caption)
+            or any(i.value.startswith("Descargando el calendario") for i in at.info))
+
+class Sesion:
+    """Una sesión de navegador simulada: login y reruns de las páginas de Autocalendar."""
+
+    def __init__(self, usuario: str, reruns: int):
+        self.usuario = usuario
+        self.reruns = reruns
+        self.tiempos: dict[str, list[float]] = {"login": [], "autocalendar2": [], "Autocalendar": []}
+        self.errores: list[str] = []
+        self.email = None
+
+    def _run(self, pagina: str, at: AppTest, accion=None) -> None:
+        t0 = time.perf_counter()
+        (accion(at) if accion else at).run()
+        self.tiempos[pagina].append(time.perf_counter() - t0)
+        self.errores += [str(e.value) for e in at.exception]
+
+    def ejecutar(self) -> "Sesion":
+        login = _app("Login2.py")
+        login.query_params["code"] = self.usuario
+        self._run("login", login)
+        if "oauth_token" not in login.session_state:
+            self.errores.append("login sin token")
+            return self
+        self.email = login.session_state["user_email"]
+        estado = {"oauth_token": login.session_state["oauth_token"], "user_email": self.email}
+
+        # autocalendar2: primera descarga página a página (como el fragmento,
+        # un rerun por segundo hasta que termina) y luego filtros
+        pagina = _app("pages/autocalendar2.py", estado)
+        self._run("autocalendar2", pagina)
+        limite = time.monotonic() + TIMEOUT
+        while _descargando(pagina) and time.monotonic() < limite:
+            time.sleep(INTERVALO_FRAGMENTO)
+            self._run("autocalendar2", pagina)
+        for i in range(self.reruns):
+            consulta = CONSULTAS[i % len(CONSULTAS)]
+            if i % 2:
+                filtro = ("Todos", "Con código", "Sin código")[i % 3]
+                self._run("autocalendar2", pagina,
+                          lambda at: _interactuar(at, "radio", "Filtrar por código", filtro))
+            else:
+                self._run("autocalendar2", pagina,
+                          lambda at: _interactuar(at, "text_input", "Buscar en título o descripción", consulta))
+
+        # Autocalendar: rango de la semana, desde el almacén o la caché por meses
+        pagina = _app("pages/Autocalendar.py", estado)
+        self._run("Autocalendar", pagina)
+        for i in range(self.reruns):
+            consulta = CONSULTAS[i % len(CONSULTAS)]
+            self._run("Autocalendar", pagina,
+                      lambda at: _interactuar(at, "text_input", "Buscar en título o detalles", consulta))
+        return self
+
+def calendario(n: int) -> list[dict]:
+    """El año 2025 que usa autocalendar2 y unas semanas alrededor de hoy para Autocalendar."""
+    hoy = datetime.date.today()
+    cerca = synthetic_calendar(max(1, n // 10), seed=1, year=hoy.year)
+    for ev in cerca:
+        ev["id"] = "h" + ev["id"]
+    return synthetic_calendar(n) + cerca
+
+def nivel(server, concurrencia: int, reruns: int) -> dict:
+    backend = server.backend
+    rss0 = _rss_mb()
+    llamadas0 = sum(backend.calls_by_user.values())
+    cuota0 = backend.quota_errors
+    t0 = time.perf_counter()
+    usuarios = [f"carga{concurrencia}-{i}" for i in range(concurrencia)]
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        sesiones = list(pool.map(lambda u: Sesion(u, reruns).ejecutar(), usuarios))
+    duracion = time.perf_counter() - t0
+
+    reruns_todos = [t for s in sesiones for p in ("autocalendar2", "Autocalendar") for t in s.tiempos[p]]
+    llamadas = [backend.calls_by_user[s.email] for s in sesiones if s.email]
+    fila = {
+        "sesiones": concurrencia,
+        "reruns": len(reruns_todos),
+        "p50_ms": _percentil(reruns_todos, 50) * 1000,
+        "p95_ms": _percentil(reruns_todos, 95) * 1000,
+        "p99_ms": _percentil(reruns_todos, 99) * 1000,
+        "login_p50_ms": _percentil([t for s in sesiones for t in s.tiempos["login"]], 50) * 1000,
+        "primer_render_p50_ms": _percentil(
+            [s.tiempos["autocalendar2"][0] for s in sesiones if s.tiempos["autocalendar2"]], 50) * 1000,
+        "mb_por_sesion": (_rss_mb() - rss0) / concurrencia,
+        "llamadas_por_sesion": statistics.mean(llamadas) if llamadas else 0,
+        "llamadas_total": sum(backend.calls_by_user.values()) - llamadas0,
+        "errores_cuota": backend.quota_errors - cuota0,
+        "errores_app": sum(len(s.errores) for s in sesiones),
+        "segundos": duracion,
+    }
+    for s in sesiones:
+        for err in s.errores[:1]:
+            print(f"    {s.usuario}: {err}", flush=True)
+    return fila
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--events", type=int, default=2_000)
+    parser.add_argument("--reruns", type=int, default=6)
+    parser.add_argument("--latency", type=float, default=0.05, help="segundos por llamada a la API")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="fracción de 403 de cuota")
+    parser.add_argument("--out", default=None, help="fichero JSON de resultados")
+    args = parser.parse_args()
+
+    meta = {**metadata(), "events": args.events, "latency": args.latency,
+            "error_rate": args.error_rate, "reruns": args.reruns}
+    resultados = []
+    _servidor()
+    with FakeCalendarServer(calendario(args.events), latency=args.latency,
+                            error_rate=args.error_rate, port=PUERTO) as server:
+        print(f"{'sesiones':>8} {'reruns':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'MB/sesión':>10} {'API/sesión':>11} {'403':>5} {'errores':>8}", flush=True)
+        for concurrencia in args.sessions:
+            fila = nivel(server, concurrencia, args.reruns)
+            resultados.append(fila)
+            print(f"{fila['sesiones']:>8} {fila['reruns']:>7} {fila['p50_ms']:>8.0f} "
+                  f"{fila['p95_ms']:>8.0f} {fila['p99_ms']:>8.0f} {fila['mb_por_sesion']:>10.1f} "
+                  f"{fila['llamadas_por_sesion']:>11.1f} {fila['errores_cuota']:>5} "
+                  f"{fila['errores_app']:>8}", flush=True)
+
+    out = Path(args.out or Path(__file__).resolve().parent / "results" /
+               f"carga-{meta['timestamp'][:10]}-{meta['commit'] or 'local'}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({"meta": meta, "results": resultados}, indent=2), encoding="utf-8")
+    print(f"Resultados en {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# benchmarks/run_benchmarks.py
+#
+# Suite de benchmarks sin cuenta de Google: paginación de list_events
+# (googleapiclient y httpx) contra el servidor falso, normalización,
+# filtros, sugerencias y escrituras en lote, a varios tamaños.
+# Uso: python benchmarks/run_benchmarks.py [--sizes 1000 10000 100000]
+#                                          [--repeat 3] [--out resultados.json]
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import time
+from importlib.metadata import version
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_calendar import FakeCalendarServer, synthetic_calendar
+
+from code_suggester import CodeSuggester
+from event_normalizer import normalize_events
+from event_table import compact_events
+from gcal_client import (
+    EVENT_FIELDS, MAX_PAGE_SIZE, batch_write_events, iter_event_pages, list_events,
+)
+from search_index import SearchIndex
+
+SIZES = [1_000, 10_000, 100_000]
+TIME_MIN = datetime.datetime(2025, 1, 1)
+TIME_MAX = datetime.datetime(2025, 12, 31, 23, 59, 59)
+CONSULTAS = ["revision", "comite ries", "alicorp 4", "#1741"]
+
+def medir(fn, repeat: int) -> tuple[list[float], object]:
+    """Ejecuta fn repeat veces; devuelve (segundos de cada vuelta, último resultado)."""
+    tiempos, resultado = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        resultado = fn()
+        tiempos.append(time.perf_counter() - t0)
+    return tiempos, resultado
+
+def bench_size(n: int, repeat: int) -> list[dict]:
+    resultados = []
+
+    def anotar(nombre: str, tiempos: list[float], **extra):
+        fila = {
+            "benchmark": nombre,
+            "n": n,
+            "seconds_best": min(tiempos),
+            "seconds_all": tiempos,
+            **extra,
+        }
+        resultados.append(fila)
+        print(f"  {nombre:<32} n={n:<7} {min(tiempos) * 1000:10.1f} ms", flush=True)
+
+    events = synthetic_calendar(n)
+    with FakeCalendarServer(events) as server:
+        backend = server.backend
+        servicios = {
+            "googleapiclient": server.googleapiclient_service(),
+            "httpx": server.httpx_service(),
+        }
+
+        # — Paginación de list_events —
+        for nombre, service in servicios.items():
+            for page_size in (250, MAX_PAGE_SIZE):
+                backend.requests, backend.bytes_out = 0, 0
+                tiempos, items = medir(lambda: list_events(
+                    service, "primary", TIME_MIN, TIME_MAX,
+                    max_results=page_size, fields=EVENT_FIELDS
+                ), repeat)
+                anotar(
+                    f"list_events[{nombre},{page_size}]", tiempos,
+                    events=len(items),
+                    pages=backend.requests // repeat,
+                    bytes=backend.bytes_out // repeat,
+                )
+        fetched = items
+
+        # — Primera página de iter_event_pages (lo que tarda en pintarse algo) —
+        def primera_pagina():
+            paginas = iter_event_pages(servicios["httpx"], "primary", TIME_MIN, TIME_MAX,
+                                       fields=EVENT_FIELDS)
+            pagina = next(paginas)
+            paginas.close()
+            return pagina
+        tiempos, pagina = medir(primera_pagina, repeat)
+        anotar("iter_event_pages[primera]", tiempos, events=len(pagina))
+
+        # — Normalización —
+        tiempos, df = medir(lambda: normalize_events(fetched), repeat)
+        anotar("normalize_events", tiempos)
+        tiempos, compacto = medir(lambda: compact_events(df), repeat)
+        anotar(
+            "compact_events", tiempos,
+            mb_normalizado=df.memory_usage(deep=True).sum() / 1e6,
+            mb_compacto=compacto.memory_usage(deep=True).sum() / 1e6,
+        )
+
+        # — Filtros: índice de búsqueda frente a str.contains —
+        tiempos, indice = medir(lambda: SearchIndex(["titulo_raw", "detalles"]).fit(df), repeat)
+        anotar("search_index.fit", tiempos, vocab=len(indice._vocab))
+        tiempos, _ = medir(lambda: [indice.mask(q) for q in CONSULTAS], repeat)
+        anotar("search_index.mask", [t / len(CONSULTAS) for t in tiempos])
+
+        def contains():
+            return [
+                df["titulo_raw"].str.lower().str.contains(q) | df["detalles"].str.lower().str.contains(q)
+                for q in CONSULTAS
+            ]
+        tiempos, _ = medir(contains, repeat)
+        anotar("str.contains (referencia)", [t / len(CONSULTAS) for t in tiempos])
+
+        fi, ff = datetime.date(2025, 3, 1), datetime.date(2025, 9, 30)
+        tiempos, _ = medir(lambda: (
+            (df["fecha"] >= fi) & (df["fecha"] <= ff) & (df["codigo"] == "")
+        ).to_numpy() & indice.mask("reunion"), repeat)
+        anotar("filtro_completo", tiempos)
+
+        # — Sugerencias —
+        tiempos, sugeridor = medir(lambda: CodeSuggester("descripcion").fit(df), repeat)
+        anotar("suggester.fit", tiempos)
+        sin_codigo = df[df["codigo"] == ""]
+        tiempos, _ = medir(lambda: sugeridor.suggest(sin_codigo), repeat)
+        anotar("suggester.suggest", tiempos, rows=len(sin_codigo))
+
+        # — Escrituras en lote (patch del título con If-Match) —
+        for nombre, service in servicios.items():
+            # etags vigentes (las escrituras anteriores los cambiaron)
+            actuales = list_events(service, "primary", TIME_MIN, TIME_MAX,
+                                   max_results=MAX_PAGE_SIZE, fields=EVENT_FIELDS)
+            writes = [
+                {"event_id": ev["id"], "method": "patch", "etag": ev["etag"],
+                 "body": {"summary": f"#17419999 – {ev['summary']}"}}
+                for ev in actuales
+            ]
+            def escribir():
+                return batch_write_events(service, writes, "primary")
+            backend.requests, backend.batch_items = 0, 0
+            tiempos, res = medir(escribir, 1)
+            anotar(
+                f"batch_write_events[{nombre}]", tiempos,
+                ok=sum(r["ok"] for r in res),
+                http_requests=backend.requests,
+                sub_requests=backend.batch_items,
+            )
+    return resultados
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "packages": {
+            p: version(p) for p in
+            ("pandas", "numpy", "pyarrow", "httpx", "google-api-python-client")
+        },
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", default=None, help="fichero JSON de resultados")
+    args = parser.parse_args()
+
+    meta = metadata()
+    resultados = []
+    for n in args.sizes:
+        print(f"n = {n}", flush=True)
+        resultados.extend(bench_size(n, args.repeat))
+
+    out = Path(args.out or Path(__file__).resolve().parent / "results" /
+               f"{meta['timestamp'][:10]}-{meta['commit'] or 'local'}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({"meta": meta, "results": resultados}, indent=2), encoding="utf-8")
+    print(f"Resultados en {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/series_mode.py
+#
+# Modo series frente a singleEvents=True sobre el servidor falso: bytes y
+# llamadas de la descarga del año, que ambos modos dan los mismos eventos,
+# escrituras para poner un código a todas las series y que la
+# sincronización incremental en modo series trae el cambio del maestro.
+# Uso: python benchmarks/series_mode.py [--series 300] [--singles 3000]
+
+import argparse
+import datetime
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_calendar import FakeCalendarServer, recurring_calendar
+
+from event_store import EventStore
+from gcal_client import batch_write_events
+from write_planner import series_writes
+
+TIME_MIN = datetime.datetime(2025, 1, 1)
+TIME_MAX = datetime.datetime(2025, 12, 31, 23, 59, 59)
+
+def descargar(server, service, store, user, series):
+    backend = server.backend
+    peticiones, bytes_out = backend.requests, backend.bytes_out
+    t0 = time.perf_counter()
+    store.refresh(service, user, "primary", TIME_MIN, TIME_MAX, series=series)
+    segundos = time.perf_counter() - t0
+    return (store.load(user, "primary"), backend.requests - peticiones,
+            backend.bytes_out - bytes_out, segundos)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--series", type=int, default=300)
+    parser.add_argument("--singles", type=int, default=3_000)
+    args = parser.parse_args()
+
+    with FakeCalendarServer(recurring_calendar(args.series, args.singles)) as server:
+        service = server.httpx_service()
+        store = EventStore(tempfile.mkdtemp())
+
+        df_uno, n_uno, b_uno, s_uno = descargar(server, service, store, "uno", series=False)
+        df_serie, n_serie, b_serie, s_serie = descargar(server, service, store, "serie", series=True)
+        print(f"singleEvents=True: {len(df_uno)} eventos, {n_uno} llamadas, "
+              f"{b_uno / 1e6:.2f} MB, {s_uno * 1000:.0f} ms")
+        print(f"modo series:       {len(df_serie)} eventos, {n_serie} llamadas, "
+              f"{b_serie / 1e6:.2f} MB, {s_serie * 1000:.0f} ms")
+        columnas = ["id", "inicio", "fin", "titulo_raw", "serie"]
+        iguales = (df_uno[columnas].sort_values("id", ignore_index=True)
+                   .equals(df_serie[columnas].sort_values("id", ignore_index=True)))
+        print(f"mismos eventos en ambos modos: {iguales}")
+
+        # Código a todas las series: una escritura por maestro
+        recurrentes = df_serie[(df_serie["serie"] != "").to_numpy()]
+        writes = series_writes(store.masters("serie", "primary"), recurrentes,
+                               ["#17410001"] * len(recurrentes))
+        resultados = batch_write_events(service, writes)
+        print(f"código en {len(recurrentes)} repeticiones: {len(writes)} escrituras "
+              f"({sum(r['ok'] for r in resultados)} ok) en vez de {len(recurrentes)}")
+
+        version = store.meta("serie", "primary")["version"]
+        store.refresh(service, "serie", "primary", TIME_MIN, TIME_MAX)
+        df = store.load("serie", "primary")
+        excepciones = df["id"].isin(
+            [ev["id"] for ev in server.backend._events.values() if ev.get("originalStartTime")]
+        ).to_numpy()
+        en_serie = (df["serie"] != "").to_numpy() & ~excepciones
+        con_codigo = df.loc[en_serie, "codigo"].eq("#17410001").all()
+        print(f"sync incremental: versión {version} -> {store.meta('serie', 'primary')['version']}, "
+              f"repeticiones con el código nuevo: {con_codigo}, eventos: {len(df)}")
+
+if __name__ == "__main__":
+    main()
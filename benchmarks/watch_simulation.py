@@ -0,0 +1,81 @@
+# benchmarks/watch_simulation.py
+#
+# Simulación local de los avisos push: el servidor falso abre canales de
+# watch y, en cada escritura, su NotificationSender hace POST al receptor
+# de watch_channels, que lanza la sincronización incremental del almacén.
+# Mide cuánto tarda un cambio en Calendar en aparecer en el almacén.
+# Uso: python benchmarks/watch_simulation.py [--events 5000] [--changes 20]
+
+import argparse
+import datetime
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_calendar import FakeCalendarServer, synthetic_calendar
+
+from event_store import EventStore
+from shared_cache import SharedEventCache
+from watch_channels import WatchManager
+
+TIME_MIN = datetime.datetime(2025, 1, 1)
+TIME_MAX = datetime.datetime(2025, 12, 31, 23, 59, 59)
+
+def esperar(condicion, timeout: float = 10.0) -> bool:
+    limite = time.perf_counter() + timeout
+    while time.perf_counter() < limite:
+        if condicion():
+            return True
+        time.sleep(0.005)
+    return False
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=5_000)
+    parser.add_argument("--changes", type=int, default=20)
+    args = parser.parse_args()
+
+    events = synthetic_calendar(args.events)
+    with FakeCalendarServer(events) as server:
+        service = server.httpx_service()
+        store = EventStore(tempfile.mkdtemp())
+        store.refresh(service, "sim", "primary", TIME_MIN, TIME_MAX)
+
+        # Receptor en un puerto libre; el servidor falso avisa directamente a él
+        manager = WatchManager(address=None, port=0, store=store, cache=SharedEventCache(),
+                               service_factory=lambda token, session: service)
+        manager.start()
+        manager.address = f"http://127.0.0.1:{manager.port}/calendar-webhook"
+        canal = manager.watch({"access_token": "fake-token"}, "sim", "primary",
+                              TIME_MIN, TIME_MAX, store_user="sim")
+        if canal is None:
+            sys.exit(f"No se pudo abrir el canal: {manager.errors}")
+
+        latencias = []
+        for i, ev in enumerate(events[:args.changes]):
+            version = store.meta("sim", "primary")["version"]
+            t0 = time.perf_counter()
+            service.events().patch(
+                calendarId="primary", eventId=ev["id"], body={"summary": f"Cambio {i}"}
+            ).execute()
+            ok = esperar(lambda: store.meta("sim", "primary")["version"] > version
+                         and not store.refreshing("sim", "primary"))
+            if not ok:
+                sys.exit(f"El cambio {i} no llegó al almacén")
+            latencias.append(time.perf_counter() - t0)
+
+        df = store.load("sim", "primary")
+        assert (df.set_index("id").loc[[ev["id"] for ev in events[:args.changes]], "titulo_raw"]
+                .str.startswith("Cambio").all())
+        manager.stop()
+
+    print(f"avisos procesados: {manager.notifications}, rechazados: {manager.rejected}")
+    print(f"cambio -> almacén: mediana {statistics.median(latencias) * 1000:.1f} ms, "
+          f"máx {max(latencias) * 1000:.1f} ms ({len(latencias)} cambios)")
+
+if __name__ == "__main__":
+    main()
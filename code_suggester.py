@@ -0,0 +1,154 @@
+# code_suggester.py
+
+import functools
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+# Peso de cada tipo de señal: la serie recurrente casi siempre decide
+PESOS = {"s": 5.0, "a": 1.0, "t": 1.0}
+# Códigos que aporta cada señal al puntuar (los más frecuentes)
+TOP_CODIGOS = 10
+
+_TOKEN_RE = re.compile(r"[a-z][a-z0-9]{2,}")
+STOPWORDS = {
+    "con", "del", "las", "los", "para", "por", "una", "que", "the", "and",
+    "for", "with", "reunion", "meeting", "sesion", "call",
+}
+
+def fold(texto: str) -> str:
+    """Minúsculas y sin tildes."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+@functools.lru_cache(maxsize=65536)
+def _title_features(texto: str) -> frozenset[str]:
+    return frozenset(
+        f"t:{tok}" for tok in _TOKEN_RE.findall(fold(texto)) if tok not in STOPWORDS
+    )
+
+def features(texto: str, serie: str | None, asistentes) -> set[str]:
+    """Señales de una reunión: tokens del título, asistentes y serie recurrente."""
+    feats = set(_title_features(texto or ""))
+    feats.update(f"a:{email.lower()}" for email in (asistentes or ()))
+    if serie:
+        feats.add(f"s:{serie}")
+    return feats
+
+class CodeSuggester:
+    """
+    Índice invertido señal -> códigos construido con las reuniones ya codificadas.
+
+    Se construye una vez por conjunto de datos con fit() y se mantiene al día
+    con update()/assign(); suggest() puntúa todo un DataFrame en una llamada.
+    """
+
+    def __init__(self, text_col: str = "descripcion"):
+        self.text_col = text_col
+        self._index: dict[str, Counter] = defaultdict(Counter)
+        self._codigos: dict[str, str] = {}          # id -> código indexado
+        self._feats: dict[str, set[str]] = {}       # id -> señales indexadas
+        self._dist: dict[str, list[tuple[str, float]]] = {}  # caché de _distribution
+
+    def fit(self, df: pd.DataFrame) -> "CodeSuggester":
+        self._index.clear()
+        self._codigos.clear()
+        self._feats.clear()
+        self._dist.clear()
+        return self.update(df)
+
+    def update(self, df: pd.DataFrame) -> "CodeSuggester":
+        """Indexa solo las filas cuyo código cambió desde la última vez."""
+        if df.empty:
+            return self
+        conocidos = df["id"].map(self._codigos).fillna("")
+        cambiados = df[df["codigo"] != conocidos]
+        for row in cambiados.itertuples(index=False):
+            self.assign(
+                row.id, row.codigo,
+                getattr(row, self.text_col), row.serie, row.asistentes
+            )
+        return self
+
+    def assign(self, event_id: str, codigo: str,
+               texto: str = "", serie: str | None = None, asistentes=()) -> None:
+        """Registra (o cambia) el código de una reunión."""
+        anterior = self._codigos.pop(event_id, None)
+        feats = self._feats.pop(event_id, None)
+        if anterior and feats:
+            for f in feats:
+                self._dist.pop(f, None)
+                self._index[f][anterior] -= 1
+                if self._index[f][anterior] <= 0:
+                    del self._index[f][anterior]
+                if not self._index[f]:
+                    del self._index[f]
+        if not codigo:
+            return
+        if feats is None:
+            feats = features(texto, serie, asistentes)
+        for f in feats:
+            self._dist.pop(f, None)
+            self._index[f][codigo] += 1
+        self._codigos[event_id] = codigo
+        self._feats[event_id] = feats
+
+    def _distribution(self, f: str) -> list[tuple[str, float]]:
+        """Aporte ponderado de la señal f a sus códigos más frecuentes."""
+        dist = self._dist.get(f)
+        if dist is None:
+            codigos = self._index.get(f)
+            if codigos:
+                total = sum(codigos.values())
+                peso = PESOS[f[0]]
+                dist = [(c, peso * n / total) for c, n in codigos.most_common(TOP_CODIGOS)]
+            else:
+                dist = []
+            self._dist[f] = dist
+        return dist
+
+    def _score(self, feats: set[str]) -> tuple[str, float]:
+        puntos: dict[str, float] = defaultdict(float)
+        for f in feats:
+            for codigo, aporte in self._distribution(f):
+                puntos[codigo] += aporte
+        if not puntos:
+            return "", 0.0
+        # Cuota del mejor código sobre el peso de todas las señales de la
+        # reunión: baja si solo coincide una parte de ellas
+        mejor = max(puntos, key=puntos.get)
+        return mejor, puntos[mejor] / sum(PESOS[f[0]] for f in feats)
+
+    def suggest(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Devuelve 'sugerencia' y 'confianza' (0-1) para cada fila de df."""
+        # Las reuniones repetidas (misma serie, título y asistentes) se puntúan una vez
+        vistos: dict[tuple, tuple[str, float]] = {}
+        resultados = []
+        for clave in zip(df[self.text_col], df["serie"], df["asistentes"]):
+            res = vistos.get(clave)
+            if res is None:
+                res = vistos[clave] = self._score(features(*clave))
+            resultados.append(res)
+        return pd.DataFrame(
+            resultados or None,
+            index=df.index,
+            columns=["sugerencia", "confianza"],
+        )
+
+def get_suggester(session, dataset_key, df: pd.DataFrame,
+                  text_col: str = "descripcion") -> CodeSuggester:
+    """
+    Devuelve el sugeridor guardado en la sesión (p. ej. st.session_state).
+
+    Se construye una vez por dataset_key (usuario, calendario...) y en los
+    reruns siguientes solo se indexan las filas cuyo código cambió.
+    """
+    sugeridor = session.get("_code_suggester")
+    if sugeridor is None or session.get("_code_suggester_key") != dataset_key:
+        session["_code_suggester"] = CodeSuggester(text_col).fit(df)
+        session["_code_suggester_key"] = dataset_key
+    else:
+        sugeridor.update(df)
+    return session["_code_suggester"]
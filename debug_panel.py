@@ -0,0 +1,54 @@
+# debug_panel.py
+
+import pandas as pd
+import streamlit as st
+
+from metrics import StageTimer, metrics
+from shared_cache import shared_cache
+
+def debug_panel(timer: StageTimer) -> None:
+    """
+    Panel opcional en la barra lateral: tiempo por etapa y llamadas a la API
+    de este rerun, métricas acumuladas del proceso (también de la caché
+    compartida) y su exportación.
+    """
+    if not st.sidebar.toggle("🔧 Panel de depuración", key="_debug_panel"):
+        return
+    with st.sidebar:
+        st.markdown(f"**Este rerun:** {timer.total * 1000:.0f} ms")
+        st.dataframe(
+            pd.DataFrame({"etapa": list(timer.stages),
+                          "ms": [s * 1000 for s in timer.stages.values()]}),
+            hide_index=True, use_container_width=True,
+        )
+        if timer.calls:
+            llamadas = pd.DataFrame(timer.calls).groupby("method").agg(
+                llamadas=("seconds", "size"),
+                ms=("seconds", lambda s: s.sum() * 1000),
+                bytes=("bytes", "sum"),
+                reintentos=("retries", "sum"),
+                errores=("error", "sum"),
+            )
+            st.dataframe(llamadas, use_container_width=True)
+        else:
+            st.caption("Sin llamadas a la API en este rerun.")
+
+        snap = metrics.snapshot()
+        st.markdown(f"**Proceso** (desde hace {snap['uptime_seconds'] / 60:.0f} min)")
+        if snap["calls"]:
+            st.dataframe(pd.DataFrame(snap["calls"]).T, use_container_width=True)
+        cache = shared_cache.stats()
+        st.markdown(
+            f"**Caché compartida:** {cache['entries']} entradas, "
+            f"{cache['bytes'] / 2**20:.1f} de {cache['max_bytes'] / 2**20:.0f} MB"
+        )
+        st.dataframe(
+            pd.DataFrame([{k: cache[k] for k in
+                           ("hits", "misses", "shared", "evictions", "expirations", "denied")}]),
+            hide_index=True, use_container_width=True,
+        )
+        c1, c2 = st.columns(2)
+        with c1:
+            st.download_button("JSON", metrics.to_json(), "metrics.json", "application/json")
+        with c2:
+            st.download_button("Prometheus", metrics.to_prometheus(), "metrics.prom", "text/plain")
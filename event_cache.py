@@ -0,0 +1,126 @@
+# event_cache.py
+
+import datetime
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from gcal_client import (
+    EVENT_FIELDS, MAX_PAGE_SIZE, MAX_PARALLEL_CALENDARS,
+    event_time, list_events, thread_http,
+)
+from shared_cache import SharedEventCache, shared_cache
+
+def month_starts(time_min: datetime.datetime, time_max: datetime.datetime) -> list[datetime.date]:
+    """Primer día de cada mes que toca el rango [time_min, time_max]."""
+    mes = time_min.date().replace(day=1)
+    fin = time_max.date()
+    meses = []
+    while mes <= fin:
+        meses.append(mes)
+        mes = (mes + datetime.timedelta(days=32)).replace(day=1)
+    return meses
+
+def _month_range(mes: datetime.date) -> tuple[datetime.datetime, datetime.datetime]:
+    siguiente = (mes + datetime.timedelta(days=32)).replace(day=1)
+    return (datetime.datetime.combine(mes, datetime.time.min),
+            datetime.datetime.combine(siguiente, datetime.time.min))
+
+class MonthShardCache:
+    """
+    Caché de eventos troceada por (calendario, mes) sobre la caché
+    compartida del proceso.
+
+    Para un rango pedido solo se descargan los meses que faltan o caducaron
+    (en paralelo) y el resto se sirve de memoria. Los meses de un calendario
+    compartido los descarga una sola sesión; a cada usuario se le comprueba
+    antes el acceso.
+    """
+
+    def __init__(self, cache: SharedEventCache = shared_cache,
+                 max_workers: int = MAX_PARALLEL_CALENDARS):
+        self.cache = cache
+        self.max_workers = max_workers
+
+    def invalidate(self, user: str, calendar_id: str | None = None) -> None:
+        """Olvida los meses de los calendarios del usuario (o solo de uno)."""
+        self.cache.invalidate(user, calendar_id)
+
+    def _fetch(self, service, calendar_id: str, mes: datetime.date, fields: str) -> list[dict]:
+        desde, hasta = _month_range(mes)
+        return list_events(
+            service,
+            calendar_id=calendar_id,
+            time_min=desde,
+            time_max=hasta,
+            max_results=MAX_PAGE_SIZE,
+            fields=fields,
+            http=thread_http(service),
+        )
+
+    def list_events(self,
+                    service,
+                    user: str,
+                    calendar_ids: list[str],
+                    time_min: datetime.datetime,
+                    time_max: datetime.datetime,
+                    fields: str = EVENT_FIELDS,
+                    errors: dict | None = None) -> list[dict]:
+        """
+        Como gcal_client.list_events con varios calendarios, pero servido por meses.
+
+        Cada evento lleva su 'calendar_id'; un calendario que falla (o al que
+        el usuario no tiene acceso) se anota en errors y no aborta el resto.
+        """
+        meses = month_starts(time_min, time_max)
+        shards: dict[tuple, list[dict]] = {}   # (calendario, mes) -> eventos
+        pendientes: dict[tuple, tuple] = {}     # (calendario, mes) -> clave compartida
+        for cal_id in dict.fromkeys(calendar_ids):
+            try:
+                claves = {mes: self.cache.key(service, user, cal_id, mes, fields) for mes in meses}
+            except Exception as e:
+                if errors is not None:
+                    errors[cal_id] = e
+                continue
+            for mes, clave in claves.items():
+                items = self.cache.lookup(clave)
+                if items is None:
+                    pendientes[(cal_id, mes)] = clave
+                else:
+                    shards[(cal_id, mes)] = items
+
+        if pendientes:
+            workers = max(1, min(self.max_workers, len(pendientes)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(
+                        self.cache.get, clave,
+                        functools.partial(self._fetch, service, cal_id, mes, fields)
+                    ): (cal_id, mes)
+                    for (cal_id, mes), clave in pendientes.items()
+                }
+                for fut in as_completed(futures):
+                    cal_id, mes = futures[fut]
+                    try:
+                        shards[(cal_id, mes)] = fut.result()
+                    except Exception as e:
+                        if errors is not None:
+                            errors[cal_id] = e
+
+        # Un evento que cruza de mes aparece en ambos trozos: se deduplica.
+        # Los trozos son compartidos, así que no se modifican: cada evento
+        # se copia con el id de calendario que pidió esta sesión
+        lo = time_min.replace(tzinfo=datetime.timezone.utc)
+        hi = time_max.replace(tzinfo=datetime.timezone.utc)
+        vistos = {}
+        for (cal_id, _), items in shards.items():
+            for ev in items:
+                vistos[(cal_id, ev["id"])] = (cal_id, ev)
+        events = [
+            {**ev, "calendar_id": cal_id} for cal_id, ev in vistos.values()
+            if event_time(ev, "end") >= lo and event_time(ev, "start") <= hi
+        ]
+        events.sort(key=event_time)
+        return events
+
+# Caché del proceso, compartida por todas las sesiones
+month_cache = MonthShardCache()
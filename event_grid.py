@@ -0,0 +1,97 @@
+# event_grid.py
+
+import math
+
+import pandas as pd
+import streamlit as st
+
+from event_table import EventView, display_frame
+
+PAGE_SIZE = 50
+SEL_COL = "seleccionar"
+
+def _state(key: str):
+    """Selección (ids) y ediciones por id, guardadas en la sesión."""
+    sel = st.session_state.setdefault(f"{key}_sel", set())
+    edits = st.session_state.setdefault(f"{key}_edits", {})
+    return sel, edits
+
+def event_grid(df: pd.DataFrame | EventView,
+               key: str,
+               columns: list[str],
+               editable: tuple[str, ...] = (),
+               page_size: int = PAGE_SIZE,
+               column_config: dict | None = None) -> tuple[set, dict]:
+    """
+    Tabla paginada y seleccionable sobre df (un solo widget por página).
+
+    Solo se envían al navegador (y se copian) las filas de la página actual,
+    así el coste de render no crece con el número de eventos; df puede ser
+    una EventView para no copiar lo filtrado. La selección y las ediciones
+    de las columnas 'editable' se guardan por id en la sesión.
+    Devuelve (ids seleccionados dentro de df, {id: {columna: valor}}).
+    """
+    if isinstance(df, pd.DataFrame):
+        df = EventView.of(df)
+    sel, edits = _state(key)
+    version_key = f"{key}_version"
+    st.session_state.setdefault(version_key, 0)
+
+    # Selección masiva sobre todo lo filtrado, no solo la página visible
+    c1, c2, c3 = st.columns([0.3, 0.3, 0.4])
+    with c1:
+        if st.button(f"Seleccionar las {len(df)} filtradas", key=f"{key}_all"):
+            sel.update(df.ids)
+            st.session_state[version_key] += 1
+    with c2:
+        if st.button("Quitar selección", key=f"{key}_none"):
+            sel.difference_update(df.ids)
+            st.session_state[version_key] += 1
+
+    n_pages = max(1, math.ceil(len(df) / page_size))
+    with c3:
+        page = st.number_input(
+            f"Página (de {n_pages})", min_value=1, max_value=n_pages,
+            value=1, step=1, key=f"{key}_page"
+        )
+
+    pagina = display_frame(df.frame(["id"] + columns, (page - 1) * page_size, page * page_size))
+    vista = pagina.copy()
+    vista.insert(0, SEL_COL, vista["id"].isin(sel))
+    for col in editable:
+        # Con el tipo original: una página vacía no puede quedar como float
+        vista[col] = pd.Series(
+            [edits.get(i, {}).get(col, v) for i, v in zip(vista["id"], vista[col])],
+            index=vista.index, dtype=vista[col].dtype,
+        )
+
+    config = {
+        SEL_COL: st.column_config.CheckboxColumn("✔", default=False),
+        "id": None,
+    }
+    config.update(column_config or {})
+    editado = st.data_editor(
+        vista,
+        key=f"{key}_grid_{st.session_state[version_key]}_{page}",
+        hide_index=True,
+        use_container_width=True,
+        column_config=config,
+        disabled=[c for c in vista.columns if c not in (SEL_COL, *editable)],
+    )
+
+    # Sincronizar la página editada con el estado de la sesión
+    for pos, fila in enumerate(editado.to_dict("records")):
+        event_id = fila["id"]
+        if fila[SEL_COL]:
+            sel.add(event_id)
+        else:
+            sel.discard(event_id)
+        for col in editable:
+            if fila[col] != pagina[col].iat[pos]:
+                edits.setdefault(event_id, {})[col] = fila[col]
+            else:
+                edits.get(event_id, {}).pop(col, None)
+
+    seleccionados = sel.intersection(df.ids)
+    st.caption(f"{len(seleccionados)} de {len(df)} reunión(es) seleccionada(s)")
+    return seleccionados, edits
@@ -0,0 +1,109 @@
+# event_normalizer.py
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# Regex para "#12345 – descripción" o "#12345 descripción"
+CODE_PATTERN = r"^#(\d+)(?:\s*[-–—]\s*|\s+)(.*)"
+
+COLUMNS = [
+    "id", "etag", "inicio", "fin", "fecha", "hora", "duracion",
+    "titulo_raw", "codigo", "descripcion", "detalles", "serie", "asistentes",
+    "calendar_id",
+]
+
+_OFFSET_RE = re.compile(r"^(?:\.\d+)?(Z|[+-]\d{2}:?\d{2})?$")
+
+def _offset_seconds(suffix: str) -> int:
+    """Segundos de desfase UTC del sufijo ISO ('', 'Z', '-05:00', '.000+01:00'...)."""
+    m = _OFFSET_RE.match(suffix)
+    if not m:
+        raise ValueError(f"Zona horaria no reconocida: {suffix!r}")
+    tz = m.group(1)
+    if not tz or tz == "Z":
+        return 0
+    sign = -1 if tz[0] == "-" else 1
+    digits = tz[1:].replace(":", "")
+    return sign * (int(digits[:2]) * 3600 + int(digits[2:]) * 60)
+
+def split_codes(titles: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """Separa '#código – descripción' de los títulos; devuelve (codigo, descripcion)."""
+    codigo = pd.Series("", index=titles.index, dtype=object)
+    desc   = titles.copy()
+    con_almohadilla = titles.str.startswith("#", na=False)
+    if con_almohadilla.any():
+        parts = titles[con_almohadilla].str.extract(CODE_PATTERN)
+        tiene = parts[0].notna()
+        idx = parts.index[tiene]
+        codigo.loc[idx] = "#" + parts.loc[tiene, 0]
+        desc.loc[idx]   = parts.loc[tiene, 1].str.strip()
+    return codigo, desc
+
+def _format_durations(seconds: np.ndarray) -> np.ndarray:
+    """Formatea duraciones como str(Timedelta), una vez por valor distinto."""
+    unicos, inversa = np.unique(seconds, return_inverse=True)
+    textos = np.array([str(pd.Timedelta(seconds=int(s))) for s in unicos], dtype=object)
+    return textos[inversa]
+
+def normalize_events(events: list[dict]) -> pd.DataFrame:
+    """
+    Normaliza eventos de Calendar a un DataFrame, de forma vectorizada.
+
+    fecha y hora son las del reloj local de cada evento (igual que el
+    normalize_event por fila); inicio y fin quedan en UTC con zona.
+    """
+    if not events:
+        return pd.DataFrame(columns=COLUMNS)
+
+    # Una sola pasada sobre los dicts para aplanar las columnas
+    ids, etags, titles, details, instantes = [], [], [], [], []
+    ends, series, asistentes, calendarios = [], [], [], []
+    for ev in events:
+        start = ev.get("start", {})
+        end   = ev.get("end", {})
+        ids.append(ev.get("id"))
+        etags.append(ev.get("etag"))
+        titles.append((ev.get("summary") or "").strip())
+        details.append(ev.get("description") or "")
+        instantes.append(start.get("dateTime") or start.get("date"))
+        ends.append(end.get("dateTime") or end.get("date"))
+        series.append(ev.get("recurringEventId"))
+        calendarios.append(ev.get("calendar_id"))
+        asistentes.append(tuple(
+            a["email"] for a in ev.get("attendees", ()) if "email" in a and not a.get("self")
+        ))
+    n = len(ids)
+    instantes.extend(ends)
+
+    # Inicio y fin en una sola conversión: reloj local + desfase por sufijo
+    locales = [s[:19] if len(s) > 10 else s + "T00:00:00" for s in instantes]
+    sufijos = [s[19:] for s in instantes]
+    desfases = {suf: _offset_seconds(suf) for suf in set(sufijos)}
+    local = np.array(locales, dtype="datetime64[s]")
+    utc = local - np.array([desfases[suf] for suf in sufijos], dtype="timedelta64[s]")
+
+    inicio = pd.to_datetime(utc[:n]).tz_localize("UTC")
+    fin    = pd.to_datetime(utc[n:]).tz_localize("UTC")
+    duracion = (utc[n:] - utc[:n]).astype(np.int64)
+
+    titulos = pd.Series(titles, dtype=object)
+    codigo, descripcion = split_codes(titulos)
+
+    return pd.DataFrame({
+        "id":          ids,
+        "etag":        etags,
+        "inicio":      inicio,
+        "fin":         fin,
+        "fecha":       local[:n].astype("datetime64[D]").astype(object),
+        "hora":        [s[11:16] for s in locales[:n]],
+        "duracion":    _format_durations(duracion),
+        "titulo_raw":  titulos,
+        "codigo":      codigo,
+        "descripcion": descripcion,
+        "detalles":    details,
+        "serie":       series,
+        "asistentes":  asistentes,
+        "calendar_id": calendarios,
+    })
@@ -0,0 +1,486 @@
+# event_store.py
+#
+# Almacén en disco de eventos normalizados por (usuario y rango, calendario),
+# en ficheros Arrow IPC que se leen con memory-map. Cada carpeta guarda una
+# base, los deltas de las sincronizaciones incrementales (solo se añaden,
+# nunca se reescribe la base) y un meta.json con el rango, el sync token y
+# los ids que tocó cada versión reciente.
+# En modo series se guarda además series.json con los maestros de las
+# series y sus excepciones, para regenerar sus repeticiones al sincronizar.
+
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+from googleapiclient.errors import HttpError
+
+from event_normalizer import COLUMNS, normalize_events
+from event_table import STRING, compact_events
+from gcal_client import (
+    EVENT_FIELDS, SERIES_FIELDS, in_window, iter_changes, list_changes, thread_http,
+)
+from recurrence import expand_events, split_series
+from shared_cache import SharedEventCache, shared_cache
+
+STORE_DIR = os.environ.get("NEO_BRAIN_STORE", ".event_store")
+# Con más deltas que estos se compactan en una base nueva
+MAX_DELTAS = 20
+# Versiones recientes de las que meta.json guarda los ids que cambiaron
+MAX_CHANGES = 100
+# Segundos tras una actualización en los que no se lanza otra en segundo plano
+REFRESH_INTERVAL = 60
+DELETED_COL = "_borrado"
+
+def store_key(owner: str | tuple, time_min: datetime.datetime,
+              time_max: datetime.datetime) -> str:
+    """
+    Clave de una carpeta del almacén (el 'user' de load, refresh, etc.):
+    owner y el rango. owner es el usuario o, para compartir la carpeta, la
+    clave de shared_cache.SharedEventCache.key (calendario resuelto y
+    alcance). Cada rango tiene su carpeta, así dos páginas con rangos
+    distintos sobre el mismo calendario no se obligan una a otra a
+    descargarlo todo de nuevo (y perder el sync token) en cada visita.
+    """
+    partes = owner if isinstance(owner, tuple) else (owner,)
+    return "|".join([*map(str, partes), time_min.isoformat(), time_max.isoformat()])
+
+def _write_arrow(path: Path, df: pd.DataFrame) -> None:
+    """Escribe df como Arrow IPC sin compresión (para poder hacer memory-map)."""
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    tmp = path.with_suffix(".tmp")
+    with pa.OSFile(str(tmp), "wb") as sink:
+        with pa.ipc.new_file(sink, tabla.schema) as writer:
+            writer.write_table(tabla)
+    os.replace(tmp, path)
+
+# Los textos se quedan en buffers de Arrow (sin un str de Python por celda)
+_ARROW_STRINGS = {pa.string(): STRING, pa.large_string(): STRING}
+
+def _read_arrow(path: Path) -> pd.DataFrame:
+    with pa.memory_map(str(path), "r") as source:
+        return pa.ipc.open_file(source).read_all().to_pandas(types_mapper=_ARROW_STRINGS.get)
+
+class EventStore:
+    """
+    Eventos normalizados en disco, para arrancar sin descargar el calendario.
+
+    load() devuelve al instante lo guardado y refresh()/refresh_async()
+    traen solo los cambios con el sync token de Google y los añaden como
+    un delta; si el token caduca (410) o cambia el rango, se descarga todo.
+    Las páginas usan como user la clave de store_key (una carpeta por rango
+    y por calendario y alcance, compartida entre usuarios). Lo que devuelve
+    load() se guarda por versión en cache, con su límite de memoria.
+    """
+
+    def __init__(self, root: str | os.PathLike = STORE_DIR, max_deltas: int = MAX_DELTAS,
+                 cache: SharedEventCache = shared_cache):
+        self.root = Path(root)
+        self.max_deltas = max_deltas
+        self.cache = cache
+        self._lock = threading.RLock()
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="event-store")
+        self._refreshing: dict[tuple, Future] = {}
+        # Descargas completas en curso: páginas ya normalizadas y su avance
+        self._downloads: dict[tuple, dict] = {}
+
+    def _dir(self, user: str, calendar_id: str) -> Path:
+        usuario = hashlib.sha1(user.encode("utf-8")).hexdigest()[:16]
+        return self.root / usuario / urllib.parse.quote(calendar_id, safe="")
+
+    def meta(self, user: str, calendar_id: str) -> dict | None:
+        path = self._dir(user, calendar_id) / "meta.json"
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save_meta(self, carpeta: Path, meta: dict) -> None:
+        tmp = carpeta / "meta.tmp"
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, carpeta / "meta.json")
+
+    def series(self, user: str, calendar_id: str) -> dict[str, dict]:
+        """Maestros y excepciones guardados en modo series (id -> evento); {} si no hay."""
+        path = self._dir(user, calendar_id) / "series.json"
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def masters(self, user: str, calendar_id: str) -> dict[str, dict]:
+        """Maestros de las series (id -> evento, con su etag y summary) en modo series."""
+        return split_series(self.series(user, calendar_id).values())[0]
+
+    def _save_series(self, carpeta: Path, series: dict[str, dict]) -> None:
+        tmp = carpeta / "series.tmp"
+        tmp.write_text(json.dumps(series), encoding="utf-8")
+        os.replace(tmp, carpeta / "series.json")
+
+    # ——————————————
+    # Lectura
+    # ——————————————
+
+    def load(self, user: str, calendar_id: str) -> pd.DataFrame | None:
+        """
+        Base + deltas fusionados (el último cambio de cada id gana), con los
+        tipos compactos de compact_events; None si no hay nada guardado.
+        """
+        with self._lock:
+            meta = self.meta(user, calendar_id)
+            if meta is None:
+                return None
+            key = self._cache_key(user, calendar_id, meta["version"])
+            cacheado = self.cache.lookup(key)
+            if cacheado is not None:
+                return cacheado
+            carpeta = self._dir(user, calendar_id)
+            partes = [_read_arrow(carpeta / nombre) for nombre in [meta["base"], *meta["deltas"]]]
+
+        df = pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+        if len(partes) > 1:
+            df = df.drop_duplicates("id", keep="last")
+            df = df[~df[DELETED_COL].fillna(False).astype(bool)]
+        df = df.drop(columns=DELETED_COL).reset_index(drop=True)
+        # Arrow devuelve las listas como arrays de numpy
+        df["asistentes"] = [tuple(a) if a is not None else () for a in df["asistentes"]]
+        df = compact_events(df.sort_values("inicio", kind="stable", ignore_index=True))
+        return self.cache.get(key, lambda: df)
+
+    def _cache_key(self, user: str, calendar_id: str, version: int) -> tuple:
+        # El primer elemento no es un calendario: invalidate() no la toca
+        return ("event_store", str(self.root), user, calendar_id, version)
+
+    def progress(self, user: str, calendar_id: str) -> dict | None:
+        """Avance de la descarga completa en curso ({'pages', 'events'}); None si no hay."""
+        descarga = self._downloads.get((user, calendar_id))
+        if descarga is None:
+            return None
+        return {"pages": descarga["pages"], "events": descarga["events"]}
+
+    def changed_ids(self, user: str, calendar_id: str, since: int) -> set[str] | None:
+        """
+        Ids añadidos, cambiados o borrados desde la versión since hasta la
+        actual; None si no se sabe (descarga completa por medio, versión muy
+        antigua o de otra carpeta) y hay que mirar toda la tabla.
+        """
+        meta = self.meta(user, calendar_id)
+        if meta is None or since > meta["version"]:
+            return None
+        cambios = {version: ids for version, ids in meta.get("changes", [])}
+        versiones = range(since + 1, meta["version"] + 1)
+        if any(v not in cambios for v in versiones):
+            return None
+        return set().union(*(cambios[v] for v in versiones))
+
+    def partial(self, user: str, calendar_id: str, timeout: float = 0) -> pd.DataFrame | None:
+        """
+        Lo descargado hasta ahora en la descarga completa en curso (páginas ya
+        normalizadas, compacto y ordenado como load()); espera como mucho
+        timeout segundos a la primera página. None si no hay descarga o aún
+        no llegó ninguna página.
+        """
+        fin = time.monotonic() + timeout
+        descarga = self._downloads.get((user, calendar_id))
+        # Recién lanzada, la descarga puede no haber empezado aún
+        while descarga is None and self.refreshing(user, calendar_id) and time.monotonic() < fin:
+            time.sleep(0.01)
+            descarga = self._downloads.get((user, calendar_id))
+        if descarga is None or not descarga["first_page"].wait(max(0.0, fin - time.monotonic())):
+            return None
+        with self._lock:
+            paginas = len(descarga["frames"])
+            cacheado = descarga.get("partial")
+            if cacheado and cacheado[0] == paginas:
+                return cacheado[1]
+            partes = descarga["frames"][:paginas]
+        if not partes:
+            return None
+        df = pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+        df = compact_events(
+            df.drop_duplicates("id", keep="last").drop(columns=DELETED_COL)
+            .sort_values("inicio", kind="stable", ignore_index=True)
+        )
+        with self._lock:
+            descarga["partial"] = (paginas, df)
+        return df
+
+    # ——————————————
+    # Escritura
+    # ——————————————
+
+    def _normalize(self, events: list[dict], calendar_id: str,
+                   deleted_ids: list[str] = ()) -> pd.DataFrame:
+        df = normalize_events(events)
+        df["calendar_id"] = calendar_id
+        df = compact_events(df)
+        df[DELETED_COL] = False
+        if deleted_ids:
+            borrados = pd.DataFrame({"id": list(deleted_ids), DELETED_COL: True})
+            df = pd.concat([df, borrados], ignore_index=True)[COLUMNS + [DELETED_COL]]
+        return df
+
+    def replace(self, user: str, calendar_id: str, events: list[dict],
+                window: tuple[str, str], sync_token: str | None,
+                series: dict[str, dict] | None = None,
+                frame: pd.DataFrame | None = None) -> None:
+        """
+        Guarda una descarga completa como base nueva y borra los deltas. Con
+        series (maestros y excepciones) el calendario queda en modo series.
+        frame son los eventos ya normalizados (p. ej. página a página).
+        """
+        carpeta = self._dir(user, calendar_id)
+        with self._lock:
+            carpeta.mkdir(parents=True, exist_ok=True)
+            anterior = self.meta(user, calendar_id) or {"version": 0, "seq": 0}
+            seq = anterior["seq"] + 1
+            base = f"base-{seq:06d}.arrow"
+            _write_arrow(carpeta / base, frame if frame is not None else self._normalize(events, calendar_id))
+            if series is not None:
+                self._save_series(carpeta, series)
+            else:
+                (carpeta / "series.json").unlink(missing_ok=True)
+            self._save_meta(carpeta, {
+                "window": list(window),
+                "sync_token": sync_token,
+                "base": base,
+                "deltas": [],
+                "seq": seq,
+                "version": anterior["version"] + 1,
+                "changes": [],
+                "updated": time.time(),
+                "series": series is not None,
+            })
+            self._remove_unused(carpeta, {base})
+            self.cache.discard(self._cache_key(user, calendar_id, anterior["version"]))
+
+    def append_delta(self, user: str, calendar_id: str, events: list[dict],
+                     deleted_ids: list[str], sync_token: str | None,
+                     series: dict[str, dict] | None = None) -> None:
+        """Añade los cambios de una sincronización incremental como un fichero nuevo."""
+        carpeta = self._dir(user, calendar_id)
+        with self._lock:
+            if series is not None:
+                self._save_series(carpeta, series)
+            meta = self.meta(user, calendar_id)
+            meta["sync_token"] = sync_token or meta["sync_token"]
+            meta["updated"] = time.time()
+            if events or deleted_ids:
+                meta["seq"] += 1
+                nombre = f"delta-{meta['seq']:06d}.arrow"
+                delta = self._normalize(events, calendar_id, deleted_ids)
+                _write_arrow(carpeta / nombre, delta)
+                meta["deltas"].append(nombre)
+                meta["version"] += 1
+                self._add_changes(meta, delta["id"].tolist())
+                self.cache.discard(self._cache_key(user, calendar_id, meta["version"] - 1))
+            self._save_meta(carpeta, meta)
+            if len(meta["deltas"]) > self.max_deltas:
+                self.compact(user, calendar_id)
+
+    def compact(self, user: str, calendar_id: str) -> None:
+        """Funde base y deltas en una base nueva."""
+        with self._lock:
+            df = self.load(user, calendar_id)
+            meta = self.meta(user, calendar_id)
+            if df is None or not meta["deltas"]:
+                return
+            carpeta = self._dir(user, calendar_id)
+            meta["seq"] += 1
+            base = f"base-{meta['seq']:06d}.arrow"
+            _write_arrow(carpeta / base, df.assign(**{DELETED_COL: False}))
+            meta.update(base=base, deltas=[], version=meta["version"] + 1)
+            self._add_changes(meta, [])  # mismos eventos, otra versión
+            self._save_meta(carpeta, meta)
+            self._remove_unused(carpeta, {base})
+            self.cache.discard(self._cache_key(user, calendar_id, meta["version"] - 1))
+            self.cache.get(self._cache_key(user, calendar_id, meta["version"]), lambda: df)
+
+    def _add_changes(self, meta: dict, ids: list[str]) -> None:
+        cambios = meta.setdefault("changes", [])
+        cambios.append([meta["version"], ids])
+        del cambios[:-MAX_CHANGES]
+
+    def _remove_unused(self, carpeta: Path, vigentes: set[str]) -> None:
+        for path in carpeta.glob("*.arrow"):
+            if path.name not in vigentes:
+                path.unlink(missing_ok=True)
+
+    # ——————————————
+    # Sincronización con Google Calendar
+    # ——————————————
+
+    def refresh(self, service, user: str, calendar_id: str,
+                time_min: datetime.datetime, time_max: datetime.datetime,
+                fields: str | None = None, series: bool | None = None) -> None:
+        """
+        Trae los cambios desde la última sincronización (o todo el rango) y
+        los guarda. Con series=True se descargan maestros y excepciones en vez
+        de cada repetición (ver recurrence); None mantiene el modo guardado.
+        Cambiar de modo descarga de nuevo todo el rango.
+        """
+        window = (time_min.isoformat() + "Z", time_max.isoformat() + "Z")
+        http = thread_http(service)
+        meta = self.meta(user, calendar_id)
+        if series is None:
+            series = bool(meta and meta.get("series"))
+        fields = fields or (SERIES_FIELDS if series else EVENT_FIELDS)
+        if (meta and meta["window"] == list(window) and meta.get("sync_token")
+                and bool(meta.get("series")) == series):
+            try:
+                items, token = list_changes(
+                    service, calendar_id, meta["sync_token"], fields=fields, http=http,
+                    single_events=not series,
+                )
+            except HttpError as e:
+                if e.resp.status != 410:
+                    raise
+            else:
+                if series:
+                    vivos, borrados, guardado = self._series_changes(
+                        user, calendar_id, items, time_min, time_max
+                    )
+                    self.append_delta(user, calendar_id, vivos, borrados, token, series=guardado)
+                    return
+                # Los cambios que salen del rango cuentan como borrados
+                vivos = [ev for ev in items
+                         if ev.get("status") != "cancelled" and in_window(ev, time_min, time_max)]
+                vivos_ids = {ev["id"] for ev in vivos}
+                borrados = [ev["id"] for ev in items if ev["id"] not in vivos_ids]
+                self.append_delta(user, calendar_id, vivos, borrados, token)
+                return
+
+        self._download(service, user, calendar_id, time_min, time_max, fields, series, http)
+
+    def _download(self, service, user: str, calendar_id: str,
+                  time_min: datetime.datetime, time_max: datetime.datetime,
+                  fields: str, series: bool, http) -> None:
+        """
+        Descarga completa del rango, normalizando cada página según llega
+        (partial() la muestra mientras tanto) y guardándola al final como
+        base. En modo series cada página se expande con las excepciones de
+        esa misma página; la base final se expande con todas.
+        """
+        key = (user, calendar_id)
+        window = (time_min.isoformat() + "Z", time_max.isoformat() + "Z")
+        descarga = {"frames": [], "pages": 0, "events": 0, "first_page": threading.Event()}
+        with self._lock:
+            self._downloads[key] = descarga
+        items = []
+        try:
+            for pagina, token in iter_changes(service, calendar_id, time_min=time_min,
+                                              time_max=time_max, fields=fields, http=http,
+                                              single_events=not series):
+                items.extend(pagina)
+                if series:
+                    vivos = list(expand_events(pagina, time_min, time_max))
+                else:
+                    vivos = [ev for ev in pagina if ev.get("status") != "cancelled"]
+                with self._lock:
+                    if vivos:
+                        descarga["frames"].append(self._normalize(vivos, calendar_id))
+                    descarga["pages"] += 1
+                    descarga["events"] += len(vivos)
+                descarga["first_page"].set()
+
+            if series:
+                maestros, excepciones, _ = split_series(items)
+                self.replace(
+                    user, calendar_id, list(expand_events(items, time_min, time_max)), window, token,
+                    series={ev["id"]: ev for ev in [*maestros.values(), *excepciones.values()]},
+                )
+            else:
+                partes = descarga["frames"]
+                frame = (compact_events(pd.concat(partes, ignore_index=True)) if len(partes) > 1
+                         else partes[0] if partes else None)
+                self.replace(user, calendar_id, [], window, token, frame=frame)
+        finally:
+            with self._lock:
+                self._downloads.pop(key, None)
+            descarga["first_page"].set()
+
+    def _series_changes(self, user: str, calendar_id: str, items: list[dict],
+                        time_min: datetime.datetime, time_max: datetime.datetime):
+        """
+        Cambios de una sincronización en modo series: (eventos vivos, ids
+        borrados, series.json actualizado). Cada serie tocada (maestro o
+        excepción) se regenera entera en el rango y sus repeticiones que ya
+        no salen cuentan como borradas.
+        """
+        guardado = self.series(user, calendar_id)
+        tocadas, sueltos = set(), []
+        for ev in items:
+            if ev.get("recurrence") or ev["id"] in guardado and not ev.get("recurringEventId"):
+                # Maestro nuevo, cambiado, cancelado o que dejó de repetirse
+                tocadas.add(ev["id"])
+                if ev.get("recurrence") and ev.get("status") != "cancelled":
+                    guardado[ev["id"]] = ev
+                else:
+                    guardado.pop(ev["id"], None)
+                    sueltos.append(ev)
+            elif ev.get("recurringEventId") and ev.get("originalStartTime"):
+                tocadas.add(ev["recurringEventId"])
+                guardado[ev["id"]] = ev
+            else:
+                sueltos.append(ev)
+        # Las excepciones de una serie cancelada se van con ella
+        guardado = {
+            i: ev for i, ev in guardado.items()
+            if ev.get("recurrence") or ev.get("recurringEventId") in guardado
+        }
+
+        vivos = list(expand_events(
+            [ev for ev in guardado.values() if (ev.get("recurringEventId") or ev["id"]) in tocadas],
+            time_min, time_max,
+        ))
+        vivos += [ev for ev in sueltos
+                  if ev.get("status") != "cancelled" and in_window(ev, time_min, time_max)]
+        vivos_ids = {ev["id"] for ev in vivos}
+        borrados = [ev["id"] for ev in sueltos if ev["id"] not in vivos_ids]
+        df = self.load(user, calendar_id)
+        if df is not None and tocadas:
+            anteriores = df.loc[df["serie"].isin(tocadas).to_numpy(), "id"]
+            borrados += [i for i in anteriores if i not in vivos_ids]
+        return vivos, borrados, guardado
+
+    def refresh_async(self, service, user: str, calendar_id: str,
+                      time_min: datetime.datetime, time_max: datetime.datetime,
+                      force: bool = False, series: bool | None = None) -> Future | None:
+        """
+        Lanza refresh() en segundo plano (uno a la vez por usuario y
+        calendario). Sin force no hace nada si se actualizó hace menos de
+        REFRESH_INTERVAL segundos. series como en refresh().
+        """
+        key = (user, calendar_id)
+        with self._lock:
+            en_curso = self._refreshing.get(key)
+            if en_curso is not None and not en_curso.done():
+                return en_curso
+            meta = self.meta(user, calendar_id)
+            if not force and meta and time.time() - meta["updated"] < REFRESH_INTERVAL:
+                return None
+            fut = self._pool.submit(self.refresh, service, user, calendar_id, time_min, time_max,
+                                    series=series)
+            self._refreshing[key] = fut
+            return fut
+
+    def refreshing(self, user: str, calendar_id: str) -> bool:
+        fut = self._refreshing.get((user, calendar_id))
+        return fut is not None and not fut.done()
+
+    def refresh_error(self, user: str, calendar_id: str) -> Exception | None:
+        """Error de la última actualización en segundo plano, si falló."""
+        fut = self._refreshing.get((user, calendar_id))
+        if fut is None or not fut.done() or fut.cancelled():
+            return None
+        return fut.exception()
+
+# Almacén del proceso, compartido por todas las sesiones (las carpetas llevan la clave de store_key)
+event_store = EventStore()
@@ -0,0 +1,158 @@
+# event_table.py
+
+import functools
+
+import numpy as np
+import pandas as pd
+
+# Textos en buffers de Arrow (sin un objeto str de Python por celda)
+STRING = pd.StringDtype("pyarrow")
+STRING_COLS = ("id", "etag", "titulo_raw", "descripcion", "detalles")
+# Columnas con pocos valores distintos: se guardan como categorías
+CATEGORY_COLS = ("codigo", "serie", "calendar_id")
+
+def compact_events(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Versión compacta del DataFrame de normalize_events: fecha en datetime64,
+    hora (desde medianoche) y duracion en timedelta64, textos en Arrow,
+    códigos/series/calendarios como categorías y las tuplas de asistentes
+    repetidas compartidas. Los textos y categorías vacíos quedan como "".
+    Las columnas que ya tienen su tipo compacto no se tocan.
+    """
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if col in STRING_COLS and s.dtype != STRING:
+            out[col] = s.fillna("").astype(STRING)
+        elif col in CATEGORY_COLS and not isinstance(s.dtype, pd.CategoricalDtype):
+            out[col] = s.fillna("").astype("category")
+        elif col == "fecha" and s.dtype == object:
+            out[col] = pd.to_datetime(s).astype("datetime64[s]")
+        elif col == "hora" and s.dtype == object:
+            # 'HH:MM' del normalizador (o Timedelta ya convertidos, al mezclar partes)
+            textos = s.fillna("00:00").astype(str)
+            textos = textos.where(textos.str.len() != 5, textos + ":00")
+            out[col] = pd.to_timedelta(textos).astype("timedelta64[s]")
+        elif col == "duracion" and s.dtype == object:
+            out[col] = pd.to_timedelta(s).astype("timedelta64[s]")
+        elif col == "asistentes":
+            # Las reuniones de una serie repiten los mismos asistentes
+            unicos = {}
+            out[col] = pd.Series([unicos.setdefault(t, t) for t in s], index=s.index, dtype=object)
+        else:
+            out[col] = s
+    return pd.DataFrame(out, index=df.index)
+
+def _format_timedelta(s: pd.Series) -> pd.Series:
+    """'HH:MM' para mostrar horas del día y duraciones."""
+    minutos = (s.dt.total_seconds() // 60).astype("Int64")
+    return (minutos // 60).astype(str).str.zfill(2) + ":" + (minutos % 60).astype(str).str.zfill(2)
+
+def display_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Copia para mostrar (una página): fechas como date, timedeltas como 'HH:MM'
+    y textos/categorías como objetos (si no, data_editor haría desplegables)."""
+    out = df.copy()
+    for col in out.columns:
+        dtype = out[col].dtype
+        if pd.api.types.is_timedelta64_dtype(dtype):
+            out[col] = _format_timedelta(out[col])
+        elif pd.api.types.is_datetime64_dtype(dtype) and col == "fecha":
+            out[col] = out[col].dt.date
+        elif isinstance(dtype, pd.CategoricalDtype) or dtype == STRING:
+            out[col] = out[col].astype(object)
+    return out
+
+class EventTable:
+    """
+    Tabla compacta de eventos con ediciones locales superpuestas.
+
+    Las ediciones (id -> {columna: valor}) viven en un dict pequeño, p. ej.
+    en st.session_state, y se aplican al leer; la tabla base no se copia.
+    """
+
+    def __init__(self, df: pd.DataFrame, overlay: dict | None = None):
+        # Las vistas usan posiciones como etiquetas: índice 0..n-1
+        if not df.index.equals(pd.RangeIndex(len(df))):
+            df = df.reset_index(drop=True)
+        self.df = df
+        self.overlay = overlay if overlay is not None else {}
+        self._pos = None
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def positions(self, ids) -> np.ndarray:
+        """Posiciones de los ids en la tabla (los que no están se ignoran)."""
+        if self._pos is None:
+            self._pos = pd.Index(self.df["id"])
+        idx = self._pos.get_indexer(list(ids))
+        return np.sort(idx[idx >= 0])
+
+    def edit(self, ids, **values) -> None:
+        for event_id in ids:
+            self.overlay.setdefault(event_id, {}).update(values)
+
+    def column(self, name: str, positions: np.ndarray | None = None) -> pd.Series:
+        """Columna (o sus filas en positions) con las ediciones aplicadas."""
+        s = self.df[name] if positions is None else self.df[name].take(positions)
+        editados = {i: e[name] for i, e in self.overlay.items() if name in e}
+        if editados:
+            ids = self.df["id"] if positions is None else self.df["id"].take(positions)
+            nuevos = ids.map(editados)
+            if nuevos.notna().any():
+                s = s.astype(object).where(nuevos.isna(), nuevos)
+        return s
+
+    def view(self, mask: np.ndarray | None = None) -> "EventView":
+        positions = np.arange(len(self.df)) if mask is None else np.flatnonzero(mask)
+        return EventView(self, positions)
+
+class EventView:
+    """
+    Filas de una EventTable por posición, sin copiar datos, más columnas
+    calculadas solo para esas filas (p. ej. sugerencias). frame() crea el
+    DataFrame solo del trozo que se va a usar (una página de la tabla).
+    """
+
+    def __init__(self, table: EventTable, positions: np.ndarray, extra: dict | None = None):
+        self.table = table
+        self.positions = positions
+        self.extra = extra or {}
+
+    @classmethod
+    def of(cls, df: pd.DataFrame) -> "EventView":
+        return EventTable(df).view()
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @functools.cached_property
+    def ids(self) -> np.ndarray:
+        return self.table.df["id"].take(self.positions).to_numpy()
+
+    def column(self, name: str) -> pd.Series:
+        if name in self.extra:
+            return pd.Series(self.extra[name], index=self.positions)
+        return self.table.column(name, self.positions)
+
+    def with_columns(self, **columns) -> "EventView":
+        """Vista con columnas calculadas (alineadas con las filas de la vista)."""
+        extra = dict(self.extra)
+        extra.update({k: np.asarray(v) for k, v in columns.items()})
+        return EventView(self.table, self.positions, extra)
+
+    def subset(self, ids) -> "EventView":
+        """Filas de la vista cuyo id está en ids."""
+        keep = np.isin(self.ids, list(ids))
+        return EventView(
+            self.table, self.positions[keep], {k: v[keep] for k, v in self.extra.items()}
+        )
+
+    def frame(self, columns: list[str], start: int = 0, stop: int | None = None) -> pd.DataFrame:
+        """DataFrame de las filas [start, stop) de la vista, indexado por posición en la tabla."""
+        trozo = EventView(
+            self.table, self.positions[start:stop], {k: v[start:stop] for k, v in self.extra.items()}
+        )
+        return pd.DataFrame(
+            {col: trozo.column(col) for col in columns}, index=trozo.positions
+        )
@@ -0,0 +1,305 @@
+# gcal_async.py
+#
+# Cliente asíncrono de Google Calendar sobre httpx, con un AsyncClient
+# compartido (pool de conexiones, keep-alive y HTTP/2) y una fachada
+# síncrona compatible con el 'service' de googleapiclient, para que las
+# funciones de gcal_client y las páginas lo usen sin cambios.
+
+import asyncio
+import importlib.util
+import json
+import os
+import threading
+import urllib.parse
+import uuid
+import weakref
+
+import httpx
+import httplib2
+from googleapiclient.errors import HttpError
+
+# Otra raíz (p. ej. el servidor falso de benchmarks/fake_calendar) para pruebas de carga
+ROOT_URL = os.environ.get("NEO_BRAIN_GOOGLE_API_URL", "https://www.googleapis.com")
+BATCH_PATH_PREFIX = "/calendar/v3"
+
+# HTTP/2 solo si está instalado h2 (httpx[http2])
+HTTP2 = importlib.util.find_spec("h2") is not None
+LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+def shared_client() -> httpx.AsyncClient:
+    """AsyncClient compartido del event loop en curso (uno por loop)."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(http2=HTTP2, limits=LIMITS, timeout=TIMEOUT)
+        _clients[loop] = client
+    return client
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """Event loop del proceso en un hilo propio, donde vive el cliente compartido."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="gcal-httpx", daemon=True).start()
+            _loop = loop
+    return _loop
+
+def run_sync(coro):
+    """Ejecuta una corrutina en el loop compartido y espera su resultado."""
+    return asyncio.run_coroutine_threadsafe(coro, background_loop()).result()
+
+def _encode_params(params: dict | None) -> dict:
+    """Quita los None y pasa los bool a 'true'/'false' como espera la API."""
+    out = {}
+    for k, v in (params or {}).items():
+        if v is None:
+            continue
+        out[k] = ("true" if v else "false") if isinstance(v, bool) else v
+    return out
+
+def _quote(value: str) -> str:
+    return urllib.parse.quote(value, safe="")
+
+def _http_error(status: int, content: bytes, uri: str) -> HttpError:
+    """HttpError de googleapiclient, para que el manejo de errores sea el mismo."""
+    return HttpError(httplib2.Response({"status": str(status)}), content, uri=uri)
+
+def _json_body(resp, content: bytes) -> dict:
+    return json.loads(content) if content else {}
+
+def _parse_batch(content_type: str, body: bytes, n: int, uri: str) -> list[tuple]:
+    """Separa la respuesta multipart de un lote en (respuesta, error) por sub-petición."""
+    boundary = content_type.split("boundary=", 1)[1].strip('"')
+    resultados = [(None, _http_error(500, b"Missing batch response", uri))] * n
+    texto = body.decode("utf-8").replace("\r\n", "\n")
+    for parte in texto.split(f"--{boundary}"):
+        parte = parte.strip("\n")
+        if not parte or parte == "--":
+            continue
+        cabeceras, _, mensaje = parte.partition("\n\n")
+        content_id = next(
+            (l.split(":", 1)[1].strip() for l in cabeceras.split("\n")
+             if l.lower().startswith("content-id:")),
+            ""
+        )
+        i = int(content_id.strip("<>").rsplit("-", 1)[1])
+        estado, _, resto = mensaje.partition("\n")
+        _, _, cuerpo = resto.partition("\n\n")
+        status = int(estado.split()[1])
+        if status >= 400:
+            resultados[i] = (None, _http_error(status, cuerpo.encode(), uri))
+        else:
+            resultados[i] = (json.loads(cuerpo) if cuerpo.strip() else {}, None)
+    return resultados
+
+class AsyncCalendarClient:
+    """
+    Métodos async de events() sobre el AsyncClient compartido. root_url
+    permite apuntar a otro servidor (p. ej. el falso de benchmarks/).
+    """
+
+    def __init__(self, access_token: str, client: httpx.AsyncClient | None = None,
+                 root_url: str = ROOT_URL):
+        self.access_token = access_token
+        self._client = client
+        self.base_url = root_url + BATCH_PATH_PREFIX
+        self.batch_url = root_url + "/batch/calendar/v3"
+
+    def _auth(self, headers: dict | None = None) -> dict:
+        return {"Authorization": f"Bearer {self.access_token}", **(headers or {})}
+
+    async def request_raw(self, method: str, path: str, params: dict | None = None,
+                          body: dict | None = None, headers: dict | None = None) -> httpx.Response:
+        client = self._client or shared_client()
+        resp = await client.request(
+            method, self.base_url + path,
+            params=_encode_params(params),
+            json=body,
+            headers=self._auth(headers),
+        )
+        if resp.status_code >= 400:
+            raise _http_error(resp.status_code, resp.content, str(resp.url))
+        return resp
+
+    async def request(self, method: str, path: str, params: dict | None = None,
+                      body: dict | None = None, headers: dict | None = None) -> dict:
+        resp = await self.request_raw(method, path, params, body, headers)
+        return _json_body(resp, resp.content)
+
+    async def list_page(self, calendar_id: str = "primary", **params) -> dict:
+        return await self.request("GET", f"/calendars/{_quote(calendar_id)}/events", params)
+
+    async def iter_pages(self, calendar_id: str = "primary", **params):
+        """Itera las páginas de events().list a medida que llegan."""
+        page_token = None
+        while True:
+            resp = await self.list_page(calendar_id, pageToken=page_token, **params)
+            yield resp
+            page_token = resp.get("nextPageToken")
+            if not page_token:
+                return
+
+    async def list_events(self, calendar_id: str = "primary", **params) -> list[dict]:
+        events = []
+        async for resp in self.iter_pages(calendar_id, **params):
+            events.extend(resp.get("items", []))
+        return events
+
+    async def get_event(self, calendar_id: str, event_id: str, **params) -> dict:
+        path = f"/calendars/{_quote(calendar_id)}/events/{_quote(event_id)}"
+        return await self.request("GET", path, params)
+
+    async def insert_event(self, calendar_id: str, body: dict, **params) -> dict:
+        return await self.request("POST", f"/calendars/{_quote(calendar_id)}/events", params, body)
+
+    async def patch_event(self, calendar_id: str, event_id: str, body: dict,
+                          etag: str | None = None, **params) -> dict:
+        path = f"/calendars/{_quote(calendar_id)}/events/{_quote(event_id)}"
+        headers = {"If-Match": etag} if etag else None
+        return await self.request("PATCH", path, params, body, headers)
+
+    async def update_event(self, calendar_id: str, event_id: str, body: dict,
+                           etag: str | None = None, **params) -> dict:
+        path = f"/calendars/{_quote(calendar_id)}/events/{_quote(event_id)}"
+        headers = {"If-Match": etag} if etag else None
+        return await self.request("PUT", path, params, body, headers)
+
+    async def batch(self, items: list[tuple]) -> list[tuple]:
+        """
+        Envía varias peticiones (method, path, params, body, headers) en un
+        solo lote multipart. Devuelve (respuesta, error) para cada una, en orden.
+        """
+        boundary = f"batch_{uuid.uuid4().hex}"
+        partes = []
+        for i, (method, path, params, body, headers) in enumerate(items):
+            query = urllib.parse.urlencode(_encode_params(params))
+            lineas = [
+                f"--{boundary}",
+                "Content-Type: application/http",
+                f"Content-ID: <item-{i}>",
+                "",
+                f"{method} {BATCH_PATH_PREFIX}{path}{'?' + query if query else ''}",
+            ]
+            lineas += [f"{k}: {v}" for k, v in (headers or {}).items()]
+            if body is not None:
+                lineas += ["Content-Type: application/json", "", json.dumps(body)]
+            else:
+                lineas.append("")
+            partes.append("\r\n".join(lineas))
+        payload = "\r\n".join(partes) + f"\r\n--{boundary}--\r\n"
+
+        client = self._client or shared_client()
+        resp = await client.post(
+            self.batch_url,
+            content=payload.encode("utf-8"),
+            headers=self._auth({"Content-Type": f"multipart/mixed; boundary={boundary}"}),
+        )
+        if resp.status_code >= 400:
+            raise _http_error(resp.status_code, resp.content, self.batch_url)
+        return _parse_batch(resp.headers["content-type"], resp.content, len(items), self.batch_url)
+
+# ——————————————
+# Fachada síncrona con la forma del 'service' de googleapiclient
+# ——————————————
+
+class _Request:
+    """Equivalente a HttpRequest: se construye y luego se ejecuta con execute()."""
+
+    def __init__(self, client: AsyncCalendarClient, method: str, path: str,
+                 params: dict | None = None, body: dict | None = None):
+        self._client = client
+        self.method = method
+        self.path = path
+        self.params = params or {}
+        self.body = body
+        self.headers: dict = {}
+        # Como en HttpRequest: postproc(resp, content) convierte la respuesta
+        self.postproc = _json_body
+
+    @property
+    def uri(self) -> str:
+        query = urllib.parse.urlencode(_encode_params(self.params))
+        return f"{self._client.base_url}{self.path}{'?' + query if query else ''}"
+
+    def execute(self, http=None, num_retries: int = 0) -> dict:
+        resp = run_sync(self._client.request_raw(
+            self.method, self.path, self.params, self.body, self.headers
+        ))
+        return self.postproc(resp, resp.content)
+
+class _Events:
+    def __init__(self, client: AsyncCalendarClient):
+        self._client = client
+
+    def _path(self, calendarId: str, eventId: str | None = None) -> str:
+        path = f"/calendars/{_quote(calendarId)}/events"
+        return f"{path}/{_quote(eventId)}" if eventId else path
+
+    def list(self, calendarId: str, **params) -> _Request:
+        return _Request(self._client, "GET", self._path(calendarId), params)
+
+    def get(self, calendarId: str, eventId: str, **params) -> _Request:
+        return _Request(self._client, "GET", self._path(calendarId, eventId), params)
+
+    def insert(self, calendarId: str, body: dict, **params) -> _Request:
+        return _Request(self._client, "POST", self._path(calendarId), params, body)
+
+    def patch(self, calendarId: str, eventId: str, body: dict, **params) -> _Request:
+        return _Request(self._client, "PATCH", self._path(calendarId, eventId), params, body)
+
+    def update(self, calendarId: str, eventId: str, body: dict, **params) -> _Request:
+        return _Request(self._client, "PUT", self._path(calendarId, eventId), params, body)
+
+    def watch(self, calendarId: str, body: dict, **params) -> _Request:
+        return _Request(self._client, "POST", self._path(calendarId) + "/watch", params, body)
+
+class _Channels:
+    def __init__(self, client: AsyncCalendarClient):
+        self._client = client
+
+    def stop(self, body: dict) -> _Request:
+        return _Request(self._client, "POST", "/channels/stop", None, body)
+
+class _Batch:
+    """Equivalente a BatchHttpRequest: add() y luego execute() con callbacks."""
+
+    def __init__(self, client: AsyncCalendarClient, callback=None):
+        self._client = client
+        self._callback = callback
+        self._items: list[tuple] = []
+
+    def add(self, request: _Request, callback=None, request_id: str | None = None):
+        request_id = request_id if request_id is not None else str(len(self._items))
+        self._items.append((request_id, callback or self._callback, request))
+
+    def execute(self, http=None):
+        if not self._items:
+            return
+        resultados = run_sync(self._client.batch([
+            (r.method, r.path, r.params, r.body, r.headers) for _, _, r in self._items
+        ]))
+        for (request_id, callback, _), (response, error) in zip(self._items, resultados):
+            if callback:
+                callback(request_id, response, error)
+
+class CalendarService:
+    """Fachada síncrona: se usa igual que build('calendar', 'v3'), pero es thread-safe."""
+
+    def __init__(self, access_token: str, client: httpx.AsyncClient | None = None,
+                 root_url: str = ROOT_URL):
+        self.client = AsyncCalendarClient(access_token, client, root_url)
+
+    def events(self) -> _Events:
+        return _Events(self.client)
+
+    def channels(self) -> _Channels:
+        return _Channels(self.client)
+
+    def new_batch_http_request(self, callback=None) -> _Batch:
+        return _Batch(self.client, callback)
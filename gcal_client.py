@@ -1,72 +1,489 @@
 # gcal_client.py
 
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
 from httpx_oauth.oauth2 import OAuth2Token
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import datetime
+import functools
+import google_auth_httplib2
+import httplib2
+import json
+import random
+import time
+from collections.abc import Iterator
 
-def build_credentials(token: OAuth2Token) -> Credentials:
+from metrics import metrics
+from recurrence import expand_events
+from rate_limiter import RequestScheduler, get_scheduler, is_retryable, is_throttled
+
+# Calendar acepta hasta 1000 llamadas por lote, pero a partir de ~50 empiezan
+# los rateLimitExceeded; 50 es el tamaño que recomienda Google en la práctica.
+BATCH_LIMIT = 50
+
+# Tamaño máximo de página que acepta events().list
+MAX_PAGE_SIZE = 2500
+# Calendarios que se descargan a la vez cuando se piden varios
+MAX_PARALLEL_CALENDARS = 4
+# Campos de evento que usan las páginas (normalize_events, sugerencias) y la sincronización
+EVENT_FIELDS = (
+    "id,etag,status,summary,description,start,end,"
+    "recurringEventId,attendees(email,self)"
+)
+# En modo series (singleEvents=False) hacen falta además las reglas y el
+# inicio original de cada excepción
+SERIES_FIELDS = EVENT_FIELDS + ",recurrence,originalStartTime"
+
+def _fields_mask(event_fields: str | None) -> str | None:
+    """Máscara 'fields' para events().list a partir de los campos de cada evento."""
+    if not event_fields:
+        return None
+    return f"nextPageToken,nextSyncToken,items({event_fields})"
+
+def build_credentials(token: OAuth2Token,
+                      client_id: str | None = None,
+                      client_secret: str | None = None) -> Credentials:
+    """
+    Credenciales de google-auth a partir del token OAuth. Con client_id y
+    client_secret google-auth puede renovar por sí mismo el access token.
+    """
+    expiry = None
+    if "expires_at" in token:
+        expiry = datetime.datetime.utcfromtimestamp(token["expires_at"])
     return Credentials(
         token=token["access_token"],
         refresh_token=token.get("refresh_token"),
         token_uri="https://oauth2.googleapis.com/token",
-        client_id=None,
-        client_secret=None,
-        scopes=token.get("scope").split()
+        client_id=client_id,
+        client_secret=client_secret,
+        scopes=token.get("scope").split(),
+        expiry=expiry
     )
 
+@functools.lru_cache(maxsize=None)
+def _discovery_document(api_name: str, api_version: str) -> dict | None:
+    """
+    Documento de descubrimiento estático (incluido en googleapiclient),
+    parseado una vez por proceso. build_from_document solo le añade los
+    parámetros estándar de forma idempotente, así que puede compartirse.
+    """
+    doc = discovery_cache.get_static_doc(api_name, api_version)
+    return json.loads(doc) if doc else None
+
 def build_service(creds: Credentials,
                   api_name: str = "calendar",
                   api_version: str = "v3"):
-    return build(api_name, api_version, credentials=creds)
+    doc = _discovery_document(api_name, api_version)
+    if doc is None:
+        # API sin copia estática: se descarga el documento de descubrimiento
+        return build(api_name, api_version, credentials=creds)
+    return build_from_document(doc, credentials=creds)
+
+def get_service(token: OAuth2Token,
+                session,
+                api_name: str = "calendar",
+                api_version: str = "v3",
+                backend: str = "googleapiclient",
+                client_id: str | None = None,
+                client_secret: str | None = None):
+    """
+    Devuelve el servicio guardado en la sesión (p. ej. st.session_state).
+
+    Solo se reconstruyen credenciales y servicio cuando cambia el token, así
+    los reruns de Streamlit no pagan la construcción del cliente. Con
+    backend="httpx" (solo Calendar) se usa gcal_async.CalendarService, que
+    comparte un pool de conexiones entre todas las sesiones y es thread-safe.
+    El servicio lleva el planificador de llamadas del usuario (rate_limiter).
+    Con client_id y client_secret (los del cliente OAuth) las credenciales
+    de googleapiclient renuevan solas el access token al caducar.
+    """
+    key = (token["access_token"], api_name, api_version, backend)
+    if session.get("_gcal_service_key") != key:
+        if backend == "httpx":
+            from gcal_async import CalendarService
+            session["_gcal_service"] = CalendarService(token["access_token"])
+        else:
+            creds = build_credentials(token, client_id, client_secret)
+            session["_gcal_service"] = build_service(creds, api_name, api_version)
+        session["_gcal_service"].scheduler = get_scheduler(session.get("user_email"))
+        session["_gcal_service_key"] = key
+    return session["_gcal_service"]
+
+def scheduler_for(service) -> RequestScheduler:
+    """Planificador del servicio; los creados fuera de get_service usan el compartido."""
+    return getattr(service, "scheduler", None) or get_scheduler(None)
+
+def _execute(service, request, method: str, http=None, cost: int = 1):
+    """
+    request.execute() a través del planificador del usuario, anotando en
+    metrics la latencia (con esperas y reintentos), los bytes de respuesta,
+    los reintentos y los eventos recibidos o sub-peticiones del lote.
+    """
+    medidas = {"intentos": 0, "bytes": 0}
+    postproc = getattr(request, "postproc", None)
+    if postproc is not None:  # los lotes no tienen postproc
+        def contar_bytes(resp, content):
+            medidas["bytes"] += len(content or b"")
+            return postproc(resp, content)
+        request.postproc = contar_bytes
+
+    def intento():
+        medidas["intentos"] += 1
+        return request.execute() if http is None else request.execute(http=http)
+
+    t0 = time.perf_counter()
+    error = resp = None
+    try:
+        resp = scheduler_for(service).call(intento, cost=cost)
+        return resp
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        items = len(resp.get("items", ())) if isinstance(resp, dict) and "items" in resp else cost
+        metrics.record_call(
+            method, time.perf_counter() - t0,
+            bytes=medidas["bytes"],
+            retries=max(0, medidas["intentos"] - 1),
+            items=items,
+            error=error,
+        )
 
 def list_events(service,
-                calendar_id: str = "primary",
+                calendar_id: str | list[str] = "primary",
                 time_min: datetime.datetime = None,
                 time_max: datetime.datetime = None,
-                max_results: int = 250) -> list[dict]:
-    """Lista eventos en un rango, gestionando paginación."""
+                max_results: int = 250,
+                fields: str | None = None,
+                max_workers: int = MAX_PARALLEL_CALENDARS,
+                errors: dict | None = None,
+                http=None,
+                single_events: bool = True) -> list[dict]:
+    """
+    Lista eventos en un rango, gestionando paginación.
+
+    fields limita los campos devueltos por evento (p. ej. EVENT_FIELDS) y
+    max_results puede subirse hasta MAX_PAGE_SIZE para pedir menos páginas.
+    Con single_events=False se piden solo los maestros de las series y sus
+    excepciones (fields debe incluir los de SERIES_FIELDS) y las
+    repeticiones del rango se generan en local (recurrence.expand_events).
+
+    Si calendar_id es una lista, los calendarios se descargan en paralelo
+    (como mucho max_workers a la vez) y cada evento lleva su 'calendar_id'.
+    Un calendario que falla no aborta el resto: su excepción se guarda en
+    errors[calendar_id] si se pasa el dict. http permite usar otra conexión
+    (ver thread_http) al llamar desde un hilo.
+    """
     if time_min is None:
         time_min = datetime.datetime.utcnow()
     if time_max is None:
         time_max = time_min + datetime.timedelta(days=7)
 
-    iso_min = time_min.isoformat() + "Z"
-    iso_max = time_max.isoformat() + "Z"
+    params = {
+        "timeMin":      time_min.isoformat() + "Z",
+        "timeMax":      time_max.isoformat() + "Z",
+        "singleEvents": single_events,
+        "maxResults":   min(max_results, MAX_PAGE_SIZE),
+    }
+    if single_events:
+        params["orderBy"] = "startTime"  # Calendar solo lo admite con singleEvents
+    mask = _fields_mask(fields)
+    if mask:
+        params["fields"] = mask
 
+    if isinstance(calendar_id, str):
+        items = _list_all_pages(service, http=http, calendarId=calendar_id, **params)[0]
+    else:
+        items = _list_calendars(service, calendar_id, params, max_workers, errors)
+    if single_events:
+        return items
+    return sorted(expand_events(items, time_min, time_max), key=event_time)
+
+def calendar_access_role(service, calendar_id: str, http=None) -> str:
+    """
+    Rol del usuario del servicio en el calendario: 'owner', 'writer',
+    'reader', 'freeBusyReader' o 'none' (una página de un evento, sin items).
+    """
+    resp = _execute(
+        service,
+        service.events().list(calendarId=calendar_id, maxResults=1, fields="accessRole"),
+        "events.list", http=http,
+    )
+    return resp.get("accessRole") or "none"
+
+def watch_events(service, calendar_id: str, address: str, channel_id: str,
+                 token: str | None = None, ttl: int | None = None) -> dict:
+    """
+    Abre un canal de events().watch: Calendar avisará con un POST a address
+    (https) cada vez que cambie un evento del calendario. Devuelve el canal
+    con su 'resourceId' y 'expiration' (milisegundos epoch).
+    """
+    body = {"id": channel_id, "type": "web_hook", "address": address}
+    if token:
+        body["token"] = token
+    if ttl:
+        body["params"] = {"ttl": str(int(ttl))}
+    return _execute(service, service.events().watch(calendarId=calendar_id, body=body), "events.watch")
+
+def stop_channel(service, channel_id: str, resource_id: str) -> None:
+    """Cierra un canal abierto con watch_events."""
+    _execute(
+        service,
+        service.channels().stop(body={"id": channel_id, "resourceId": resource_id}),
+        "channels.stop",
+    )
+
+def thread_http(service):
+    """
+    Http propio para un hilo: httplib2 no es thread-safe, así que cada hilo
+    usa una conexión nueva con las mismas credenciales del servicio.
+    """
+    creds = getattr(getattr(service, "_http", None), "credentials", None)
+    if creds is None:
+        return None  # p. ej. HttpMock: se usa el http del propio servicio
+    return google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http())
+
+def _list_calendars(service,
+                    calendar_ids: list[str],
+                    params: dict,
+                    max_workers: int,
+                    errors: dict | None) -> list[dict]:
+    """Descarga varios calendarios en paralelo y fusiona sus eventos."""
+    def fetch(cal_id):
+        items, _ = _list_all_pages(
+            service, http=thread_http(service), calendarId=cal_id, **params
+        )
+        for ev in items:
+            ev["calendar_id"] = cal_id
+        return items
+
+    calendar_ids = list(dict.fromkeys(calendar_ids))
+    if not calendar_ids:
+        return []
     events = []
-    page_token = None
+    workers = max(1, min(max_workers, len(calendar_ids)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch, cal_id): cal_id for cal_id in calendar_ids}
+        for fut in as_completed(futures):
+            try:
+                events.extend(fut.result())
+            except Exception as e:
+                if errors is not None:
+                    errors[futures[fut]] = e
+    events.sort(key=event_time)
+    return events
 
+def _iter_pages(service, http=None, **params) -> Iterator[dict]:
+    """Respuestas de events().list según llegan; la última trae el nextSyncToken."""
+    page_token = None
+    events = service.events()
     while True:
-        resp = service.events().list(
-            calendarId=calendar_id,
-            timeMin=iso_min,
-            timeMax=iso_max,
-            singleEvents=True,
-            orderBy="startTime",
-            maxResults=max_results,
-            pageToken=page_token
-        ).execute()
-        events.extend(resp.get("items", []))
+        resp = _execute(service, events.list(pageToken=page_token, **params),
+                        "events.list", http=http)
+        yield resp
         page_token = resp.get("nextPageToken")
         if not page_token:
-            break
+            return
 
-    return events
+def _list_all_pages(service, http=None, **params) -> tuple[list[dict], str | None]:
+    """Recorre todas las páginas de events().list; devuelve (items, nextSyncToken)."""
+    items = []
+    for resp in _iter_pages(service, http=http, **params):
+        items.extend(resp.get("items", []))
+    return items, resp.get("nextSyncToken")
+
+def iter_event_pages(service,
+                     calendar_id: str = "primary",
+                     time_min: datetime.datetime = None,
+                     time_max: datetime.datetime = None,
+                     max_results: int = MAX_PAGE_SIZE,
+                     fields: str | None = None,
+                     http=None) -> Iterator[list[dict]]:
+    """
+    Como list_events para un calendario, pero devuelve cada página en cuanto
+    llega (en orden de inicio), para pintar los primeros eventos sin esperar
+    al resto. La variante asíncrona es gcal_async.AsyncCalendarClient.iter_pages.
+    """
+    if time_min is None:
+        time_min = datetime.datetime.utcnow()
+    if time_max is None:
+        time_max = time_min + datetime.timedelta(days=7)
+    params = {
+        "calendarId":   calendar_id,
+        "timeMin":      time_min.isoformat() + "Z",
+        "timeMax":      time_max.isoformat() + "Z",
+        "singleEvents": True,
+        "orderBy":      "startTime",
+        "maxResults":   min(max_results, MAX_PAGE_SIZE),
+    }
+    mask = _fields_mask(fields)
+    if mask:
+        params["fields"] = mask
+    for resp in _iter_pages(service, http=http, **params):
+        yield resp.get("items", [])
+
+def event_time(ev: dict, field: str = "start") -> datetime.datetime:
+    """Inicio/fin del evento como datetime con zona (los de día completo en UTC)."""
+    value = ev.get(field, {}).get("dateTime") or ev.get(field, {}).get("date")
+    dt = datetime.datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt
+
+def list_changes(service,
+                 calendar_id: str = "primary",
+                 sync_token: str | None = None,
+                 time_min: datetime.datetime = None,
+                 time_max: datetime.datetime = None,
+                 fields: str | None = EVENT_FIELDS,
+                 http=None,
+                 single_events: bool = True) -> tuple[list[dict], str | None]:
+    """
+    Una pasada de sincronización de events().list; devuelve (items, nextSyncToken).
+    iter_changes da lo mismo página a página.
+    """
+    items = []
+    for pagina, token in iter_changes(service, calendar_id, sync_token, time_min, time_max,
+                                      fields, http, single_events):
+        items.extend(pagina)
+    return items, token
+
+def iter_changes(service,
+                 calendar_id: str = "primary",
+                 sync_token: str | None = None,
+                 time_min: datetime.datetime = None,
+                 time_max: datetime.datetime = None,
+                 fields: str | None = EVENT_FIELDS,
+                 http=None,
+                 single_events: bool = True) -> Iterator[tuple[list[dict], str | None]]:
+    """
+    Sincronización de events().list página a página: (items, nextSyncToken),
+    con el token solo en la última página (None en las demás).
+
+    Con sync_token solo llegan los eventos cambiados o borrados (status
+    'cancelled') desde esa sincronización, en cualquier fecha; sin él se
+    descarga el rango [time_min, time_max]. Si el token caducó Google
+    responde 410 Gone (HttpError) y hay que volver a descargar el rango.
+    Con single_events=False llegan maestros y excepciones en vez de las
+    repeticiones (el sync token vale solo para el mismo modo).
+    """
+    params = {"calendarId": calendar_id, "singleEvents": single_events, "maxResults": MAX_PAGE_SIZE}
+    mask = _fields_mask(fields)
+    if mask:
+        params["fields"] = mask
+    if sync_token:
+        params["syncToken"] = sync_token
+    else:
+        params["timeMin"] = time_min.isoformat() + "Z"
+        params["timeMax"] = time_max.isoformat() + "Z"
+    for resp in _iter_pages(service, http=http, **params):
+        yield resp.get("items", []), resp.get("nextSyncToken")
+
+def in_window(ev: dict, time_min: datetime.datetime, time_max: datetime.datetime) -> bool:
+    """True si el evento se solapa con [time_min, time_max] (naive = UTC)."""
+    lo = time_min.replace(tzinfo=datetime.timezone.utc)
+    hi = time_max.replace(tzinfo=datetime.timezone.utc)
+    return event_time(ev, "end") >= lo and event_time(ev, "start") <= hi
 
 def upsert_event(service,
                  event_body: dict,
                  calendar_id: str = "primary",
-                 event_id: str | None = None) -> dict:
-    """Inserta o actualiza un evento según event_id."""
-    if event_id:
-        return service.events().update(
+                 event_id: str | None = None,
+                 method: str = "update",
+                 etag: str | None = None) -> dict:
+    """
+    Inserta o actualiza un evento según event_id. Con method="patch" solo se
+    envían los campos de event_body; etag se manda como If-Match para no
+    pisar cambios hechos después de descargar el evento.
+    """
+    if not event_id:
+        method = "insert"
+        request = service.events().insert(
             calendarId=calendar_id,
-            eventId=event_id,
             body=event_body
-        ).execute()
+        )
     else:
-        return service.events().insert(
+        request = getattr(service.events(), method)(
             calendarId=calendar_id,
+            eventId=event_id,
             body=event_body
-        ).execute()
+        )
+    if etag:
+        request.headers["If-Match"] = etag
+    return _execute(service, request, f"events.{method}")
+
+def _build_write_request(events, write: dict, calendar_id: str):
+    """Petición de una escritura; events es service.events(), que se construye una vez."""
+    calendar_id = write.get("calendar_id") or calendar_id
+    method = write.get("method") or ("update" if write.get("event_id") else "insert")
+    if method == "insert":
+        return events.insert(calendarId=calendar_id, body=write["body"])
+    request = getattr(events, method)(
+        calendarId=calendar_id,
+        eventId=write["event_id"],
+        body=write["body"]
+    )
+    if write.get("etag"):
+        request.headers["If-Match"] = write["etag"]
+    return request
+
+def batch_write_events(service,
+                       writes: list[dict],
+                       calendar_id: str = "primary",
+                       batch_size: int = BATCH_LIMIT,
+                       max_retries: int = 3) -> list[dict]:
+    """
+    Envía escrituras de eventos en lotes multipart (una petición HTTP por lote).
+
+    Cada escritura es un dict con 'body', 'event_id' (opcional), 'method'
+    ('insert', 'update' o 'patch'; por defecto igual que upsert_event) y,
+    opcionalmente, 'etag' (If-Match) y 'calendar_id' (si no, calendar_id).
+    Ver write_planner.plan_writes. Un 412 indica que el evento cambió en
+    Calendar desde que se descargó y no se reintenta.
+    Devuelve un resultado por escritura, en el mismo orden, con 'ok',
+    'event_id', 'response' y 'error'. Solo se reintentan las sub-peticiones
+    que fallaron por cuota o error del servidor; cada lote gasta del ritmo
+    del usuario tantas llamadas como escrituras lleva.
+    """
+    scheduler = scheduler_for(service)
+    # Con googleapiclient cada service.events() reconstruye el recurso (~10 ms)
+    events = service.events()
+    batch_size = max(1, min(batch_size, BATCH_LIMIT))
+    results = [
+        {"ok": False, "event_id": w.get("event_id"), "response": None, "error": None}
+        for w in writes
+    ]
+    pendientes = list(range(len(writes)))
+
+    for intento in range(max_retries + 1):
+        reintentar = []
+
+        def callback(request_id, response, exception):
+            i = int(request_id)
+            if exception is None:
+                results[i].update(ok=True, response=response, error=None)
+                if response:
+                    results[i]["event_id"] = response.get("id", results[i]["event_id"])
+            else:
+                results[i].update(ok=False, error=exception)
+                if is_throttled(exception):
+                    scheduler.bucket.on_throttle()
+                if is_retryable(exception):
+                    reintentar.append(i)
+
+        for start in range(0, len(pendientes), batch_size):
+            batch = service.new_batch_http_request(callback=callback)
+            lote = pendientes[start:start + batch_size]
+            for i in lote:
+                batch.add(_build_write_request(events, writes[i], calendar_id),
+                          request_id=str(i))
+            _execute(service, batch, "batch", cost=len(lote))
+
+        if not reintentar or intento == max_retries:
+            break
+        # Backoff exponencial con jitter antes de reenviar solo los fallidos
+        time.sleep(min(32, 2 ** intento) + random.random())
+        pendientes = sorted(reintentar)
+
+    return results
@@ -0,0 +1,195 @@
+# hours_report.py
+#
+# Horas por código, semana y usuario a partir de la tabla compacta de
+# eventos (event_table.compact_events / event_store.load). Los totales se
+# mantienen al día por diferencias: con cada versión del almacén solo se
+# recalculan, restan y suman las reuniones de sus deltas. Las exportaciones
+# (CSV o Parquet) se escriben por trozos, un usuario cada vez, sin juntar
+# todo en memoria.
+
+import os
+import threading
+from collections.abc import Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from event_store import event_store
+
+# Filas por trozo al exportar
+CHUNK_ROWS = 50_000
+KEY = ["usuario", "codigo", "semana"]
+EXPORT_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("usuario", pa.string()),
+    ("fecha", pa.timestamp("s")),
+    ("semana", pa.timestamp("s")),
+    ("codigo", pa.string()),
+    ("titulo", pa.string()),
+    ("horas", pa.float64()),
+])
+
+def event_hours(df: pd.DataFrame, user: str) -> pd.DataFrame:
+    """
+    Horas de cada reunión con código (índice: id del evento), con la semana
+    como su lunes. Los eventos de día completo (desde medianoche y de días
+    enteros) no cuentan como horas trabajadas.
+    """
+    dia_completo = (
+        (df["hora"] == pd.Timedelta(0)) & (df["duracion"] % pd.Timedelta(days=1) == pd.Timedelta(0))
+    ).to_numpy()
+    sub = df[(df["codigo"] != "").to_numpy() & ~dia_completo]
+    return pd.DataFrame({
+        "usuario": user,
+        "fecha": sub["fecha"].to_numpy(),
+        "semana": (sub["fecha"] - pd.to_timedelta(sub["fecha"].dt.weekday, unit="D")).to_numpy(),
+        "codigo": sub["codigo"].to_numpy(dtype=object),
+        "titulo": sub["titulo_raw"].to_numpy(dtype=object),
+        "horas": sub["duracion"].dt.total_seconds().to_numpy() / 3600,
+    }, index=pd.Index(sub["id"].to_numpy(dtype=object), name="id"))
+
+class HoursAggregator:
+    """
+    Totales de horas por (usuario, código, semana), por diferencias.
+
+    update() compara la tabla con la anterior de la misma fuente (usuario,
+    calendario) y aplica a los totales solo las reuniones nuevas, borradas
+    o con otro código, fecha o duración; con la misma versión no hace nada.
+    Con changes (versión anterior -> ids cambiados desde entonces, o None)
+    solo se calculan las horas de esas filas en vez de toda la tabla;
+    update_store() lo saca de los deltas del almacén.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._eventos: dict[tuple, pd.DataFrame] = {}   # fuente -> event_hours
+        self._versiones: dict[tuple, object] = {}
+        self._totales = pd.Series(
+            dtype=float, index=pd.MultiIndex.from_tuples([], names=KEY), name="horas"
+        )
+
+    def update(self, user: str, df: pd.DataFrame, source: str = "",
+               version=None, changes=None) -> "HoursAggregator":
+        fuente = (user, source)
+        with self._lock:
+            anterior = self._versiones.get(fuente)
+            if version is not None and anterior == version:
+                return self
+            ids = None
+            if changes is not None and version is not None and anterior is not None:
+                ids = changes(anterior)
+            viejo = self._eventos.get(fuente)
+            if ids is None or viejo is None:
+                nuevo = event_hours(df, user)
+                nuevo = nuevo[~nuevo.index.duplicated(keep="last")]
+                viejo = nuevo.iloc[:0] if viejo is None else viejo
+                eventos = nuevo
+            else:
+                # Solo las filas de los deltas; el resto sigue como estaba
+                ids = list(ids)
+                nuevo = event_hours(df[df["id"].isin(ids).to_numpy()], user)
+                nuevo = nuevo[~nuevo.index.duplicated(keep="last")]
+                tocadas = viejo.index.isin(ids)
+                eventos = pd.concat([viejo[~tocadas], nuevo])
+                viejo = viejo[tocadas]
+
+            # Reuniones que cambian: altas, bajas y las que tienen otro valor
+            anterior = viejo.reindex(nuevo.index)
+            distinto = np.zeros(len(nuevo), dtype=bool)
+            for col in ("codigo", "semana", "horas"):
+                distinto |= (nuevo[col] != anterior[col]).to_numpy()
+            poner = nuevo[distinto]
+            quitar = viejo[viejo.index.isin(poner.index) | ~viejo.index.isin(nuevo.index)]
+            if len(poner) or len(quitar):
+                delta = pd.concat([poner, quitar.assign(horas=-quitar["horas"])])
+                totales = self._totales.add(delta.groupby(KEY)["horas"].sum(), fill_value=0)
+                self._totales = totales[~np.isclose(totales.to_numpy(), 0)]
+            self._eventos[fuente] = eventos
+            self._versiones[fuente] = version
+        return self
+
+    def update_store(self, user: str, df: pd.DataFrame, store_user: str,
+                     calendar_id: str, version: int | None) -> "HoursAggregator":
+        """
+        update() de la tabla de una carpeta del almacén (store_user como en
+        event_store.load) en su versión: tras la primera vez solo se miran
+        los ids que tocaron los deltas desde la versión anterior.
+        """
+        def cambios(anterior):
+            if anterior[0] != store_user:
+                return None  # otra carpeta (otro rango): versiones sin relación
+            return event_store.changed_ids(store_user, calendar_id, anterior[1])
+        return self.update(user, df, source=calendar_id,
+                           version=None if version is None else (store_user, version),
+                           changes=cambios)
+
+    def totals(self, users: Iterable[str] | None = None) -> pd.DataFrame:
+        """Totales como tabla (usuario, codigo, semana, horas)."""
+        with self._lock:
+            totales = self._totales
+        if users is not None:
+            totales = totales[totales.index.get_level_values("usuario").isin(list(users))]
+        return totales.sort_index().reset_index()
+
+    def pivot(self, user: str) -> pd.DataFrame:
+        """Horas de un usuario: códigos en filas y semanas (lunes) en columnas, con total."""
+        totales = self.totals([user])
+        if totales.empty:
+            return pd.DataFrame()
+        tabla = totales.pivot_table(index="codigo", columns="semana", values="horas",
+                                    aggfunc="sum", fill_value=0)
+        tabla.columns = [c.strftime("%Y-%m-%d") for c in tabla.columns]
+        return tabla.assign(total=tabla.sum(axis=1)).sort_values("total", ascending=False)
+
+# ——————————————
+# Exportación por trozos
+# ——————————————
+
+def store_tables(sources: Iterable[tuple[str, str, str]]) -> Iterator[tuple[str, pd.DataFrame]]:
+    """
+    (usuario, tabla) de cada (usuario, clave del almacén, calendario)
+    guardado, de uno en uno (la clave es la de event_store.store_key).
+    """
+    for user, clave, calendar_id in sources:
+        df = event_store.load(clave, calendar_id)
+        if df is not None:
+            yield user, df
+
+def iter_event_hours(tables: Iterable[tuple[str, pd.DataFrame]],
+                     chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Filas de horas por reunión, en trozos de como mucho chunk_rows eventos."""
+    for user, df in tables:
+        for start in range(0, len(df), chunk_rows):
+            trozo = event_hours(df.iloc[start:start + chunk_rows], user)
+            if len(trozo):
+                yield trozo.reset_index()[EXPORT_SCHEMA.names]
+
+def export_chunks(chunks: Iterable[pd.DataFrame], dest, fmt: str = "csv") -> int:
+    """
+    Escribe los trozos en dest (ruta o fichero abierto) como CSV o Parquet
+    (un row group por trozo) y devuelve el número de filas.
+    """
+    filas = 0
+    if fmt == "csv":
+        propio = isinstance(dest, (str, os.PathLike))
+        f = open(dest, "w", encoding="utf-8", newline="") if propio else dest
+        try:
+            for i, chunk in enumerate(chunks):
+                chunk.to_csv(f, header=i == 0, index=False)
+                filas += len(chunk)
+        finally:
+            if propio:
+                f.close()
+    elif fmt == "parquet":
+        with pq.ParquetWriter(dest, EXPORT_SCHEMA) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pandas(chunk, schema=EXPORT_SCHEMA, preserve_index=False))
+                filas += len(chunk)
+    else:
+        raise ValueError(f"Formato no soportado: {fmt!r}")
+    return filas
+
+# Totales del proceso (cada fuente lleva su usuario)
+hours_aggregator = HoursAggregator()
@@ -0,0 +1,123 @@
+# metrics.py
+
+import contextvars
+import json
+import threading
+import time
+from collections import defaultdict
+
+# Llamadas registradas durante el rerun en curso (ver StageTimer)
+_rerun_calls: contextvars.ContextVar[list | None] = contextvars.ContextVar("rerun_calls", default=None)
+
+def _call_stats() -> dict:
+    return {"calls": 0, "errors": 0, "seconds_total": 0.0, "seconds_max": 0.0,
+            "bytes": 0, "retries": 0, "items": 0}
+
+class Metrics:
+    """
+    Contadores del proceso: llamadas a la API por método (número, errores,
+    latencia, bytes de respuesta, reintentos, eventos o sub-peticiones) y
+    tiempo acumulado por etapa de las páginas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, dict] = defaultdict(_call_stats)
+        self._stages: dict[str, dict] = defaultdict(lambda: {"count": 0, "seconds_total": 0.0})
+        self.started = time.time()
+
+    def record_call(self, method: str, seconds: float, bytes: int = 0,
+                    retries: int = 0, items: int = 0, error: Exception | None = None) -> None:
+        with self._lock:
+            stats = self._calls[method]
+            stats["calls"] += 1
+            stats["errors"] += error is not None
+            stats["seconds_total"] += seconds
+            stats["seconds_max"] = max(stats["seconds_max"], seconds)
+            stats["bytes"] += bytes
+            stats["retries"] += retries
+            stats["items"] += items
+        llamadas = _rerun_calls.get()
+        if llamadas is not None:
+            llamadas.append({"method": method, "seconds": seconds, "bytes": bytes,
+                             "retries": retries, "items": items, "error": error is not None})
+
+    def record_stage(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            stats = self._stages[stage]
+            stats["count"] += 1
+            stats["seconds_total"] += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "uptime_seconds": time.time() - self.started,
+                "calls": {m: dict(s) for m, s in self._calls.items()},
+                "stages": {e: dict(s) for e, s in self._stages.items()},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._calls.clear()
+            self._stages.clear()
+            self.started = time.time()
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix: str = "neo_brain") -> str:
+        """Exportación en formato de texto de Prometheus."""
+        snap = self.snapshot()
+        series = [
+            ("gcal_calls_total", "counter", "Llamadas a la API de Calendar", "calls"),
+            ("gcal_errors_total", "counter", "Llamadas que terminaron en error", "errors"),
+            ("gcal_seconds_total", "counter", "Latencia acumulada (incluye esperas y reintentos)", "seconds_total"),
+            ("gcal_seconds_max", "gauge", "Latencia máxima de una llamada", "seconds_max"),
+            ("gcal_response_bytes_total", "counter", "Bytes de respuesta", "bytes"),
+            ("gcal_retries_total", "counter", "Reintentos por cuota o error del servidor", "retries"),
+            ("gcal_items_total", "counter", "Eventos recibidos o sub-peticiones de lote", "items"),
+        ]
+        lineas = []
+        for nombre, tipo, ayuda, campo in series:
+            lineas += [f"# HELP {prefix}_{nombre} {ayuda}", f"# TYPE {prefix}_{nombre} {tipo}"]
+            lineas += [
+                f'{prefix}_{nombre}{{method="{m}"}} {s[campo]}' for m, s in sorted(snap["calls"].items())
+            ]
+        for nombre, tipo, ayuda, campo in [
+            ("page_stage_seconds_total", "counter", "Tiempo acumulado por etapa de página", "seconds_total"),
+            ("page_stage_runs_total", "counter", "Veces que se ejecutó cada etapa", "count"),
+        ]:
+            lineas += [f"# HELP {prefix}_{nombre} {ayuda}", f"# TYPE {prefix}_{nombre} {tipo}"]
+            lineas += [
+                f'{prefix}_{nombre}{{stage="{e}"}} {s[campo]}' for e, s in sorted(snap["stages"].items())
+            ]
+        return "\n".join(lineas) + "\n"
+
+class StageTimer:
+    """
+    Cronómetro por etapas de un rerun: lap('fetch') anota el tiempo desde
+    la marca anterior. También recoge las llamadas a la API hechas desde el
+    hilo del rerun.
+    """
+
+    def __init__(self, registry: Metrics | None = None):
+        self.registry = registry or metrics
+        self.stages: dict[str, float] = {}
+        self.calls: list[dict] = []
+        _rerun_calls.set(self.calls)
+        self._start = self._last = time.perf_counter()
+
+    def lap(self, stage: str) -> float:
+        ahora = time.perf_counter()
+        segundos = ahora - self._last
+        self._last = ahora
+        self.stages[stage] = self.stages.get(stage, 0.0) + segundos
+        self.registry.record_stage(stage, segundos)
+        return segundos
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self._start
+
+# Métricas del proceso, compartidas por todas las sesiones
+metrics = Metrics()
@@ -1,9 +1,22 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta, time
 import streamlit.components.v1 as components
 
-from gcal_client import build_credentials, build_service, list_events, upsert_event
+from gcal_client import get_service, upsert_event
+from event_cache import month_cache
+from event_store import event_store, store_key
+from shared_cache import shared_cache
+from event_normalizer import normalize_events
+from event_table import EventTable, compact_events
+from watch_channels import watch_manager
+from auth_session import get_auth_manager
+from code_suggester import get_suggester
+from search_index import get_search_index
+from event_grid import event_grid
+from metrics import StageTimer
+from debug_panel import debug_panel
 
 # ——————————————
 # Check de sesión: si no hay token ni email, bloqueamos el acceso
@@ -14,6 +27,8 @@ if "oauth_token" not in st.session_state or "user_email" not in st.session_state
 
 st.set_page_config(page_title="Neo Brain - Autocalendar", layout="wide")
 st.title("Autocalendar")
+# Tiempo por etapa de este rerun (panel de depuración en la barra lateral)
+timer = StageTimer()
 st.markdown("""
 Esta página permite la gestión de reuniones y la asignación de códigos a las mismas.  
 Se disponen de dos métodos de asignación:
@@ -34,9 +49,18 @@ fecha_inicio, fecha_fin = st.date_input(
     help="Puedes elegir fechas pasadas y/o futuras"
 )
 
-calendar_id = st.text_input("ID de calendario:", value="primary")
-if st.button("Refrescar eventos"):
-    st.experimental_rerun()
+calendar_ids = [
+    c.strip()
+    for c in st.text_input(
+        "ID(s) de calendario:",
+        value="primary",
+        help="Separa varios calendarios con comas para verlos juntos"
+    ).split(",")
+    if c.strip()
+]
+refrescar = st.button("Refrescar eventos")
+if refrescar:
+    month_cache.invalidate(st.session_state.user_email)
 
 # Convertir a datetime con hora mínima y máxima
 dt_min = datetime.combine(fecha_inicio, time.min)
@@ -45,40 +69,133 @@ dt_max = datetime.combine(fecha_fin,   time.max)
 # ——————————————
 # Traer eventos desde Google Calendar
 # ——————————————
-creds   = build_credentials(st.session_state.oauth_token)
-service = build_service(creds)
-events = list_events(
-    service,
-    calendar_id=calendar_id,
-    time_min=dt_min,
-    time_max=dt_max
-)
+# Token vigente antes de llamar a la API (y renovación en segundo plano)
+auth = get_auth_manager()
+auth.ensure_fresh(st.session_state.oauth_token)
+auth.start_refresh(st.session_state.oauth_token)
+service = get_service(st.session_state.oauth_token, st.session_state, backend="httpx")
+user = st.session_state.user_email
+timer.lap("auth")
+
+# Los calendarios ya guardados en disco se pintan al instante y se
+# actualizan en segundo plano; el almacén cubre del año pasado al que
+# viene (todo lo que permite elegir el selector de fechas)
+ventana = (datetime(hoy.year - 1, 1, 1), datetime.combine(datetime(hoy.year + 1, 12, 31), time.max))
+# La carpeta va por la clave compartida (calendario resuelto y alcance):
+# los usuarios con el mismo acceso a un calendario de equipo comparten la
+# descarga y la sincronización; a cada uno se le comprueba antes el acceso
+claves, errores = {}, {}
+for cal_id in calendar_ids:
+    try:
+        claves[cal_id] = store_key(shared_cache.key(service, user, cal_id), *ventana)
+    except Exception as e:
+        errores[cal_id] = e
+guardados, sin_guardar = [], []
+versiones = {cal_id: (event_store.meta(clave, cal_id) or {}).get("version") for cal_id, clave in claves.items()}
+for cal_id in claves:
+    df_cal = event_store.load(claves[cal_id], cal_id)
+    if df_cal is None:
+        sin_guardar.append(cal_id)
+    else:
+        guardados.append(df_cal)
+    event_store.refresh_async(service, claves[cal_id], cal_id, *ventana, force=refrescar)
+    # Con webhook configurado, Calendar avisa de cada cambio
+    watch_manager.watch(st.session_state.oauth_token, user, cal_id, *ventana, store_user=claves[cal_id])
+timer.lap("fetch")
+
+# Los que aún no están en disco: solo se descargan los meses del rango que
+# no están ya en caché
+if sin_guardar:
+    events = month_cache.list_events(
+        service,
+        user=user,
+        calendar_ids=sin_guardar,
+        time_min=dt_min,
+        time_max=dt_max,
+        errors=errores
+    )
+    timer.lap("fetch")
+    guardados.append(compact_events(normalize_events(events)))
+for cal_id in calendar_ids:
+    err = errores.get(cal_id) or event_store.refresh_error(claves[cal_id], cal_id)
+    if err:
+        st.warning(f"No se pudo cargar el calendario '{cal_id}': {err}")
+if not guardados:
+    st.stop()  # ningún calendario accesible (los avisos de arriba dicen por qué)
+
+@st.fragment(run_every=2)
+def esperar_actualizacion():
+    """Recarga la página cuando terminan las actualizaciones o hay datos nuevos en el almacén."""
+    if any(event_store.refreshing(clave, cal_id) for cal_id, clave in claves.items()):
+        st.caption("🔄 Buscando cambios en Google Calendar…")
+    elif actualizando or any(
+        (event_store.meta(claves[cal_id], cal_id) or {}).get("version") != v for cal_id, v in versiones.items()
+    ):
+        st.rerun()
+
+actualizando = any(event_store.refreshing(clave, cal_id) for cal_id, clave in claves.items())
+if actualizando or any(watch_manager.active(user, cal_id) for cal_id in claves):
+    esperar_actualizacion()
+
+# Eventos normalizados en una tabla compacta; con un solo calendario
+# guardado se usa tal cual, sin copiarla (asumimos que 'description'
+# guarda el código)
+if len(guardados) == 1:
+    df_eventos = guardados[0]
+else:
+    df_eventos = compact_events(
+        pd.concat(guardados, ignore_index=True).sort_values("inicio", kind="stable", ignore_index=True)
+    )
+df_reuniones = pd.DataFrame({
+    "id": df_eventos["id"],
+    "calendar_id": df_eventos["calendar_id"],
+    "fecha": df_eventos["fecha"],
+    "hora": df_eventos["hora"],
+    "duracion": df_eventos["duracion"],
+    "titulo": df_eventos["titulo_raw"],
+    "codigo": df_eventos["detalles"],
+    "detalles": df_eventos["detalles"],
+    "serie": df_eventos["serie"],
+    "asistentes": df_eventos["asistentes"],
+}, copy=False)
+# Los códigos asignados en esta página (aún simulados) se guardan aparte
+tabla = EventTable(df_reuniones, st.session_state.setdefault("autocalendar_ediciones", {}))
+# El rango elegido es una máscara sobre la tabla, no una copia
+lo = pd.Timestamp(dt_min, tz="UTC")
+hi = pd.Timestamp(dt_max, tz="UTC")
+en_rango = ((df_eventos["fin"] >= lo) & (df_eventos["inicio"] <= hi)).to_numpy()
+timer.lap("normalize")
+
+if not en_rango.any():
+    st.info("No hay eventos en el rango seleccionado.")
+    st.stop()
 
-# Normalizar eventos en un DataFrame
-def normalize_event(ev):
-    start = ev.get("start", {}).get("dateTime") or ev.get("start", {}).get("date")
-    end   = ev.get("end",   {}).get("dateTime") or ev.get("end",   {}).get("date")
-    return {
-        "id":       ev.get("id"),
-        "fecha":    pd.to_datetime(start).date(),
-        "hora":     pd.to_datetime(start).strftime("%H:%M"),
-        "duracion": str(pd.to_datetime(end) - pd.to_datetime(start)),
-        "titulo":   ev.get("summary", ""),
-        "codigo":   ev.get("description", ""),   # asumimos que 'description' guarda el código
-        "detalles": ev.get("description", "")
-    }
-
-df_reuniones = pd.DataFrame([normalize_event(e) for e in events])
+# Índice de sugerencias a partir de las reuniones que ya tienen código
+sugeridor = get_suggester(
+    st.session_state,
+    (st.session_state.user_email, tuple(calendar_ids)),
+    df_reuniones,
+    text_col="titulo"
+)
+# Índice de búsqueda por palabras (solo se reindexan los títulos que cambian)
+indice = get_search_index(
+    st.session_state,
+    (st.session_state.user_email, tuple(calendar_ids)),
+    df_reuniones,
+    ["titulo", "detalles"]
+)
+timer.lap("indices")
 
 # ——————————————
 # Filtros generales (igual que en el original)
 # ——————————————
 st.subheader("Filtros Generales")
 col1, col2, col3 = st.columns(3)
+fechas_rango = df_reuniones["fecha"][en_rango]
 with col1:
-    fi = st.date_input("Fecha inicio", value=df_reuniones["fecha"].min())
+    fi = st.date_input("Fecha inicio", value=fechas_rango.min().date())
 with col2:
-    ff = st.date_input("Fecha fin",    value=df_reuniones["fecha"].max())
+    ff = st.date_input("Fecha fin",    value=fechas_rango.max().date())
 with col3:
     filtro_codigo = st.radio(
         "Filtrar por código",
@@ -87,17 +204,18 @@ with col3:
     )
 filtro_texto = st.text_input("Buscar en título o detalles")
 
-df_filtrado = df_reuniones.copy()
-df_filtrado = df_filtrado[(df_filtrado["fecha"] >= fi) & (df_filtrado["fecha"] <= ff)]
-if filtro_codigo == "Con código":
-    df_filtrado = df_filtrado[df_filtrado["codigo"] != ""]
-elif filtro_codigo == "Sin código":
-    df_filtrado = df_filtrado[df_filtrado["codigo"] == ""]
+visibles = en_rango & (
+    (df_reuniones["fecha"] >= pd.Timestamp(fi)) & (df_reuniones["fecha"] <= pd.Timestamp(ff))
+).to_numpy()
+if filtro_codigo != "Todos":
+    # Con los códigos asignados en la página
+    con_codigo = (tabla.column("codigo") != "").to_numpy()
+    visibles &= con_codigo if filtro_codigo == "Con código" else ~con_codigo
 if filtro_texto:
-    df_filtrado = df_filtrado[
-        df_filtrado["titulo"].str.lower().str.contains(filtro_texto.lower()) |
-        df_filtrado["detalles"].str.lower().str.contains(filtro_texto.lower())
-    ]
+    # Cada palabra buscada es prefijo de alguna palabra (sin tildes ni mayúsculas)
+    visibles &= indice.mask(filtro_texto)
+vista = tabla.view(visibles)
+timer.lap("filter")
 
 # ——————————————
 # Tabs internas para asignación de códigos
@@ -109,37 +227,34 @@ tabs = st.tabs(["Autorellenado Automático", "Rellenado Manual (por Lotes)"])
 # ------------------------------------------
 with tabs[0]:
     st.subheader("Autorellenado Automático")
-    st.markdown("Para cada reunión se sugiere un código. Confirma la sugerencia o ingresa otro código si no es correcto.")
-    df_auto = df_filtrado.copy()
-    for idx, row in df_auto.iterrows():
-        st.markdown(f"### {row['titulo']} (ID: {row['id']})")
-        st.write(f"**Fecha:** {row['fecha']}  |  **Hora:** {row['hora']}  |  **Duración:** {row['duracion']}")
-        codigo_recomendado = f"#1741{row['id'][-4:]}" if isinstance(row['id'], str) else f"#1741{int(row['id']):04d}"
-        if row['codigo']:
-            st.write(f"**Código asignado:** {row['codigo']}")
-        else:
-            st.warning("Esta reunión no tiene código asignado.")
-            st.info(f"Código recomendado: {codigo_recomendado}")
-            opcion = st.radio(
-                f"Para la reunión '{row['titulo']}'",
-                ["Confirmar recomendado", "No es correcto"],
-                key=f"auto_{row['id']}"
-            )
-            if opcion == "Confirmar recomendado":
-                df_auto.at[idx, "codigo"] = codigo_recomendado
-                st.success(f"Código actualizado a: {codigo_recomendado}")
-            else:
-                nuevo_codigo = st.text_input(
-                    f"Ingrese otro código para '{row['titulo']}'",
-                    key=f"nuevo_auto_{row['id']}"
-                )
-                if nuevo_codigo:
-                    df_auto.at[idx, "codigo"] = nuevo_codigo
-                    st.success(f"Código actualizado a: {nuevo_codigo}")
+    st.markdown("Para cada reunión se sugiere un código. Corrígelo en la tabla si no es correcto y marca las reuniones a confirmar.")
+    sugerencias = sugeridor.suggest(vista.frame(["titulo", "serie", "asistentes"]))
+    timer.lap("suggest")
+    codigos = vista.column("codigo").to_numpy(dtype=object)
+    sin_codigo = codigos == ""
+    vista_auto = vista.with_columns(
+        codigo_recomendado=np.where(sin_codigo, sugerencias["sugerencia"].to_numpy(dtype=object), codigos),
+        confianza=np.where(sin_codigo, sugerencias["confianza"].to_numpy(dtype=float), np.nan)
+    )
+    seleccionados, ediciones = event_grid(
+        vista_auto,
+        key="auto",
+        columns=["calendar_id", "titulo", "fecha", "hora", "duracion", "codigo",
+                 "codigo_recomendado", "confianza"],
+        editable=("codigo_recomendado",),
+        column_config={
+            "codigo_recomendado": st.column_config.TextColumn("Código recomendado"),
+            "confianza": st.column_config.ProgressColumn("Confianza", min_value=0, max_value=1),
+        },
+    )
     if st.button("Confirmar cambios en Autorellenado Automático"):
         # Aquí podrías llamar a upsert_event para cada evento modificado
-        st.success("Se actualizaron los datos (simulación).")
-    st.dataframe(df_auto, use_container_width=True)
+        marcadas = vista_auto.subset(seleccionados)
+        for event_id, recomendado in zip(marcadas.ids, marcadas.column("codigo_recomendado")):
+            tabla.edit([event_id], codigo=ediciones.get(event_id, {}).get(
+                "codigo_recomendado", recomendado
+            ))
+        st.success(f"Se actualizaron {len(seleccionados)} reunión(es) (simulación).")
 
 # ------------------------------------------
 # Rellenado Manual (por Lotes)
@@ -147,32 +262,20 @@ with tabs[0]:
 with tabs[1]:
     st.subheader("Rellenado Manual (por Lotes)")
     st.markdown("Selecciona una o varias reuniones y asigna un código en bloque para actualizarlas simultáneamente.")
-    df_manual = df_filtrado.copy()
-    seleccionados = []
     st.markdown("### Selección de Reuniones")
-    for idx, row in df_manual.iterrows():
-        c1, c2, c3, c4 = st.columns([0.1, 0.4, 0.3, 0.2])
-        with c1:
-            sel = st.checkbox("", key=f"check_{row['id']}")
-            if sel:
-                seleccionados.append(row['id'])
-        with c2:
-            st.write(f"**{row['titulo']}**")
-        with c3:
-            st.write(f"{row['fecha']} - {row['hora']}")
-        with c4:
-            st.write("Código:", row['codigo'] if row['codigo'] else "N/A")
+    seleccionados, _ = event_grid(
+        vista,
+        key="manual",
+        columns=["calendar_id", "titulo", "fecha", "hora", "codigo"],
+    )
     st.markdown("---")
-    st.write(f"Reuniones seleccionadas: {len(seleccionados)}")
     codigo_lote = st.text_input(
         "Ingrese código para aplicar a las reuniones seleccionadas (ej. '#17412081')",
         key="codigo_lote"
     )
     if st.button("Asignar código por lotes"):
         if codigo_lote and seleccionados:
-            for idx, row in df_manual.iterrows():
-                if row['id'] in seleccionados:
-                    df_manual.at[idx, "codigo"] = codigo_lote
+            tabla.edit(seleccionados, codigo=codigo_lote)
             st.success(f"Se asignó el código {codigo_lote} a {len(seleccionados)} reunión(es).")
         elif not codigo_lote:
             st.error("Ingrese un código para asignar.")
@@ -181,4 +284,6 @@ with tabs[1]:
     if st.button("Confirmar cambios en Rellenado Manual"):
         # Aquí podrías llamar a upsert_event en bloque
         st.success("Se actualizaron los datos (simulación).")
-    st.dataframe(df_manual, use_container_width=True)
+
+timer.lap("render")
+debug_panel(timer)
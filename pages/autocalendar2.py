@@ -1,8 +1,22 @@
-import re
+import tempfile
 import streamlit as st
+import numpy as np
 import pandas as pd
 from datetime import datetime, date, time
-from gcal_client import build_credentials, build_service, list_events, upsert_event
+from gcal_client import get_service
+from event_store import event_store, store_key
+from shared_cache import shared_cache
+from event_table import EventTable
+from watch_channels import watch_manager
+from write_planner import originals_from_frame, plan_writes, series_writes, titulo_con_codigo
+from write_jobs import job_runner
+from hours_report import export_chunks, hours_aggregator, iter_event_hours, store_tables
+from auth_session import get_auth_manager
+from code_suggester import get_suggester
+from search_index import get_search_index
+from event_grid import event_grid
+from metrics import StageTimer
+from debug_panel import debug_panel
 
 # — Verificación de sesión —
 if "oauth_token" not in st.session_state or "user_email" not in st.session_state:
@@ -11,69 +25,137 @@ if "oauth_token" not in st.session_state or "user_email" not in st.session_state
 
 st.set_page_config(page_title="Neo Brain - Autocalendar", layout="wide")
 st.title("Autocalendar")
+# Tiempo por etapa de este rerun (panel de depuración en la barra lateral)
+timer = StageTimer()
 
 # — Parámetros fijos: descargar todo 2025 —
 dt_min = datetime.combine(date(2025, 1, 1), time.min)
 dt_max = datetime.combine(date(2025, 12, 31), time.max)
 calendar_id = st.text_input("ID de calendario:", value="primary")
-if st.button("Recargar año 2025"):
-    pass  # fuerza recarga del script
+recargar = st.button("Recargar año 2025")
+modo_series = st.toggle(
+    "Modo series",
+    key="modo_series",
+    help="Descarga solo los maestros de las reuniones recurrentes y sus excepciones, "
+         "y genera las repeticiones aquí (mucho menos que descargar cada repetición).",
+)
 
 # — Autenticación y descarga de eventos —
-creds   = build_credentials(st.session_state.oauth_token)
-service = build_service(creds)
-events  = list_events(
-    service,
-    calendar_id=calendar_id,
-    time_min=dt_min,
-    time_max=dt_max
-)
+# Token vigente antes de llamar a la API (y renovación en segundo plano)
+auth = get_auth_manager()
+auth.ensure_fresh(st.session_state.oauth_token)
+auth.start_refresh(st.session_state.oauth_token)
+service = get_service(st.session_state.oauth_token, st.session_state, backend="httpx")
+user = st.session_state.user_email
+timer.lap("auth")
+
+# Se pinta al instante lo guardado en disco y los cambios llegan en segundo
+# plano (solo lo modificado desde la última sincronización)
+# Carpeta propia para el rango de esta página (Autocalendar usa otro) y
+# compartida por los usuarios con el mismo acceso al calendario
+try:
+    clave = store_key(shared_cache.key(service, user, calendar_id), dt_min, dt_max)
+except Exception as e:
+    st.error(f"No se pudo abrir el calendario '{calendar_id}': {e}")
+    st.stop()
+meta = event_store.meta(clave, calendar_id) or {}
+version = meta.get("version")
+df_eventos = event_store.load(clave, calendar_id)
+if df_eventos is None:
+    # Primera descarga, también en segundo plano: se pinta cada página según
+    # llega (se espera como mucho un segundo a la primera)
+    event_store.refresh_async(service, clave, calendar_id, dt_min, dt_max,
+                              force=True, series=modo_series)
+    paginas = (event_store.progress(clave, calendar_id) or {}).get("pages")
+    df_eventos = event_store.partial(clave, calendar_id, timeout=1.0)
+    if df_eventos is None:
+        df_eventos = event_store.load(clave, calendar_id)  # si ya terminó
+else:
+    # Cambiar de modo vuelve a descargar el rango en segundo plano
+    cambio_modo = bool(meta.get("series")) != modo_series
+    event_store.refresh_async(service, clave, calendar_id, dt_min, dt_max,
+                              force=recargar or cambio_modo, series=modo_series)
+    paginas = None
+
+# Con webhook configurado, Calendar avisa de cada cambio y el almacén se
+# sincroniza solo (sin pulsar "Recargar")
+watch_manager.watch(st.session_state.oauth_token, user, calendar_id, dt_min, dt_max,
+                    store_user=clave)
 
-# — Normalizar eventos a DataFrame —
-def normalize_event(ev):
-    start = ev["start"].get("dateTime") or ev["start"].get("date")
-    end   = ev["end"].get("dateTime")   or ev["end"].get("date")
-    ds = pd.to_datetime(start)
-    de = pd.to_datetime(end)
-
-    title = ev.get("summary", "").strip()
-    # Regex para "#12345 – descripción" o "#12345 descripción"
-    m = re.match(r"^\#(\d+)(?:\s*[-–—]\s*|\s+)(.*)", title)
-    if m:
-        code = f"#{m.group(1)}"
-        desc = m.group(2).strip()
+@st.fragment(run_every=1)
+def esperar_actualizacion():
+    """
+    Recarga la página con cada página nueva de la primera descarga, cuando
+    termina la actualización o cuando hay datos nuevos en el almacén.
+    """
+    progreso = event_store.progress(clave, calendar_id)
+    if progreso is not None:
+        if progreso["pages"] != paginas:
+            st.rerun()
+        st.caption(f"🔄 Descargando el calendario: {progreso['events']} eventos "
+                   f"({progreso['pages']} página(s))…")
+    elif event_store.refreshing(clave, calendar_id):
+        st.caption("🔄 Buscando cambios en Google Calendar…")
+    elif actualizando or (event_store.meta(clave, calendar_id) or {}).get("version") != version:
+        st.rerun()
+
+actualizando = event_store.refreshing(clave, calendar_id)
+if actualizando or watch_manager.active(user, calendar_id):
+    esperar_actualizacion()
+error_refresco = event_store.refresh_error(clave, calendar_id)
+if df_eventos is None:
+    if error_refresco:
+        st.error(f"No se pudo descargar el calendario: {error_refresco}")
     else:
-        code = ""
-        desc = title
+        st.info("Descargando el calendario por primera vez…")
+    st.stop()
+if error_refresco:
+    st.warning(f"No se pudieron traer los últimos cambios: {error_refresco}")
+timer.lap("fetch")
 
-    return {
-        "id":          ev.get("id"),
-        "fecha":       ds.date(),
-        "hora":        ds.strftime("%H:%M"),
-        "duracion":    str(de - ds),
-        "titulo_raw":  title,
-        "codigo":      code,
-        "descripcion": desc
-    }
+# Eventos tal como se descargaron (base de las escrituras por diferencias)
+originales = originals_from_frame(df_eventos)
+
+# Tabla compacta del almacén, sin copiar: los filtros son posiciones
+df_reuniones = df_eventos
+tabla = EventTable(df_reuniones)
+if df_reuniones.empty:
+    st.info("No hay eventos en 2025 en este calendario.")
+    st.stop()
 
-df_reuniones = pd.DataFrame([normalize_event(e) for e in events])
+# — Índice de sugerencias (una vez por usuario y calendario) —
+sugeridor = get_suggester(
+    st.session_state,
+    (st.session_state.user_email, calendar_id),
+    df_reuniones
+)
+# — Índice de búsqueda por palabras (solo se reindexan los títulos que cambian) —
+indice = get_search_index(
+    st.session_state,
+    (st.session_state.user_email, calendar_id),
+    df_reuniones,
+    ["titulo_raw", "descripcion"]
+)
+timer.lap("indices")
 
 # — Filtros generales (dentro de 2025) —
 st.subheader("📅 Filtros Generales (dentro de 2025)")
 col1, col2, col3 = st.columns(3)
+# Un evento que cruza la medianoche del 31/12 da fechas fuera de 2025
+limite_ini, limite_fin = date(2025,1,1), date(2025,12,31)
 with col1:
     fecha_inicio = st.date_input(
         "Fecha inicio",
-        value=df_reuniones["fecha"].min(),
-        min_value=date(2025,1,1),
-        max_value=date(2025,12,31)
+        value=min(max(df_reuniones["fecha"].min().date(), limite_ini), limite_fin),
+        min_value=limite_ini,
+        max_value=limite_fin
     )
 with col2:
     fecha_fin = st.date_input(
         "Fecha fin",
-        value=df_reuniones["fecha"].max(),
-        min_value=date(2025,1,1),
-        max_value=date(2025,12,31)
+        value=min(max(df_reuniones["fecha"].max().date(), limite_ini), limite_fin),
+        min_value=limite_ini,
+        max_value=limite_fin
     )
 with col3:
     filtro_codigo = st.radio(
@@ -83,107 +165,218 @@ with col3:
     )
 filtro_texto = st.text_input("Buscar en título o descripción")
 
-df_filtrado = df_reuniones[
-    (df_reuniones["fecha"] >= fecha_inicio) &
-    (df_reuniones["fecha"] <= fecha_fin)
-].copy()
+visibles = (
+    (df_reuniones["fecha"] >= pd.Timestamp(fecha_inicio)) &
+    (df_reuniones["fecha"] <= pd.Timestamp(fecha_fin))
+).to_numpy()
 
 if filtro_codigo == "Con código":
-    df_filtrado = df_filtrado[df_filtrado["codigo"] != ""]
+    visibles &= (df_reuniones["codigo"] != "").to_numpy()
 elif filtro_codigo == "Sin código":
-    df_filtrado = df_filtrado[df_filtrado["codigo"] == ""]
+    visibles &= (df_reuniones["codigo"] == "").to_numpy()
 
 if filtro_texto:
-    txt = filtro_texto.lower()
-    df_filtrado = df_filtrado[
-        df_filtrado["titulo_raw"].str.lower().str.contains(txt) |
-        df_filtrado["descripcion"].str.lower().str.contains(txt)
-    ]
+    # Cada palabra buscada es prefijo de alguna palabra (sin tildes ni mayúsculas)
+    visibles &= indice.mask(filtro_texto)
+
+vista = tabla.view(visibles)
+timer.lap("filter")
+
+# — Escritura en lote de códigos —
+def _mensaje_error(err) -> str:
+    if getattr(getattr(err, "resp", None), "status", None) == 412:
+        return "cambió en Google Calendar desde que se cargó; recarga e inténtalo de nuevo"
+    return str(err)
+
+def traer_cambios(job):
+    """Al terminar un trabajo con escrituras, el almacén trae los títulos nuevos."""
+    if job.ok:
+        event_store.refresh(service, clave, calendar_id, dt_min, dt_max)
+
+def aplicar_codigos(df, cambios, por_serie=False):
+    """
+    Encola en segundo plano las escrituras de los títulos que cambian (patch
+    con If-Match, en lotes) y recarga la página, que muestra el progreso.
+    Con por_serie las reuniones recurrentes se escriben con una sola
+    escritura al maestro de cada serie.
+    """
+    filas = df.loc[list(cambios)]
+    codigos = pd.Series(list(cambios.values()), index=filas.index, dtype=object)
+    writes = []
+    if por_serie:
+        en_serie = (filas["serie"] != "").to_numpy()
+        writes = series_writes(event_store.masters(clave, calendar_id),
+                               filas[en_serie], codigos[en_serie])
+        escritas = {w["event_id"] for w in writes}
+        # Las repeticiones de una serie que ya tenía ese título tampoco se escriben
+        sin_cambios = [i for i, s in zip(filas["id"][en_serie], filas["serie"][en_serie])
+                       if s not in escritas]
+        filas, codigos = filas[~en_serie], codigos[~en_serie]
+    else:
+        sin_cambios = []
+    editado = filas[["id"]].assign(titulo_raw=[
+        titulo_con_codigo(codigo, desc or titulo)
+        for codigo, desc, titulo in zip(codigos, filas["descripcion"], filas["titulo_raw"])
+    ])
+    writes += plan_writes(originales, editado)
+    # Los que ya tenían ese título no se escriben: salen ya de la selección
+    a_escribir = {w["event_id"] for w in writes}
+    sin_cambios += [event_id for event_id in filas["id"] if event_id not in a_escribir]
+    for key in ("auto_sel", "manual_sel"):
+        st.session_state.get(key, set()).difference_update(sin_cambios)
+    if writes:
+        # Mismas escrituras, mismo trabajo: un rerun no las vuelve a enviar
+        st.session_state["_trabajo_escritura"] = job_runner.submit(
+            service, user, calendar_id, writes, on_done=traer_cambios
+        )
+    st.session_state["_sin_cambios"] = len(sin_cambios)
+    st.rerun()
+
+n_sin_cambios = st.session_state.pop("_sin_cambios", 0)
+if n_sin_cambios:
+    st.info(f"{n_sin_cambios} reunión(es) ya tenían ese título; no se escribieron.")
+
+trabajo = job_runner.get(st.session_state.get("_trabajo_escritura"))
+if trabajo is not None and not trabajo.active:
+    # Trabajo terminado o cancelado: lo escrito (y las repeticiones de las
+    # series escritas) sale de la selección
+    resultados = trabajo.event_results()
+    escritos = {r["event_id"] for r in resultados if r["estado"] == "ok"}
+    escritos.update(df_reuniones.loc[df_reuniones["serie"].isin(escritos).to_numpy(), "id"])
+    for key in ("auto_sel", "manual_sel"):
+        st.session_state.get(key, set()).difference_update(escritos)
+    if trabajo.ok:
+        st.success(f"{trabajo.ok} reunión(es) actualizada(s) en Google Calendar.")
+    for r in resultados:
+        if r["estado"] == "error":
+            st.error(f"No se pudo actualizar {r['event_id']}: {_mensaje_error(r['error'])}")
+    if trabajo.error is not None:
+        st.error(f"El trabajo se interrumpió: {_mensaje_error(trabajo.error)}")
+    if not trabajo.retryable():
+        del st.session_state["_trabajo_escritura"]
+        trabajo = None
+
+@st.fragment(run_every=1)
+def progreso_escritura(activo: bool):
+    """Progreso del trabajo de escritura, con cancelar/reanudar; al terminar recarga la página."""
+    job = job_runner.get(trabajo.id)
+    if activo and not job.active:
+        st.rerun()
+    st.progress(
+        job.done / max(job.total, 1),
+        text=f"Escribiendo en Google Calendar: {job.done} de {job.total} ({job.status})",
+    )
+    if job.active:
+        if st.button("Cancelar escritura", key="cancelar_trabajo"):
+            job_runner.cancel(job.id)
+    elif st.button(f"Reanudar ({len(job.retryable())} pendientes o por reintentar)",
+                   key="reanudar_trabajo"):
+        job_runner.resume(job.id, service)
+        st.rerun()
+    with st.expander("Resultado por reunión"):
+        st.dataframe(
+            pd.DataFrame([
+                {**r, "error": _mensaje_error(r["error"]) if r["error"] else ""}
+                for r in job.event_results()
+            ]),
+            hide_index=True, use_container_width=True,
+        )
+
+if trabajo is not None:
+    progreso_escritura(trabajo.active)
 
 # — Pestañas internas: Autorellenado y Manual —
-tabs = st.tabs(["Autorellenado Automático", "Rellenado Manual (por Lotes)"])
+tabs = st.tabs(["Autorellenado Automático", "Rellenado Manual (por Lotes)", "Horas por código"])
 
 # --- Autorellenado Automático ---
 with tabs[0]:
     st.subheader("Autorellenado Automático")
-    df_auto = df_filtrado.copy()
-    for idx, row in df_auto.iterrows():
-        st.markdown(f"### {row['titulo_raw']}  (ID: {row['id']})")
-        st.write(f"**Fecha:** {row['fecha']}    |    **Hora:** {row['hora']}    |    **Duración:** {row['duracion']}")
-        if row["codigo"]:
-            st.write(f"**Código actual:** {row['codigo']}")
-            nuevo_codigo = row["codigo"]
-        else:
-            recomend = f"#1741{row['id'][-4:]}"
-            st.warning("Sin código asignado.")
-            st.info(f"Código sugerido: {recomend}")
-            opcion = st.radio(
-                f"Para reunión {row['id']}:",
-                ["Confirmar sugerido", "Ingresar otro"],
-                key=f"auto_{row['id']}"
-            )
-            if opcion == "Confirmar sugerido":
-                nuevo_codigo = recomend
-            else:
-                nuevo_codigo = st.text_input(
-                    "Nuevo código:",
-                    key=f"nuevo_{row['id']}"
-                )
-        if nuevo_codigo and nuevo_codigo != row["codigo"]:
-            # 1) Actualizar en Google Calendar
-            nuevo_titulo = f"{nuevo_codigo} – {row['descripcion'] or row['titulo_raw']}"
-            upsert_event(
-                service=service,
-                calendar_id=calendar_id,
-                event_id=row["id"],
-                summary=nuevo_titulo
-            )
-            # 2) Reflejar en DataFrame
-            df_auto.at[idx, "codigo"]     = nuevo_codigo
-            df_auto.at[idx, "titulo_raw"] = nuevo_titulo
-            st.success(f"Evento actualizado: {nuevo_titulo}")
-
-    st.dataframe(df_auto, use_container_width=True)
+    st.markdown("Revisa el código sugerido (puedes editarlo), marca las reuniones y confirma.")
+    sugerencias = sugeridor.suggest(vista.frame(["descripcion", "serie", "asistentes"]))
+    timer.lap("suggest")
+    codigos = vista.column("codigo").to_numpy(dtype=object)
+    sin_codigo = codigos == ""
+    vista_auto = vista.with_columns(
+        codigo_nuevo=np.where(sin_codigo, sugerencias["sugerencia"].to_numpy(dtype=object), codigos),
+        confianza=np.where(sin_codigo, sugerencias["confianza"].to_numpy(dtype=float), np.nan)
+    )
+    seleccionados, ediciones = event_grid(
+        vista_auto,
+        key="auto",
+        columns=["titulo_raw", "fecha", "hora", "duracion", "codigo", "codigo_nuevo", "confianza"],
+        editable=("codigo_nuevo",),
+        column_config={
+            "codigo_nuevo": st.column_config.TextColumn("Código a asignar"),
+            "confianza": st.column_config.ProgressColumn("Confianza", min_value=0, max_value=1),
+        },
+    )
+
+    cambios = {}  # posición en la tabla -> nuevo código
+    marcadas = vista_auto.subset(seleccionados)
+    for pos, event_id, codigo, sugerido in zip(
+        marcadas.positions, marcadas.ids, marcadas.column("codigo"), marcadas.column("codigo_nuevo")
+    ):
+        nuevo_codigo = ediciones.get(event_id, {}).get("codigo_nuevo", sugerido)
+        if nuevo_codigo and nuevo_codigo != codigo:
+            cambios[pos] = nuevo_codigo
+
+    st.write(f"Cambios pendientes: {len(cambios)}")
+    if st.button("Confirmar cambios", disabled=not cambios):
+        aplicar_codigos(tabla.df, cambios)
 
 # --- Rellenado Manual (por Lotes) ---
 with tabs[1]:
     st.subheader("Rellenado Manual (por Lotes)")
-    df_manual = df_filtrado.copy()
-    seleccionados = []
-    for idx, row in df_manual.iterrows():
-        c1, c2, c3, c4 = st.columns([0.1, 0.4, 0.3, 0.2])
-        with c1:
-            sel = st.checkbox("", key=f"chk_{row['id']}")
-            if sel:
-                seleccionados.append(row["id"])
-        with c2:
-            st.write(row["titulo_raw"])
-        with c3:
-            st.write(f"{row['fecha']} {row['hora']}")
-        with c4:
-            st.write("Código:", row["codigo"] or "N/A")
-
-    st.write(f"Reuniones seleccionadas: {len(seleccionados)}")
+    seleccionados, _ = event_grid(
+        vista,
+        key="manual",
+        columns=["titulo_raw", "fecha", "hora", "codigo"],
+    )
+
     codigo_lote = st.text_input("Código para lote", key="cod_lote")
+    por_serie = st.checkbox(
+        "Asignar a toda la serie",
+        key="lote_por_serie",
+        help="Las reuniones recurrentes marcadas cambian el título de su serie completa "
+             "con una sola escritura (las repeticiones editadas aparte no cambian).",
+    )
     if st.button("Asignar lote"):
         if not codigo_lote:
             st.error("Ingresa un código.")
         elif not seleccionados:
             st.error("Selecciona al menos una reunión.")
         else:
-            for idx, row in df_manual.iterrows():
-                if row["id"] in seleccionados:
-                    nuevo_titulo = f"{codigo_lote} – {row['descripcion'] or row['titulo_raw']}"
-                    # Actualizar en Google Calendar
-                    upsert_event(
-                        service=service,
-                        calendar_id=calendar_id,
-                        event_id=row["id"],
-                        summary=nuevo_titulo
-                    )
-                    # Reflejar localmente
-                    df_manual.at[idx, "codigo"]     = codigo_lote
-                    df_manual.at[idx, "titulo_raw"] = nuevo_titulo
-            st.success(f"Código {codigo_lote} asignado a {len(seleccionados)} reunión(es).")
-
-    st.dataframe(df_manual, use_container_width=True)
+            cambios = {pos: codigo_lote for pos in vista.subset(seleccionados).positions}
+            aplicar_codigos(tabla.df, cambios, por_serie=por_serie)
+
+# --- Horas por código ---
+with tabs[2]:
+    st.subheader("Horas por código")
+    st.markdown("Horas por semana (lunes) de las reuniones con código; no cuentan los eventos de día completo.")
+    # Solo se recalculan las reuniones que cambiaron desde la última versión del almacén
+    horas = hours_aggregator.update_store(user, df_reuniones, clave, calendar_id, version).pivot(user)
+    timer.lap("report")
+    if horas.empty:
+        st.info("Aún no hay reuniones con código.")
+    else:
+        st.dataframe(horas, use_container_width=True)
+
+    formato = st.radio("Formato", ("csv", "parquet"), horizontal=True, key="formato_horas")
+    if st.button("Preparar exportación"):
+        # Se escribe por trozos a un fichero temporal, sin juntar las tablas
+        # en memoria, y el botón de descarga se lee del fichero en esta misma
+        # ejecución (nada queda en la sesión; el fichero se borra al momento).
+        # Descargar no recarga la página, así que el botón sigue ahí
+        with tempfile.NamedTemporaryFile(suffix=f".{formato}") as f:
+            filas = export_chunks(iter_event_hours(store_tables([(user, clave, calendar_id)])),
+                                  f.name, formato)
+            with open(f.name, "rb") as leido:
+                st.download_button(
+                    f"Descargar horas ({filas} reuniones, {formato})", leido,
+                    file_name=f"horas_{calendar_id}.{formato}",
+                    mime="text/csv" if formato == "csv" else "application/octet-stream",
+                    on_click="ignore",
+                )
+
+timer.lap("render")
+debug_panel(timer)
@@ -1,13 +1,15 @@
 import streamlit as st
-from gcal_client import build_credentials, build_service
+from gcal_client import get_service
+from auth_session import get_auth_manager
 import datetime
 
 # 1) Comprueba que ya tienes el token en sesión
 if "oauth_token" in st.session_state:
-    # 2) Crea credentials de google-auth
-    creds = build_credentials(st.session_state.oauth_token)
-    # 3) Construye el cliente de Calendar API
-    service = build_service(creds)
+    auth = get_auth_manager()
+    auth.ensure_fresh(st.session_state.oauth_token)
+    # 2-3) Credenciales y cliente de Calendar API (reutilizados entre reruns)
+    service = get_service(st.session_state.oauth_token, st.session_state,
+                          client_id=auth.client_id, client_secret=auth.client_secret)
     # 4) Llama a la API para listar el próximo 1 evento
     events = service.events().list(
         calendarId="primary",
@@ -0,0 +1,157 @@
+# rate_limiter.py
+
+import json
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+from tenacity import (
+    Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential,
+)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+# Ritmo inicial y límites (peticiones por segundo y usuario). La cuota de
+# Calendar por usuario ronda las 10 llamadas/s; el cubo se adapta a lo que
+# Google acepte de verdad.
+INITIAL_RATE = 10.0
+MIN_RATE = 0.5
+MAX_RATE = 50.0
+# Un lote completo (BATCH_LIMIT de gcal_client) sale sin esperar
+BURST = 50
+# Aumento de ritmo por cada llamada correcta y recorte ante un aviso de cuota
+RATE_STEP = 0.05
+THROTTLE_FACTOR = 0.5
+# Peticiones en vuelo a la vez por usuario
+MAX_IN_FLIGHT = 8
+# Reintentos con backoff exponencial y jitter
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 32
+
+def _error_reasons(err: HttpError) -> set[str]:
+    """Extrae los 'reason' del cuerpo JSON de un HttpError de Google."""
+    try:
+        data = json.loads(err.content.decode("utf-8"))
+        return {e.get("reason") for e in data["error"].get("errors", [])}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return set()
+
+def is_throttled(err: Exception) -> bool:
+    """True si Google pide bajar el ritmo (429 o 403 por cuota)."""
+    if not isinstance(err, HttpError):
+        return False
+    status = err.resp.status
+    return status == 429 or (status == 403 and bool(_error_reasons(err) & RETRYABLE_REASONS))
+
+def is_retryable(err: Exception) -> bool:
+    """True si el error es transitorio (cuota o fallo del servidor)."""
+    if not isinstance(err, HttpError):
+        return False
+    return err.resp.status in RETRYABLE_STATUS or is_throttled(err)
+
+class AdaptiveTokenBucket:
+    """
+    Cubo de tokens con ritmo adaptativo (AIMD): cada llamada correcta sube
+    un poco el ritmo y cada aviso de cuota lo reduce a la mitad y vacía el cubo.
+    """
+
+    def __init__(self, rate: float = INITIAL_RATE, burst: int = BURST,
+                 min_rate: float = MIN_RATE, max_rate: float = MAX_RATE):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self._tokens = float(burst)
+        self._stamp = time.monotonic()
+        self._last_throttle = 0.0
+        self._lock = threading.Lock()
+
+    def _fill(self, ahora: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (ahora - self._stamp) * self.rate)
+        self._stamp = ahora
+
+    def acquire(self, cost: float = 1) -> None:
+        """
+        Espera hasta poder gastar cost tokens (un lote cuenta por sus
+        sub-peticiones). Un coste mayor que el cubo lo deja en negativo y
+        son las llamadas siguientes las que esperan.
+        """
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._fill(ahora)
+                necesario = min(cost, self.burst)
+                if self._tokens >= necesario:
+                    self._tokens -= cost
+                    return
+                espera = (necesario - self._tokens) / self.rate
+            time.sleep(espera)
+
+    def on_success(self, cost: float = 1) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + RATE_STEP * cost)
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            ahora = time.monotonic()
+            # Varias respuestas 429 seguidas son el mismo aviso: un recorte por segundo
+            if ahora - self._last_throttle < 1.0:
+                return
+            self._last_throttle = ahora
+            self._fill(ahora)
+            self.rate = max(self.min_rate, self.rate * THROTTLE_FACTOR)
+            self._tokens = min(self._tokens, 0.0)
+
+class RequestScheduler:
+    """
+    Planificador de llamadas a la API de un usuario: ritmo adaptativo,
+    límite de peticiones en vuelo y reintentos con backoff y jitter.
+    """
+
+    def __init__(self, rate: float = INITIAL_RATE, max_in_flight: int = MAX_IN_FLIGHT,
+                 max_attempts: int = MAX_ATTEMPTS, max_rate: float = MAX_RATE):
+        self.bucket = AdaptiveTokenBucket(rate, max_rate=max(rate, max_rate))
+        self.max_attempts = max_attempts
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.retries = 0
+        self.throttled = 0
+
+    def _attempt(self, fn, cost: float, args, kwargs):
+        self.bucket.acquire(cost)
+        with self._in_flight:
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if is_throttled(e):
+                    self.throttled += 1
+                    self.bucket.on_throttle()
+                raise
+        self.bucket.on_success(cost)
+        return result
+
+    def _before_sleep(self, retry_state) -> None:
+        self.retries += 1
+
+    def call(self, fn, *args, cost: float = 1, **kwargs):
+        """Ejecuta fn(*args, **kwargs) respetando el ritmo y reintentando errores transitorios."""
+        retrying = Retrying(
+            retry=retry_if_exception(is_retryable),
+            wait=wait_random_exponential(multiplier=BACKOFF_BASE, max=BACKOFF_MAX),
+            stop=stop_after_attempt(self.max_attempts),
+            before_sleep=self._before_sleep,
+            reraise=True,
+        )
+        return retrying(self._attempt, fn, cost, args, kwargs)
+
+_schedulers: dict[str, RequestScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+def get_scheduler(user: str | None) -> RequestScheduler:
+    """Planificador compartido del usuario (la cuota de Google es por usuario)."""
+    with _schedulers_lock:
+        scheduler = _schedulers.get(user or "")
+        if scheduler is None:
+            scheduler = _schedulers[user or ""] = RequestScheduler()
+        return scheduler
@@ -0,0 +1,157 @@
+# recurrence.py
+#
+# Modo series: en vez de pedir a Calendar cada repetición (singleEvents=True)
+# se descargan los maestros de las series (con sus reglas RRULE), las
+# excepciones (repeticiones movidas, editadas o canceladas) y los eventos
+# sueltos, y las repeticiones se generan aquí con dateutil, solo las que
+# caen en el rango pedido y a medida que se recorren.
+
+import datetime
+import re
+from collections.abc import Iterable, Iterator
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from dateutil.rrule import rrulestr
+
+UTC = datetime.timezone.utc
+# Campos del maestro que no pasan a sus repeticiones
+_SOLO_MAESTRO = ("id", "etag", "recurrence", "start", "end")
+_UNTIL_RE = re.compile(r"UNTIL=(\d{8})(T\d{6}Z?)?")
+
+def _parse(value: dict) -> datetime.datetime | datetime.date:
+    """start/end/originalStartTime de Calendar como datetime con zona o date (día completo)."""
+    if "dateTime" in value:
+        dt = datetime.datetime.fromisoformat(value["dateTime"])
+        return dt if dt.tzinfo else dt.replace(tzinfo=UTC)
+    return datetime.date.fromisoformat(value["date"])
+
+def _zone(value: dict, dt: datetime.datetime) -> datetime.tzinfo:
+    """Zona en la que se repite la serie: la de timeZone o, si no, el desfase del inicio."""
+    try:
+        return ZoneInfo(value["timeZone"]) if value.get("timeZone") else dt.tzinfo
+    except ZoneInfoNotFoundError:
+        return dt.tzinfo
+
+def instance_id(master_id: str, start: datetime.datetime | datetime.date) -> str:
+    """Id de una repetición con el formato de Calendar: '<maestro>_20250106T140000Z' o '_20250106'."""
+    if isinstance(start, datetime.datetime):
+        return f"{master_id}_{start.astimezone(UTC):%Y%m%dT%H%M%SZ}"
+    return f"{master_id}_{start:%Y%m%d}"
+
+def _rules(master: dict, dia_completo: bool) -> str:
+    """Líneas RRULE/EXDATE del maestro, con UNTIL en el formato que exige dateutil."""
+    def until(m):
+        fecha, hora = m.group(1), m.group(2)
+        if dia_completo:
+            return f"UNTIL={fecha}"
+        return f"UNTIL={fecha}{hora or 'T235959'}{'' if hora and hora.endswith('Z') else 'Z'}"
+    return "\n".join(_UNTIL_RE.sub(until, linea) for linea in master["recurrence"])
+
+def _as_value(dt: datetime.datetime | datetime.date, zona: str | None) -> dict:
+    if isinstance(dt, datetime.datetime):
+        value = {"dateTime": dt.isoformat()}
+        if zona:
+            value["timeZone"] = zona
+        return value
+    return {"date": dt.isoformat()}
+
+def _bounds(time_min: datetime.datetime, time_max: datetime.datetime):
+    """Rango como datetimes con zona (naive = UTC, igual que gcal_client.in_window)."""
+    return (time_min if time_min.tzinfo else time_min.replace(tzinfo=UTC),
+            time_max if time_max.tzinfo else time_max.replace(tzinfo=UTC))
+
+def _overlaps(start, end, lo: datetime.datetime, hi: datetime.datetime) -> bool:
+    if not isinstance(start, datetime.datetime):
+        start = datetime.datetime.combine(start, datetime.time(), UTC)
+        end = datetime.datetime.combine(end, datetime.time(), UTC)
+    return end >= lo and start <= hi
+
+def split_series(items: Iterable[dict]) -> tuple[dict[str, dict], dict[str, dict], list[dict]]:
+    """
+    Separa una descarga con singleEvents=False en maestros (con 'recurrence'),
+    excepciones (por id de repetición) y eventos sueltos.
+    """
+    maestros, excepciones, sueltos = {}, {}, []
+    for ev in items:
+        if ev.get("recurrence"):
+            maestros[ev["id"]] = ev
+        elif ev.get("recurringEventId") and ev.get("originalStartTime"):
+            excepciones[instance_id(ev["recurringEventId"], _parse(ev["originalStartTime"]))] = ev
+        else:
+            sueltos.append(ev)
+    return maestros, excepciones, sueltos
+
+def iter_occurrences(master: dict, time_min: datetime.datetime,
+                     time_max: datetime.datetime) -> Iterator[dict]:
+    """
+    Repeticiones de un maestro que se solapan con [time_min, time_max], en
+    orden y sin calcular las de fuera del rango. Cada una lleva los campos
+    del maestro, su id de repetición, recurringEventId y originalStartTime;
+    el etag es None (el del maestro no vale para la repetición).
+    """
+    lo, hi = _bounds(time_min, time_max)
+    inicio, fin = _parse(master["start"]), _parse(master["end"])
+    duracion = fin - inicio
+    dia_completo = not isinstance(inicio, datetime.datetime)
+    if dia_completo:
+        dtstart = datetime.datetime.combine(inicio, datetime.time())
+        desde = lo.astimezone(UTC).replace(tzinfo=None) - duracion
+        hasta = hi.astimezone(UTC).replace(tzinfo=None)
+        zona = None
+    else:
+        tz = _zone(master["start"], inicio)
+        dtstart = inicio.astimezone(tz)
+        desde, hasta = lo.astimezone(tz) - duracion, hi.astimezone(tz)
+        zona = master["start"].get("timeZone")
+
+    comunes = {k: v for k, v in master.items() if k not in _SOLO_MAESTRO}
+    reglas = rrulestr(_rules(master, dia_completo), dtstart=dtstart, forceset=True)
+    for ocurrencia in reglas.xafter(desde, inc=True):
+        if ocurrencia > hasta:
+            return
+        start = ocurrencia.date() if dia_completo else ocurrencia
+        yield {
+            **comunes,
+            "id": instance_id(master["id"], start),
+            "etag": None,
+            "recurringEventId": master["id"],
+            "originalStartTime": _as_value(start, zona),
+            "start": _as_value(start, zona),
+            "end": _as_value(start + duracion, zona),
+        }
+
+def expand_events(items: Iterable[dict], time_min: datetime.datetime,
+                  time_max: datetime.datetime) -> Iterator[dict]:
+    """
+    Eventos de [time_min, time_max] como los daría singleEvents=True, a
+    partir de maestros, excepciones y sueltos: cada repetición se cambia
+    por su excepción (o se omite si está cancelada) y las excepciones
+    movidas dentro del rango desde fuera también salen. Sin orden global.
+    """
+    lo, hi = _bounds(time_min, time_max)
+    maestros, excepciones, sueltos = split_series(items)
+
+    def visible(ev):
+        return (ev.get("status") != "cancelled"
+                and _overlaps(_parse(ev["start"]), _parse(ev["end"]), lo, hi))
+
+    cancelados = {i for i, m in maestros.items() if m.get("status") == "cancelled"}
+    usadas = set()
+    for master in maestros.values():
+        if master["id"] in cancelados:
+            continue
+        for ev in iter_occurrences(master, time_min, time_max):
+            excepcion = excepciones.get(ev["id"])
+            if excepcion is not None:
+                usadas.add(ev["id"])
+                if not visible(excepcion):
+                    continue
+                ev = excepcion
+            yield ev
+    for key, ev in excepciones.items():
+        if key not in usadas and ev["recurringEventId"] not in cancelados and visible(ev):
+            yield ev
+    for ev in sueltos:
+        if visible(ev):
+            yield ev
+
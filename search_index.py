@@ -0,0 +1,122 @@
+# search_index.py
+
+import bisect
+import re
+
+import numpy as np
+import pandas as pd
+
+from code_suggester import fold
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokens(texto: str) -> set[str]:
+    """Palabras de un texto, en minúsculas y sin tildes."""
+    return set(_TOKEN_RE.findall(fold(texto or "")))
+
+class SearchIndex:
+    """
+    Índice invertido palabra -> ids sobre las columnas de texto de un DataFrame.
+
+    search() busca cada término como prefijo de alguna palabra (búsqueda
+    binaria sobre el vocabulario ordenado) y exige todos los términos: 'rev
+    pres' encuentra 'Revisión del presupuesto'. Se construye una vez con
+    fit() y update() solo reindexa las filas cuyo texto cambió.
+    """
+
+    def __init__(self, columns: list[str]):
+        self.columns = list(columns)
+        self._postings: dict[str, set] = {}
+        self._vocab: list[str] = []             # palabras ordenadas, para los prefijos
+        self._textos: dict[str, tuple] = {}     # id -> textos indexados
+        self._tokens: dict[str, set[str]] = {}  # id -> palabras indexadas
+        self._ids: list = []                    # ids del último DataFrame, en orden
+        self._pos: dict[str, list[int]] = {}    # id -> posiciones en ese DataFrame
+
+    def fit(self, df: pd.DataFrame) -> "SearchIndex":
+        self._postings.clear()
+        self._vocab.clear()
+        self._textos.clear()
+        self._tokens.clear()
+        self._ids = []
+        return self.update(df)
+
+    def update(self, df: pd.DataFrame) -> "SearchIndex":
+        """Reindexa las filas nuevas o con texto distinto y olvida las que ya no están."""
+        ids = df["id"].tolist()
+        for event_id, textos in zip(ids, zip(*(df[c].tolist() for c in self.columns))):
+            if self._textos.get(event_id) != textos:
+                self._remove(event_id)
+                self._add(event_id, textos)
+        if ids != self._ids:
+            self._ids = ids
+            self._pos = {}
+            for pos, event_id in enumerate(ids):
+                self._pos.setdefault(event_id, []).append(pos)
+            for event_id in set(self._textos).difference(self._pos):
+                self._remove(event_id)
+        return self
+
+    def _add(self, event_id, textos: tuple) -> None:
+        toks = tokens(" ".join(t for t in textos if isinstance(t, str)))
+        for tok in toks:
+            ids = self._postings.get(tok)
+            if ids is None:
+                ids = self._postings[tok] = set()
+                bisect.insort(self._vocab, tok)
+            ids.add(event_id)
+        self._textos[event_id] = textos
+        self._tokens[event_id] = toks
+
+    def _remove(self, event_id) -> None:
+        self._textos.pop(event_id, None)
+        for tok in self._tokens.pop(event_id, ()):
+            ids = self._postings[tok]
+            ids.discard(event_id)
+            if not ids:
+                del self._postings[tok]
+                del self._vocab[bisect.bisect_left(self._vocab, tok)]
+
+    def _prefix(self, termino: str) -> set:
+        """Ids con alguna palabra que empieza por termino."""
+        i = bisect.bisect_left(self._vocab, termino)
+        encontrados = set()
+        while i < len(self._vocab) and self._vocab[i].startswith(termino):
+            encontrados |= self._postings[self._vocab[i]]
+            i += 1
+        return encontrados
+
+    def search(self, query: str) -> set:
+        """Ids que contienen todos los términos de query (como prefijo de palabra)."""
+        terminos = sorted(tokens(query), key=len, reverse=True)
+        if not terminos:
+            return set(self._textos)
+        # Primero el término más largo: suele ser el más selectivo
+        resultado = self._prefix(terminos[0])
+        for termino in terminos[1:]:
+            if not resultado:
+                break
+            resultado &= self._prefix(termino)
+        return resultado
+
+    def mask(self, query: str) -> np.ndarray:
+        """Máscara booleana, alineada con el último DataFrame de update(), de las filas que cumplen query."""
+        mascara = np.zeros(len(self._ids), dtype=bool)
+        posiciones = [p for event_id in self.search(query) for p in self._pos[event_id]]
+        mascara[posiciones] = True
+        return mascara
+
+def get_search_index(session, dataset_key, df: pd.DataFrame, columns: list[str]) -> SearchIndex:
+    """
+    Devuelve el índice guardado en la sesión (p. ej. st.session_state).
+
+    Se construye una vez por dataset_key y en los reruns siguientes solo se
+    reindexan las filas cuyo texto cambió (p. ej. títulos reescritos con código).
+    """
+    index = session.get("_search_index")
+    if index is None or session.get("_search_index_key") != (dataset_key, tuple(columns)):
+        session["_search_index"] = SearchIndex(columns).fit(df)
+        session["_search_index_key"] = (dataset_key, tuple(columns))
+    else:
+        index.update(df)
+    return session["_search_index"]
@@ -0,0 +1,163 @@
+# shared_cache.py
+#
+# Caché del proceso para eventos descargados (o ya normalizados) que
+# comparten todas las sesiones: 50 usuarios que abren el mismo calendario
+# de equipo provocan una sola descarga. Las claves llevan el calendario
+# resuelto y el alcance de acceso, y cada usuario se comprueba contra sus
+# propios permisos antes de servirle nada.
+
+import json
+import os
+import threading
+from concurrent.futures import Future
+
+import pandas as pd
+from cachetools import TTLCache
+
+from gcal_client import calendar_access_role
+
+# Memoria máxima de la caché (aproximada) y vigencia de cada entrada
+MAX_BYTES = int(os.environ.get("NEO_BRAIN_CACHE_MB", "256")) * 2**20
+TTL = 300
+# Vigencia del permiso comprobado de un usuario sobre un calendario
+ACCESS_TTL = 300
+# Rol en Calendar -> alcance de los datos que ve. reader no ve el detalle de
+# los eventos privados (freeBusyReader solo ve ocupado/libre), así que no
+# comparte entradas ni carpeta del almacén con owner/writer
+SCOPES = {"owner": "full", "writer": "full", "reader": "reader", "freeBusyReader": "freeBusy"}
+
+def _sizeof(value) -> int:
+    """Bytes aproximados de una entrada: DataFrame o lista de eventos."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    return len(json.dumps(value, default=str))
+
+class _Cache(TTLCache):
+    """TTLCache (LRU dentro de la vigencia) que cuenta expulsiones y caducadas."""
+
+    def __init__(self, maxsize, ttl, getsizeof):
+        super().__init__(maxsize, ttl, getsizeof=getsizeof)
+        self.evictions = 0
+        self.expirations = 0
+
+    def popitem(self):
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+    def expire(self, time=None):
+        caducadas = super().expire(time)
+        self.expirations += len(caducadas)
+        return caducadas
+
+class SharedEventCache:
+    """
+    Caché acotada (memoria, LRU y TTL) con carga única por clave.
+
+    key() comprueba el permiso del usuario y devuelve la clave compartida;
+    get(key, loader) sirve lo cacheado o llama a loader() una sola vez
+    aunque lleguen a la vez varias sesiones con la misma clave (el resto
+    espera ese resultado). Los errores no se cachean.
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES, ttl: float = TTL,
+                 access_ttl: float = ACCESS_TTL):
+        self._lock = threading.Lock()
+        self._cache = _Cache(max_bytes, ttl, _sizeof)
+        self._access = TTLCache(maxsize=10_000, ttl=access_ttl)  # (usuario, calendario) -> clave
+        self._inflight: dict[tuple, Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0   # esperas a una carga que ya estaba en curso
+        self.denied = 0
+
+    def key(self, service, user: str, calendar_id: str, *parts) -> tuple:
+        """
+        Clave compartida (calendario, alcance, *parts) tras comprobar el rol
+        del usuario en el calendario; PermissionError si no tiene acceso.
+        """
+        with self._lock:
+            acceso = self._access.get((user, calendar_id))
+        if acceso is None:
+            scope = SCOPES.get(calendar_access_role(service, calendar_id))
+            if scope is None:
+                with self._lock:
+                    self.denied += 1
+                raise PermissionError(f"Sin acceso al calendario {calendar_id!r}")
+            # 'primary' es el calendario del propio usuario (su id es el email)
+            acceso = (user if calendar_id == "primary" else calendar_id, scope)
+            with self._lock:
+                self._access[(user, calendar_id)] = acceso
+        return (*acceso, *parts)
+
+    def lookup(self, key: tuple):
+        """Valor cacheado o None."""
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self.hits += 1
+            return value
+
+    def get(self, key: tuple, loader):
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            fut = self._inflight.get(key)
+            lider = fut is None
+            if lider:
+                fut = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.shared += 1
+        if not lider:
+            return fut.result()
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            fut.set_exception(e)
+            raise
+        with self._lock:
+            try:
+                self._cache[key] = value
+            except ValueError:
+                pass  # más grande que toda la caché: se sirve sin guardar
+            del self._inflight[key]
+        fut.set_result(value)
+        return value
+
+    def discard(self, key: tuple) -> None:
+        """Olvida una entrada (p. ej. de una versión que ya no vale)."""
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def invalidate(self, user: str, calendar_id: str | None = None) -> None:
+        """Olvida las entradas de los calendarios que el usuario ya consultó (o de uno)."""
+        with self._lock:
+            calendarios = {
+                acceso[0] for (u, cal), acceso in self._access.items()
+                if u == user and (calendar_id is None or cal == calendar_id)
+            }
+            for key in [k for k in self._cache.keys() if k[0] in calendarios]:
+                del self._cache[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._cache.expire()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "denied": self.denied,
+                "evictions": self._cache.evictions,
+                "expirations": self._cache.expirations,
+                "entries": len(self._cache),
+                "bytes": self._cache.currsize,
+                "max_bytes": self._cache.maxsize,
+            }
+
+# Caché del proceso, compartida por todas las sesiones
+shared_cache = SharedEventCache()
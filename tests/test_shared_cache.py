@@ -0,0 +1,32 @@
+# Claves de shared_cache según el rol de cada usuario en el calendario
+
+import datetime
+
+import pytest
+
+import shared_cache
+from event_store import store_key
+from shared_cache import SharedEventCache
+
+RANGO = (datetime.datetime(2025, 1, 1), datetime.datetime(2025, 12, 31))
+ROLES = {"dueno": "owner", "editor": "writer", "lector": "reader", "agenda": "freeBusyReader"}
+
+@pytest.fixture
+def cache(monkeypatch):
+    # El "servicio" de cada usuario es su nombre; el rol sale de ROLES
+    monkeypatch.setattr(shared_cache, "calendar_access_role", lambda service, cal_id: ROLES.get(service, "none"))
+    return SharedEventCache()
+
+def test_reader_y_owner_no_comparten_clave(cache):
+    dueno = cache.key("dueno", "dueno", "equipo@neo.com.pe")
+    lector = cache.key("lector", "lector", "equipo@neo.com.pe")
+    assert dueno != lector
+    # ni carpeta del almacén para el mismo rango
+    assert store_key(dueno, *RANGO) != store_key(lector, *RANGO)
+
+def test_owner_y_writer_comparten_clave(cache):
+    assert cache.key("dueno", "dueno", "equipo") == cache.key("editor", "editor", "equipo")
+
+def test_sin_acceso(cache):
+    with pytest.raises(PermissionError):
+        cache.key("otro", "otro", "equipo")
@@ -0,0 +1,287 @@
+# watch_channels.py
+#
+# Avisos push de Google Calendar: por cada (usuario, calendario) abierto en
+# una página se crea un canal de events().watch. Un receptor HTTP pequeño
+# recibe los avisos, invalida la caché compartida de ese calendario y lanza
+# la sincronización incremental del almacén, así los cambios llegan sin
+# pulsar "Recargar". Los canales se renuevan antes de caducar.
+#
+# Calendar solo avisa a direcciones https públicas: NEO_BRAIN_WEBHOOK_URL es
+# esa dirección (p. ej. un proxy hacia el puerto local del receptor). Sin
+# ella no se abre ningún canal y todo sigue como antes.
+
+import datetime
+import functools
+import hmac
+import os
+import secrets
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from googleapiclient.errors import HttpError
+from httpx_oauth.oauth2 import OAuth2Token
+
+from event_store import EventStore, event_store, store_key
+from gcal_client import get_service, stop_channel, watch_events
+from rate_limiter import is_retryable
+from shared_cache import SharedEventCache, shared_cache
+
+WEBHOOK_URL = os.environ.get("NEO_BRAIN_WEBHOOK_URL")
+WEBHOOK_HOST = os.environ.get("NEO_BRAIN_WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.environ.get("NEO_BRAIN_WEBHOOK_PORT", "8765"))
+# Vida pedida para cada canal (Calendar admite hasta ~7 días) y margen de renovación
+CHANNEL_TTL = 7 * 24 * 3600
+RENEW_MARGIN = 3600
+# Cada cuánto se buscan canales por renovar
+RENEW_CHECK = 300
+
+class _Receiver(BaseHTTPRequestHandler):
+    manager: "WatchManager"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        largo = int(self.headers.get("Content-Length") or 0)
+        if largo:
+            self.rfile.read(largo)
+        status = self.manager.handle(dict(self.headers.items()))
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+def _session_service(token: OAuth2Token, session: dict):
+    """Servicio httpx con el access token vigente (get_service lo rehace si cambió)."""
+    return get_service(token, session, backend="httpx")
+
+class WatchManager:
+    """
+    Canales de watch por (usuario, calendario) y su receptor.
+
+    watch() abre el canal la primera vez y guarda el token OAuth de la
+    sesión (el mismo dict que auth_session renueva en su sitio): el servicio
+    para sincronizar y renovar se construye al usarlo, con el access token
+    de ese momento. handle() procesa un aviso: comprueba canal, recurso y
+    token secreto, marca como obsoleta la caché compartida del calendario y
+    lanza store.refresh_async. Un canal cuya renovación falla, o cuyo token
+    ya no vale, se da de baja.
+    """
+
+    def __init__(self, address: str | None = WEBHOOK_URL,
+                 host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                 ttl: int = CHANNEL_TTL, renew_margin: int = RENEW_MARGIN,
+                 store: EventStore = event_store, cache: SharedEventCache = shared_cache,
+                 service_factory=_session_service):
+        self.address = address
+        self.host = host
+        self.port = port
+        self.ttl = ttl
+        self.renew_margin = renew_margin
+        self.store = store
+        self.cache = cache
+        self.service_factory = service_factory  # (token, sesión del canal) -> servicio
+        self._lock = threading.RLock()
+        self._channels: dict[str, dict] = {}   # id del canal -> canal
+        self._by_key: dict[tuple, str] = {}     # (usuario, calendario) -> id del canal
+        self._server: ThreadingHTTPServer | None = None
+        self._stopping = threading.Event()
+        self.errors: dict[tuple, Exception] = {}
+        self.notifications = 0
+        self.rejected = 0
+
+    # ——————————————
+    # Canales
+    # ——————————————
+
+    def watch(self, token: OAuth2Token, user: str, calendar_id: str,
+              time_min: datetime.datetime, time_max: datetime.datetime,
+              store_user: str | None = None) -> dict | None:
+        """
+        Canal vigente de (usuario, calendario); None sin webhook o si Calendar
+        lo rechaza. store_user es la carpeta del almacén que sincroniza cada
+        aviso (por defecto store_key(user, time_min, time_max)); si varias
+        páginas con rangos distintos miran el mismo calendario, se
+        sincronizan todas.
+        """
+        if not self.address:
+            return None
+        self.start()
+        stores = {store_user or store_key(user, time_min, time_max): (time_min, time_max)}
+        with self._lock:
+            canal = self._channels.get(self._by_key.get((user, calendar_id)))
+            if canal is not None:
+                canal["oauth_token"] = token
+                canal["stores"].update(stores)
+                if canal["expiration"] - time.time() > self.renew_margin:
+                    return canal
+                stores = canal["stores"]
+        return self._open(token, user, calendar_id, stores, anterior=canal)
+
+    def _service(self, canal: dict):
+        return self.service_factory(canal["oauth_token"], canal["session"])
+
+    def _open(self, oauth_token: OAuth2Token, user: str, calendar_id: str, stores: dict,
+              anterior: dict | None = None) -> dict | None:
+        key = (user, calendar_id)
+        canal_id, token = str(uuid.uuid4()), secrets.token_urlsafe(24)
+        # Servicio guardado entre usos (como st.session_state en las páginas)
+        sesion = anterior["session"] if anterior is not None else {"user_email": user}
+        try:
+            service = self.service_factory(oauth_token, sesion)
+            resp = watch_events(service, calendar_id, self.address, canal_id, token, self.ttl)
+        except Exception as e:
+            with self._lock:
+                self.errors[key] = e
+            return None
+        canal = {
+            "id": canal_id,
+            "resource_id": resp["resourceId"],
+            "token": token,
+            "expiration": int(resp.get("expiration") or 0) / 1000 or time.time() + self.ttl,
+            "user": user,
+            "calendar_id": calendar_id,
+            "stores": stores,
+            "oauth_token": oauth_token,
+            "session": sesion,
+        }
+        with self._lock:
+            self.errors.pop(key, None)
+            self._channels[canal_id] = canal
+            self._by_key[key] = canal_id
+            if anterior is not None:
+                self._channels.pop(anterior["id"], None)
+        if anterior is not None:
+            self._close(anterior)
+        return canal
+
+    def _close(self, canal: dict) -> None:
+        try:
+            stop_channel(self._service(canal), canal["id"], canal["resource_id"])
+        except Exception:
+            pass  # si ya caducó, Calendar deja de avisar igualmente
+
+    def _drop(self, canal: dict) -> None:
+        """Da de baja el canal: deja de contar como activo y se cierra si aún se puede."""
+        key = (canal["user"], canal["calendar_id"])
+        with self._lock:
+            if self._channels.pop(canal["id"], None) is None:
+                return
+            if self._by_key.get(key) == canal["id"]:
+                del self._by_key[key]
+        self._close(canal)
+
+    def renew_due(self) -> int:
+        """
+        Renueva los canales que caducan dentro del margen; devuelve cuántos.
+        Los que no se pueden renovar (p. ej. token revocado) se dan de baja.
+        """
+        limite = time.time() + self.renew_margin
+        with self._lock:
+            vencen = [c for c in self._channels.values() if c["expiration"] <= limite]
+        renovados = 0
+        for canal in vencen:
+            nuevo = self._open(canal["oauth_token"], canal["user"], canal["calendar_id"],
+                               canal["stores"], anterior=canal)
+            if nuevo is None:
+                self._drop(canal)
+            renovados += nuevo is not None
+        return renovados
+
+    def active(self, user: str, calendar_id: str) -> bool:
+        with self._lock:
+            return (user, calendar_id) in self._by_key
+
+    # ——————————————
+    # Avisos
+    # ——————————————
+
+    def handle(self, headers: dict) -> int:
+        """Procesa un aviso de Calendar (cabeceras X-Goog-*); devuelve el código HTTP."""
+        h = {k.lower(): v for k, v in headers.items()}
+        if h.get("x-goog-resource-state") == "sync":
+            # Aviso inicial al abrir el canal: puede llegar antes que la
+            # respuesta de watch() y no pide hacer nada
+            return 200
+        with self._lock:
+            canal = self._channels.get(h.get("x-goog-channel-id", ""))
+        if (canal is None
+                or h.get("x-goog-resource-id") != canal["resource_id"]
+                or not hmac.compare_digest(h.get("x-goog-channel-token", ""), canal["token"])):
+            with self._lock:
+                self.rejected += 1
+            return 404
+        with self._lock:
+            self.notifications += 1
+        user, calendar_id = canal["user"], canal["calendar_id"]
+        self.cache.invalidate(user, calendar_id)
+        self._refresh(canal)
+        return 200
+
+    def _refresh(self, canal: dict) -> None:
+        """
+        Sincronización incremental de cada carpeta del canal; si ya había una
+        en curso, se repite al acabar.
+        """
+        with self._lock:
+            stores = list(canal["stores"].items())
+        service = self._service(canal)
+        for store_user, window in stores:
+            args = (service, store_user, canal["calendar_id"], *window)
+            en_curso = self.store.refreshing(store_user, canal["calendar_id"])
+            fut = self.store.refresh_async(*args, force=True)
+            if fut is None:
+                continue
+            fut.add_done_callback(functools.partial(self._check_auth, canal))
+            if en_curso:
+                fut.add_done_callback(functools.partial(self._again, args))
+
+    def _again(self, args: tuple, _fut) -> None:
+        self.store.refresh_async(*args, force=True)
+
+    def _check_auth(self, canal: dict, fut) -> None:
+        """Si Calendar rechaza el token del canal (401/403 que no es de cuota), se da de baja."""
+        error = None if fut.cancelled() else fut.exception()
+        if (isinstance(error, HttpError) and error.resp.status in (401, 403)
+                and not is_retryable(error)):
+            self._drop(canal)
+
+    # ——————————————
+    # Receptor y renovación en segundo plano
+    # ——————————————
+
+    def start(self) -> None:
+        """Arranca (una vez) el receptor HTTP y el hilo de renovación."""
+        with self._lock:
+            if self._server is not None:
+                return
+            handler = type("Receiver", (_Receiver,), {"manager": self})
+            self._server = ThreadingHTTPServer((self.host, self.port), handler)
+            self._server.daemon_threads = True
+            self.port = self._server.server_address[1]
+            self._stopping.clear()
+        threading.Thread(target=self._server.serve_forever, daemon=True,
+                         name="watch-receiver").start()
+        threading.Thread(target=self._renew_loop, daemon=True, name="watch-renew").start()
+
+    def _renew_loop(self) -> None:
+        while not self._stopping.wait(RENEW_CHECK):
+            self.renew_due()
+
+    def stop(self) -> None:
+        """Cierra los canales abiertos y el receptor."""
+        with self._lock:
+            canales = list(self._channels.values())
+            self._channels.clear()
+            self._by_key.clear()
+            server, self._server = self._server, None
+        self._stopping.set()
+        for canal in canales:
+            self._close(canal)
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+# Canales del proceso, compartidos por todas las sesiones
+watch_manager = WatchManager()
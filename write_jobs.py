@@ -0,0 +1,199 @@
+# write_jobs.py
+#
+# Escrituras masivas en Calendar fuera del rerun de Streamlit: la página
+# encola un trabajo, recibe su id y muestra el progreso; los reruns (y
+# cualquier interacción con widgets) no interrumpen ni repiten las
+# escrituras, que siguen en un pool de hilos del proceso.
+
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gcal_client import BATCH_LIMIT, batch_write_events
+from rate_limiter import is_retryable
+
+# Trabajos que escriben a la vez (cada uno respeta además el ritmo de su usuario)
+MAX_WORKERS = 4
+# Segundos que se conservan los trabajos terminados
+JOB_TTL = 3600
+
+PENDIENTE, EN_CURSO, CANCELADO, TERMINADO = "pendiente", "en curso", "cancelado", "terminado"
+
+def job_id_for(user: str, calendar_id: str, writes: list[dict]) -> str:
+    """Id determinista: las mismas escrituras (con sus etags) dan el mismo trabajo."""
+    huella = json.dumps([user, calendar_id, writes], sort_keys=True, default=str)
+    return hashlib.sha1(huella.encode("utf-8")).hexdigest()[:16]
+
+class WriteJob:
+    """
+    Un lote de escrituras (las de write_planner.plan_writes) y su estado.
+
+    results guarda por escritura None (pendiente) o el resultado de
+    batch_write_events; una escritura con éxito no se vuelve a enviar.
+    """
+
+    def __init__(self, job_id: str, user: str, calendar_id: str,
+                 writes: list[dict], on_done=None):
+        self.id = job_id
+        self.user = user
+        self.calendar_id = calendar_id
+        self.writes = writes
+        self.results: list[dict | None] = [None] * len(writes)
+        self.status = PENDIENTE
+        self.error: Exception | None = None   # fallo de un lote entero (red, token...)
+        self.on_done = on_done
+        self.created = time.time()
+        self.finished: float | None = None
+        self._cancel = threading.Event()
+
+    @property
+    def total(self) -> int:
+        return len(self.writes)
+
+    @property
+    def done(self) -> int:
+        return sum(r is not None for r in self.results)
+
+    @property
+    def ok(self) -> int:
+        return sum(bool(r and r["ok"]) for r in self.results)
+
+    @property
+    def failed(self) -> int:
+        return sum(bool(r and not r["ok"]) for r in self.results)
+
+    @property
+    def active(self) -> bool:
+        return self.status in (PENDIENTE, EN_CURSO)
+
+    def pending(self) -> list[int]:
+        return [i for i, r in enumerate(self.results) if r is None]
+
+    def retryable(self) -> list[int]:
+        """Pendientes y las que fallaron por un error transitorio (cuota, 5xx agotado)."""
+        return [i for i, r in enumerate(self.results)
+                if r is None or (not r["ok"] and is_retryable(r["error"]))]
+
+    def event_results(self) -> list[dict]:
+        """Un resultado por evento: id, estado y error."""
+        return [
+            {
+                "event_id": w["event_id"],
+                "estado": "pendiente" if r is None else ("ok" if r["ok"] else "error"),
+                "error": None if r is None or r["ok"] else r["error"],
+            }
+            for w, r in zip(self.writes, self.results)
+        ]
+
+class JobRunner:
+    """
+    Cola de trabajos de escritura con un pool de hilos propio del proceso.
+
+    submit() devuelve el id del trabajo; si ya existe uno con las mismas
+    escrituras (p. ej. un rerun que vuelve a pulsar "Confirmar") en curso
+    o escrito entero, devuelve ese mismo sin enviar nada; si terminó con
+    fallos, reenvía las que no se escribieron. cancel() para entre lotes y
+    resume() reenvía las pendientes y las que fallaron por un error
+    transitorio.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, batch_size: int = BATCH_LIMIT,
+                 ttl: float = JOB_TTL):
+        self.batch_size = batch_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._jobs: dict[str, WriteJob] = {}
+        self._services: dict[str, object] = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="write-job")
+
+    def submit(self, service, user: str, calendar_id: str, writes: list[dict],
+               on_done=None) -> str:
+        job_id = job_id_for(user, calendar_id, writes)
+        with self._lock:
+            self._purge()
+            job = self._jobs.get(job_id)
+            if job is not None:
+                if job.active or job.ok == job.total:
+                    return job_id
+                # Confirmar otra vez un trabajo con fallos: se reenvía lo no escrito
+                self._restart(job, [i for i, r in enumerate(job.results) if not (r and r["ok"])],
+                              service)
+                job.on_done = on_done
+            else:
+                job = self._jobs[job_id] = WriteJob(job_id, user, calendar_id, writes, on_done)
+                self._services[job_id] = service
+        self._pool.submit(self._run, job)
+        return job_id
+
+    def get(self, job_id: str | None) -> WriteJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self, user: str) -> list[WriteJob]:
+        with self._lock:
+            return sorted((j for j in self._jobs.values() if j.user == user),
+                          key=lambda j: j.created)
+
+    def cancel(self, job_id: str) -> None:
+        job = self.get(job_id)
+        if job is not None and job.active:
+            job._cancel.set()
+
+    def resume(self, job_id: str, service=None) -> bool:
+        """
+        Reenvía lo pendiente de un trabajo cancelado o cortado por un error y
+        las escrituras que fallaron por un error transitorio.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.active or not job.retryable():
+                return False
+            self._restart(job, job.retryable(), service)
+        self._pool.submit(self._run, job)
+        return True
+
+    def _restart(self, job: WriteJob, indices: list[int], service=None) -> None:
+        """Deja pendientes las escrituras indices para volver a lanzar el trabajo (con el lock)."""
+        for i in indices:
+            job.results[i] = None
+        job._cancel.clear()
+        job.status, job.error, job.finished = PENDIENTE, None, None
+        if service is not None:
+            self._services[job.id] = service   # p. ej. con el token renovado
+
+    def _purge(self) -> None:
+        limite = time.time() - self.ttl
+        for job_id in [i for i, j in self._jobs.items() if j.finished and j.finished < limite]:
+            del self._jobs[job_id]
+            self._services.pop(job_id, None)
+
+    def _run(self, job: WriteJob) -> None:
+        job.status = EN_CURSO
+        pendientes = job.pending()
+        try:
+            for start in range(0, len(pendientes), self.batch_size):
+                if job._cancel.is_set():
+                    job.status = CANCELADO
+                    return
+                lote = pendientes[start:start + self.batch_size]
+                resultados = batch_write_events(
+                    self._services[job.id], [job.writes[i] for i in lote],
+                    calendar_id=job.calendar_id, batch_size=self.batch_size,
+                )
+                for i, res in zip(lote, resultados):
+                    job.results[i] = res
+            # Sigue "en curso" hasta que on_done (p. ej. traer los cambios) termina
+            if job.on_done is not None:
+                job.on_done(job)
+            job.status = TERMINADO
+        except Exception as e:
+            # Lo que no llegó a escribirse queda pendiente para resume()
+            job.error = e
+            job.status = CANCELADO if job.pending() else TERMINADO
+        finally:
+            job.finished = time.time()
+
+# Trabajos del proceso, compartidos por todas las sesiones (cada uno lleva su usuario)
+job_runner = JobRunner()
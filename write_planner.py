@@ -0,0 +1,108 @@
+# write_planner.py
+
+import pandas as pd
+
+from event_normalizer import split_codes
+
+# Columna del DataFrame normalizado -> campo del evento en Calendar
+FIELD_MAP = {
+    "titulo_raw":  "summary",
+    "detalles":    "description",
+}
+
+def titulo_con_codigo(codigo: str, descripcion: str) -> str:
+    """Título con el formato que usa Autocalendar: '<código> – <descripción>'."""
+    return f"{codigo} – {descripcion}" if codigo else descripcion
+
+def originals_from_frame(df: pd.DataFrame, field_map: dict[str, str] = FIELD_MAP) -> dict[str, dict]:
+    """
+    Eventos 'originales' para plan_writes a partir del DataFrame normalizado
+    (p. ej. el de event_store): id -> {etag y campos de field_map}.
+    """
+    columnas = [c for c in field_map if c in df.columns]
+    return {
+        fila["id"]: {"etag": fila["etag"], **{field_map[c]: fila[c] for c in columnas}}
+        for fila in df[["id", "etag", *columnas]].to_dict("records")
+    }
+
+def plan_writes(originales: dict[str, dict],
+                editado: pd.DataFrame,
+                field_map: dict[str, str] = FIELD_MAP) -> list[dict]:
+    """
+    Compara el DataFrame editado con los eventos tal como se descargaron y
+    devuelve las escrituras mínimas para batch_write_events.
+
+    Cada escritura es un events().patch con solo los campos que cambiaron y
+    el etag del evento descargado (se envía como If-Match, así no hace falta
+    leer antes de escribir y no se pisan cambios hechos en Calendar). Un
+    valor None/NaN cuenta como no editado. Las filas sin cambios se omiten
+    y si un id aparece varias veces gana la última edición. Si editado trae
+    'calendar_id', cada escritura lo lleva.
+    """
+    columnas = [c for c in field_map if c in editado.columns]
+    if editado.empty or not columnas:
+        return []
+    editado = editado.drop_duplicates("id", keep="last")
+
+    writes = []
+    for fila in editado.to_dict("records"):
+        original = originales.get(fila["id"])
+        if original is None:
+            continue
+        body = {}
+        for col in columnas:
+            nuevo = fila[col]
+            if not isinstance(nuevo, str):
+                continue  # None/NaN: columna sin editar en esta fila
+            campo = field_map[col]
+            if nuevo != (original.get(campo) or ""):
+                body[campo] = nuevo
+        if not body:
+            continue
+        write = {
+            "event_id": fila["id"],
+            "method":   "patch",
+            "body":     body,
+            "etag":     original.get("etag"),
+        }
+        if fila.get("calendar_id"):
+            write["calendar_id"] = fila["calendar_id"]
+        writes.append(write)
+    return writes
+
+def series_writes(masters: dict[str, dict], filas: pd.DataFrame, codigos) -> list[dict]:
+    """
+    Una escritura por serie en vez de una por repetición: patch del maestro
+    (el id de la columna 'serie') con '<código> – <descripción>'. Con el
+    maestro descargado (modo series, ver event_store.masters) se parte de su
+    título y se manda su etag; si no, del de la primera repetición marcada
+    y sin If-Match. Las repeticiones editadas aparte (excepciones) conservan
+    su propio título. codigos va alineado con filas; la última gana.
+    """
+    por_serie = {}
+    for serie, codigo, titulo, calendario in zip(
+        filas["serie"], codigos, filas["titulo_raw"],
+        filas["calendar_id"] if "calendar_id" in filas.columns else [None] * len(filas),
+    ):
+        if isinstance(serie, str) and serie:
+            titulo = por_serie.get(serie, (None, titulo))[1]
+            por_serie[serie] = (codigo, titulo, calendario)
+
+    writes = []
+    for serie, (codigo, titulo, calendario) in por_serie.items():
+        maestro = masters.get(serie, {})
+        actual = maestro.get("summary", titulo) or ""
+        descripcion = split_codes(pd.Series([actual.strip()], dtype=object))[1].iloc[0]
+        nuevo = titulo_con_codigo(codigo, descripcion)
+        if nuevo == actual:
+            continue
+        write = {
+            "event_id": serie,
+            "method":   "patch",
+            "body":     {"summary": nuevo},
+            "etag":     maestro.get("etag"),
+        }
+        if isinstance(calendario, str) and calendario:
+            write["calendar_id"] = calendario
+        writes.append(write)
+    return writes